@@ -24,13 +24,10 @@ def buy_premium_pass(request):
     # Define the cost of the premium pass
     PREMIUM_COST = 1000
 
-    if request.user.userprofile.currency_balance < PREMIUM_COST:
+    # Deduct cost and activate premium
+    if not request.user.userprofile.deduct_currency(PREMIUM_COST, "Purchased premium Battle Pass"):
         messages.error(request, "You don't have enough currency to buy the premium pass.")
         return redirect('battlepass')
-
-    # Deduct cost and activate premium
-    request.user.userprofile.currency_balance -= PREMIUM_COST
-    request.user.userprofile.save()
     user_battle_pass.has_premium = True
     user_battle_pass.save()
 
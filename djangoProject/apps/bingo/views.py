@@ -21,7 +21,7 @@ def bingo_view(request):
             # If the user doesnt have a board, generate a new one and save it to their profile
             board = newUser()
             user_profile.bingo_board = board
-            user_profile.save()
+            user_profile.save(update_fields=['bingo_board'])
     except:
         print("User is not logged in!")
         return redirect('http://127.0.0.1:8000/users/login/?next=/bingo/')
@@ -35,7 +35,7 @@ def bingo_view(request):
             # Generate New Board
             board = newUser()
             user_profile.bingo_board = board
-            user_profile.save()
+            user_profile.save(update_fields=['bingo_board'])
     return render(request, 'bingo/bingo.html', {'board': board, 'bingo': bingo})
 
 # Returns generated board variable with random integer values
@@ -104,7 +104,7 @@ def markSquare(challengeID, user_profile):
 
                 # Save it
                 user_profile.bingo_board = board
-                user_profile.save()
+                user_profile.save(update_fields=['bingo_board'])
                 return
     
     print(f"Challenge '{challengeID}' not found on the board.")  # Debugging message
@@ -3,10 +3,17 @@ from decimal import Decimal
 from django.db import models
 from django.contrib.auth.models import User
 import random
-from apps.users.models import UserProfile
+from apps.users.counters import increment
 
 from decimal import Decimal
 
+
+def count_casino_game(user_id, bet_amount, won):
+    """Adds a finished game to the player's casino stats, written with the request's other counters."""
+    increment(user_id, total_casino_games_played=1, total_casino_wagered=bet_amount,
+              **({"total_casino_wins": 1} if won else {}))
+
+
 class DiceGame(models.Model):
     BET_TYPES = [
         ('exact', 'Exact Number'),
@@ -33,12 +40,7 @@ class DiceGame(models.Model):
             self.win = (self.roll_result > 3) if self.prediction == 1 else (self.roll_result <= 3)
         self.save()
         # Update user stats
-        profile = UserProfile.objects.get(user=self.user)
-        profile.total_casino_games_played += 1
-        profile.total_casino_wagered += self.bet_amount
-        if self.win:
-            profile.total_casino_wins += 1
-        profile.save()
+        count_casino_game(self.user_id, self.bet_amount, self.win)
 
 class GreenFund(models.Model):
     total_donated = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
@@ -127,12 +129,7 @@ class RouletteGame(models.Model):
                     self.win = 19 <= int(self.result) <= 36
         self.save()
         # Update user stats
-        profile = UserProfile.objects.get(user=self.user)
-        profile.total_casino_games_played += 1
-        profile.total_casino_wagered += self.bet_amount
-        if self.win:
-            profile.total_casino_wins += 1
-        profile.save()
+        count_casino_game(self.user_id, self.bet_amount, self.win)
 
 
 class BlackjackGame(models.Model):
@@ -222,9 +219,4 @@ class BlackjackGame(models.Model):
             self.result = 'lose'
         self.save()
         # Update user stats
-        profile = UserProfile.objects.get(user=self.user)
-        profile.total_casino_games_played += 1
-        profile.total_casino_wagered += self.bet_amount
-        if self.result == "win":
-            profile.total_casino_wins += 1
-        profile.save()
\ No newline at end of file
+        count_casino_game(self.user_id, self.bet_amount, self.result == "win")
\ No newline at end of file
@@ -1,8 +1,11 @@
 from django.utils import timezone
 from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from decimal import Decimal
 
+from apps.users.models import UserProfile
+
 class City(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='city')
     name = models.CharField(max_length=100, default="My Eco City")
@@ -68,6 +71,23 @@ class CityBuilding(models.Model):
 
     def __str__(self):
         return f"{self.template.name} (Level {self.upgrade_level}) at ({self.x}, {self.y}) in {self.city}"
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        if is_new:
+            self._count_building(1)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._count_building(-1)
+        return result
+
+    def _count_building(self, delta):
+        profiles = UserProfile.objects.filter(user__city=self.city_id)
+        if delta < 0:
+            profiles = profiles.filter(total_buildings__gte=-delta)
+        profiles.update(total_buildings=F('total_buildings') + delta)
     
     @property
     def effective_sustainability_bonus(self):
@@ -1,6 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
-from apps.users.models import UserProfile
+from apps.users.counters import increment
 
 class ClimateDuel(models.Model):
     """Stores an ongoing climate duel between two players."""
@@ -49,13 +51,10 @@ class DuelTurn(models.Model):
         super().save(*args, **kwargs)
 
         # Update player stats
-        profile = UserProfile.objects.get(user=self.player)
-        profile.climate_duels_played += 1
-
         # Win/loss tracking could be implemented with a finalization check later.
-        profile.climate_duel_eco_score += max(0, self.duel.player_one_co2 if self.player == self.duel.player_one else self.duel.player_two_co2)
-
-        profile.save()
+        # The player's CO₂ as this turn left it, without reloading the duel
+        increment(self.player_id, climate_duels_played=1,
+                  climate_duel_eco_score=Decimal(str(max(0, self.co2_after_turn))))
 
 class PowerUp(models.Model):
     """Power-ups that players can use to gain advantages in a duel."""
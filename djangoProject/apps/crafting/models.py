@@ -2,7 +2,9 @@ from django.db import models
 from apps.crates.models import Item
 from django.contrib.auth.models import User
 from decimal import Decimal
-from apps.users.models import UserProfile
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from apps.users.counters import increment, recompute
 
 class Recipe(models.Model):
     name = models.CharField(max_length=100)
@@ -35,22 +37,13 @@ class CraftingLog(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
-        # Update user profile stats
-        profile = UserProfile.objects.get(user=self.user)
-        profile.total_items_crafted += 1
-        if self.rare:
-            profile.rare_items_crafted += 1
-
-        # Optionally update most crafted item
-        from django.db.models import Count
-        most_common = (
-            CraftingLog.objects.filter(user=self.user)
+        # Update user profile stats, merged with the rest of the request's and written at commit
+        increment(self.user_id, total_items_crafted=1, **({"rare_items_crafted": 1} if self.rare else {}))
+        # Worked out once, in the UPDATE that writes the counters
+        recompute(self.user_id, most_crafted_item=Coalesce(Subquery(
+            CraftingLog.objects.filter(user=OuterRef("user"))
             .values("recipe__name")
             .annotate(total=Count("id"))
             .order_by("-total")
-            .first()
-        )
-        if most_common:
-            profile.most_crafted_item = most_common["recipe__name"]
-
-        profile.save()
\ No newline at end of file
+            .values("recipe__name")[:1]
+        ), Value("")))
\ No newline at end of file
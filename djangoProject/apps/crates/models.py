@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from decimal import Decimal
 from apps.crates.crate_definitions import CRATE_TYPES
-from apps.users.models import UserProfile
+from apps.users.counters import increment, raise_to
 
 
 class Crate(models.Model):
@@ -136,19 +136,9 @@ class CrateOpeningHistory(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
-        # Update user profile stats
-        profile = UserProfile.objects.get(user=self.user)
-        profile.total_crates_opened += 1
-
-        # Optional: update rarest item received if current is rarer
-        try:
-            current_rarity = int(self.reward_rarity)
-            if not hasattr(profile, 'rarest_item_received') or current_rarity > getattr(profile, 'rarest_item_received', 0):
-                profile.rarest_item_received = current_rarity
-        except Exception:
-            pass
-
-        profile.save()
+        # Update user profile stats, merged with the rest of the request's and written at commit
+        increment(self.user_id, total_crates_opened=1)
+        raise_to(self.user_id, rarest_item_received=max(int(self.reward_rarity), 0))
 
     def __str__(self):
         return f"{self.user.username} opened {self.crate_type} and received {self.reward_item} ({self.reward_rarity})"
\ No newline at end of file
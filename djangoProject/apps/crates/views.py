@@ -69,13 +69,11 @@ def bulk_buy_crates(request, crate_type):
 
         # Check the currency and deduct accordingly
         if crate_def.currency == "main":
-            if user_profile.currency_balance < total_price:
+            if not user_profile.deduct_currency(total_price, f"Bulk purchase of {quantity} {crate_def.name} crate(s)"):
                 return JsonResponse({"error": "Insufficient main currency"}, status=400)
-            user_profile.deduct_currency(total_price, f"Bulk purchase of {quantity} {crate_def.name} crate(s)")
         else:
-            if user_profile.farm_currency < total_price:
+            if not user_profile.deduct_farm_currency(total_price, f"Bulk purchase of {quantity} {crate_def.name} crate(s)"):
                 return JsonResponse({"error": "Insufficient farm currency"}, status=400)
-            user_profile.deduct_farm_currency(total_price, f"Bulk purchase of {quantity} {crate_def.name} crate(s)")
 
         with transaction.atomic():
             # Create or update the user's crate for this type
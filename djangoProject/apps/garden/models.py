@@ -4,7 +4,7 @@ from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
 from apps.crates.models import Item  # Assuming seeds are stored as Items of a specific type
-from apps.users.models import UserProfile
+from apps.users.counters import increment
 
 class GardenPlot(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="garden_plots")
@@ -40,14 +40,10 @@ class GardenPlant(models.Model):
         is_new = self._state.adding
         super().save(*args, **kwargs)
 
-        profile = UserProfile.objects.get(user=self.user)
-
         if is_new:
-            profile.total_garden_plants += 1
+            increment(self.user_id, total_garden_plants=1)
         if self.is_harvested:
-            profile.harvested_plants += 1
-
-        profile.save()
+            increment(self.user_id, harvested_plants=1)
 
 @property
 def progress_percentage(self):
@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.core.cache import caches
+from django.utils import timezone
+
+from apps.market.backtest import data_version, load_price_matrix
+from apps.market.downsampling import lttb
+from apps.market.models import Company
+from apps.market.price_cache import PRICE_CACHE_ALIAS
+
+# History analysed at each candle interval
+ANALYTICS_SPANS = {
+    '1m': timedelta(days=1),
+    '1h': timedelta(days=30),
+    '1d': timedelta(days=365),
+}
+DEFAULT_INTERVAL = '1h'
+# Window lengths in steps of the chosen interval
+SHORT_WINDOW = 12
+LONG_WINDOW = 48
+VOLATILITY_WINDOW = 24
+# Most correlated other companies listed per company
+TOP_CORRELATED = 5
+# Entries are keyed by data version, so this only bounds how long stale ones linger
+ANALYTICS_CACHE_TIMEOUT = 3600
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` steps along each row; NaN until a full window is available."""
+    values = np.atleast_2d(values)
+    out = np.full(values.shape, np.nan)
+    if window <= values.shape[1]:
+        sums = np.concatenate([np.zeros((values.shape[0], 1)), np.cumsum(values, axis=1)], axis=1)
+        out[:, window - 1:] = (sums[:, window:] - sums[:, :-window]) / window
+    return out
+
+
+def rolling_std(values, window):
+    """Trailing standard deviation over `window` steps along each row."""
+    mean = rolling_mean(values, window)
+    return np.sqrt(np.maximum(rolling_mean(np.square(values), window) - np.square(mean), 0.0))
+
+
+def log_returns(prices):
+    return np.diff(np.log(prices), axis=1)
+
+
+def indicators(prices):
+    """
+    Rolling statistics for every row of a companies x time price matrix, each
+    aligned with the prices: short and long moving averages, volatility (the
+    standard deviation of log returns) and drawdown from the running peak.
+    """
+    volatility = np.full(prices.shape, np.nan)
+    volatility[:, 1:] = rolling_std(log_returns(prices), VOLATILITY_WINDOW)
+    return {
+        'sma_short': rolling_mean(prices, SHORT_WINDOW),
+        'sma_long': rolling_mean(prices, LONG_WINDOW),
+        'volatility': volatility,
+        'drawdown': 1.0 - prices / np.maximum.accumulate(prices, axis=1),
+    }
+
+
+def correlation_matrix(returns):
+    """Pearson correlation between the rows of `returns`; NaN for rows that never move."""
+    n = returns.shape[0]
+    if returns.shape[1] < 2:
+        return np.full((n, n), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.atleast_2d(np.corrcoef(returns))
+
+
+def sector_returns(sectors, returns):
+    """Equal-weighted mean return of each sector's companies. Returns (sector names, sectors x time)."""
+    names = np.unique(sectors)
+    membership = (sectors[None, :] == names[:, None]).astype(float)
+    membership /= membership.sum(axis=1, keepdims=True)
+    return names, membership @ returns
+
+
+def _num(value):
+    return None if np.isnan(value) else round(float(value), 6)
+
+
+def _top_correlated(correlation, company_ids, names):
+    """The TOP_CORRELATED most correlated other companies for each company."""
+    scores = np.where(np.isnan(correlation), -np.inf, correlation)
+    np.fill_diagonal(scores, -np.inf)
+    k = min(TOP_CORRELATED, len(company_ids) - 1)
+    if k <= 0:
+        return [[] for _ in company_ids]
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [
+        [{'id': int(company_ids[j]), 'name': names[int(company_ids[j])], 'correlation': _num(correlation[i, j])}
+         for j in row if np.isfinite(scores[i, j])]
+        for i, row in enumerate(top)
+    ]
+
+
+def market_analytics(interval=DEFAULT_INTERVAL, now=None):
+    """
+    Computes the latest rolling statistics of every company, each company's
+    most correlated peers and the correlation matrix between sectors, from
+    the `interval` candles over the span in ANALYTICS_SPANS. Everything is
+    computed on the whole companies x time matrix at once.
+    """
+    end = now or timezone.now()
+    start = end - ANALYTICS_SPANS[interval]
+    company_ids, timestamps, prices = load_price_matrix(start, end, interval)
+    result = {
+        'interval': interval,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'steps': len(timestamps),
+        'windows': {'sma_short': SHORT_WINDOW, 'sma_long': LONG_WINDOW, 'volatility': VOLATILITY_WINDOW},
+        'companies': [],
+        'sectors': [],
+        'correlation': [],
+    }
+    if not len(company_ids):
+        return result
+
+    info = {pk: (name, sector or '') for pk, name, sector in
+            Company.objects.filter(pk__in=company_ids.tolist()).values_list('pk', 'name', 'sector')}
+    names = {pk: info.get(pk, ('', ''))[0] for pk in company_ids.tolist()}
+    sectors = np.array([info.get(pk, ('', ''))[1] for pk in company_ids.tolist()])
+
+    series = indicators(prices)
+    returns = log_returns(prices)
+    peers = _top_correlated(correlation_matrix(returns), company_ids, names)
+    result['companies'] = [
+        {
+            'id': company_id,
+            'name': names[company_id],
+            'sector': sectors[i] or None,
+            'price': _num(prices[i, -1]),
+            'change': _num(prices[i, -1] / prices[i, 0] - 1.0),
+            'sma_short': _num(series['sma_short'][i, -1]),
+            'sma_long': _num(series['sma_long'][i, -1]),
+            'volatility': _num(series['volatility'][i, -1]),
+            'drawdown': _num(series['drawdown'][i, -1]),
+            'max_drawdown': _num(series['drawdown'][i].max()),
+            'correlated': peers[i],
+        }
+        for i, company_id in enumerate(company_ids.tolist())
+    ]
+
+    sector_names, by_sector = sector_returns(sectors, returns)
+    result['sectors'] = [name or None for name in sector_names.tolist()]
+    result['correlation'] = [[_num(v) for v in row] for row in correlation_matrix(by_sector)]
+    return result
+
+
+def _cache():
+    return caches[PRICE_CACHE_ALIAS]
+
+
+def cached_market_analytics(interval=DEFAULT_INTERVAL):
+    """
+    market_analytics memoized per data version, in the cache shared by every
+    process, so it is computed once per price tick (normally by the tick
+    pipeline) rather than per request.
+    """
+    version = data_version()
+    key = f'market:analytics:{interval}:{version}'
+    result = _cache().get(key)
+    if result is None:
+        result = market_analytics(interval)
+        result['version'] = version
+        _cache().set(key, result, ANALYTICS_CACHE_TIMEOUT)
+    return result
+
+
+def company_analytics(company_id, interval=DEFAULT_INTERVAL, max_points=500):
+    """
+    One company's price series with its rolling statistics, downsampled with
+    LTTB to at most `max_points`, plus its latest statistics and peers from the
+    market-wide analytics. Cached per data version like the market analytics.
+    """
+    market = cached_market_analytics(interval)
+    key = f'market:analytics:{interval}:{market["version"]}:company:{company_id}:{max_points}'
+    result = _cache().get(key)
+    if result is not None:
+        return result
+
+    start, end = datetime.fromisoformat(market['start']), datetime.fromisoformat(market['end'])
+    _, timestamps, prices = load_price_matrix(start, end, interval, company_ids=[company_id])
+    points = []
+    if len(timestamps):
+        series = indicators(prices)
+        for i in lttb(timestamps, prices[0], max_points):
+            points.append({
+                'timestamp': int(timestamps[i]),
+                'price': _num(prices[0, i]),
+                **{name: _num(values[0, i]) for name, values in series.items()},
+            })
+    stats = next((c for c in market['companies'] if c['id'] == company_id), None)
+    result = {
+        'company': company_id,
+        'interval': interval,
+        'windows': market['windows'],
+        'stats': stats,
+        'series': points,
+    }
+    _cache().set(key, result, ANALYTICS_CACHE_TIMEOUT)
+    return result
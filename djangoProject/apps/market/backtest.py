@@ -0,0 +1,206 @@
+import hashlib
+import json
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import caches
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from apps.market.downsampling import lttb
+from apps.market.models import Company, StockPriceHistory
+from apps.market.price_cache import PRICE_CACHE_ALIAS
+from apps.market.rollups import CANDLE_INTERVALS
+
+STRATEGIES = ('greenest', 'momentum', 'weekly_rebalance')
+
+# When no interval is requested, spans up to each length are read from that table
+AUTO_INTERVALS = [
+    (timedelta(days=1), '1m'),
+    (timedelta(days=60), '1h'),
+]
+DEFAULT_SPAN = timedelta(days=30)
+DEFAULT_TOP_N = 5
+DEFAULT_LOOKBACK = 24
+# Points of the value series returned with a result
+SERIES_POINTS = 200
+RESULT_CACHE_TIMEOUT = 3600
+
+
+def choose_interval(start, end):
+    return next((name for span, name in AUTO_INTERVALS if end - start <= span), '1d')
+
+
+def _source(interval):
+    if interval == 'raw':
+        return StockPriceHistory.objects.all(), 'date', 'price'
+    model, _ = CANDLE_INTERVALS[interval]
+    return model.objects.all(), 'bucket_start', 'close'
+
+
+def load_price_matrix(start, end, interval, company_ids=None):
+    """
+    Loads prices between `start` and `end` into a dense companies x time
+    matrix, for every company or only `company_ids`. Gaps are forward-filled
+    and a company's leading gap takes its first known price. Returns
+    (company ids, timestamps in seconds, prices).
+    """
+    rows, time_field, price_field = _source(interval)
+    rows = rows.filter(**{f'{time_field}__gte': start, f'{time_field}__lt': end})
+    if company_ids is not None:
+        rows = rows.filter(company_id__in=company_ids)
+    data = list(rows.order_by(time_field).values_list('company_id', time_field, price_field))
+    if not data:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.empty((0, 0))
+
+    company_col = np.fromiter((r[0] for r in data), dtype=np.int64, count=len(data))
+    time_col = np.fromiter((int(r[1].timestamp()) for r in data), dtype=np.int64, count=len(data))
+    price_col = np.fromiter((float(r[2]) for r in data), dtype=float, count=len(data))
+
+    company_ids, rows_idx = np.unique(company_col, return_inverse=True)
+    timestamps, cols_idx = np.unique(time_col, return_inverse=True)
+    prices = np.full((len(company_ids), len(timestamps)), np.nan)
+    prices[rows_idx, cols_idx] = price_col
+
+    # Forward fill along time: each cell takes the value at the last column it was known
+    known = ~np.isnan(prices)
+    last_known = np.where(known, np.arange(len(timestamps)), 0)
+    np.maximum.accumulate(last_known, axis=1, out=last_known)
+    prices = prices[np.arange(len(company_ids))[:, None], last_known]
+    # Back fill the leading gap with the first known price
+    first_prices = prices[np.arange(len(company_ids)), known.argmax(axis=1)]
+    prices = np.where(np.isnan(prices), first_prices[:, None], prices)
+    return company_ids, timestamps, prices
+
+
+def _top_n_mask(scores, top_n):
+    """Boolean mask of the `top_n` highest scores in each column (ties at the cut-off are all kept)."""
+    top_n = min(top_n, scores.shape[0])
+    cutoff = -np.partition(-scores, top_n - 1, axis=0)[top_n - 1]
+    return scores >= cutoff
+
+
+def _equal_weights(mask):
+    counts = mask.sum(axis=0, keepdims=True)
+    return np.divide(mask, counts, out=np.zeros(mask.shape), where=counts > 0)
+
+
+def strategy_weights(strategy, prices, ratings, top_n, lookback):
+    """Target portfolio weights per company (rows) at every time step (columns)."""
+    n_companies, n_steps = prices.shape
+    if strategy == 'greenest':
+        return _equal_weights(np.repeat(_top_n_mask(ratings[:, None], top_n), n_steps, axis=1))
+    if strategy == 'momentum':
+        lookback = max(1, min(lookback, n_steps - 1))
+        trailing = np.zeros_like(prices)
+        trailing[:, lookback:] = prices[:, lookback:] / prices[:, :-lookback] - 1.0
+        mask = _top_n_mask(trailing, top_n)
+        # Until there is enough history to rank on, hold everything equally
+        mask[:, :lookback] = True
+        return _equal_weights(mask)
+    return np.full((n_companies, n_steps), 1.0 / n_companies)
+
+
+def rebalance_every(strategy, n_steps, step_seconds):
+    """Steps between rebalances: every step for momentum, weekly, or buy and hold for greenest."""
+    if strategy == 'momentum':
+        return 1
+    if strategy == 'weekly_rebalance':
+        return max(1, int(timedelta(days=7).total_seconds() // step_seconds))
+    return max(1, n_steps)
+
+
+def evaluate(prices, weights, every):
+    """
+    Simulates holding `weights` set at each rebalance step and left to drift
+    with prices until the next one. Returns (portfolio value series starting at
+    1.0, effective holdings weights companies x time).
+    """
+    n_steps = prices.shape[1]
+    period = np.arange(n_steps) // every
+    period_start = period * every
+    # Value of each holding relative to the portfolio value at the start of its rebalance period
+    held = weights[:, period_start] * prices / prices[:, period_start]
+    growth = held.sum(axis=0)
+
+    # The value at each period start is the product of the completed periods' growth
+    starts = np.arange(0, n_steps, every)
+    ends = np.minimum(starts + every, n_steps - 1)
+    period_growth = (weights[:, starts] * prices[:, ends] / prices[:, starts]).sum(axis=0)
+    start_values = np.concatenate(([1.0], np.cumprod(period_growth)[:-1]))
+
+    values = start_values[period] * growth
+    holdings = held / growth
+    return values, holdings
+
+
+def max_drawdown(values):
+    peaks = np.maximum.accumulate(values)
+    return float(np.max(1.0 - values / peaks)) if len(values) else 0.0
+
+
+def run_backtest(strategy, start, end, interval, top_n=DEFAULT_TOP_N, lookback=DEFAULT_LOOKBACK):
+    """
+    Replays a strategy over the price history between `start` and `end`.
+    Returns a JSON-serialisable dict with total return, max drawdown, the
+    average weighted sustainability rating held (green impact) and a
+    downsampled portfolio value series.
+    """
+    company_ids, timestamps, prices = load_price_matrix(start, end, interval)
+    result = {
+        'strategy': strategy,
+        'interval': interval,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'companies': len(company_ids),
+        'steps': len(timestamps),
+    }
+    if len(timestamps) < 2:
+        result.update(total_return=0.0, max_drawdown=0.0, green_impact=0.0, series=[])
+        return result
+
+    rating_map = dict(Company.objects.filter(pk__in=company_ids.tolist()).values_list('pk', 'sustainability_rating'))
+    ratings = np.array([float(rating_map.get(pk, 0)) for pk in company_ids.tolist()])
+
+    weights = strategy_weights(strategy, prices, ratings, top_n, lookback)
+    step_seconds = int(np.median(np.diff(timestamps)))
+    values, holdings = evaluate(prices, weights, rebalance_every(strategy, len(timestamps), step_seconds))
+
+    keep = lttb(timestamps, values, SERIES_POINTS)
+    result.update(
+        total_return=round(float(values[-1] - 1.0), 6),
+        max_drawdown=round(max_drawdown(values), 6),
+        green_impact=round(float((holdings * ratings[:, None]).sum(axis=0).mean()), 4),
+        series=[[int(timestamps[i]), round(float(values[i]), 6)] for i in keep],
+    )
+    return result
+
+
+def data_version():
+    """Changes whenever a new price tick arrives or companies or their ratings change."""
+    latest = StockPriceHistory.objects.aggregate(latest=Max('date'))['latest']
+    companies = Company.objects.aggregate(count=Count('id'), ratings=Sum('sustainability_rating'))
+    return f"{latest.isoformat() if latest else '-'}:{companies['count']}:{companies['ratings']}"
+
+
+def _cache():
+    return caches[PRICE_CACHE_ALIAS]
+
+
+def cached_backtest(strategy, start=None, end=None, interval=None, top_n=DEFAULT_TOP_N, lookback=DEFAULT_LOOKBACK):
+    """
+    run_backtest memoized by its parameters and the version of the data it
+    reads, in the cache shared by every process. An open-ended range ("up to
+    now") is keyed as such, so it is only recomputed once a new tick has
+    changed the data version.
+    """
+    params = json.dumps([strategy, start and start.isoformat(), end and end.isoformat(), interval,
+                         top_n, lookback, data_version()])
+    key = 'market:backtest:' + hashlib.sha256(params.encode()).hexdigest()
+    result = _cache().get(key)
+    if result is None:
+        end = end or timezone.now()
+        start = start or end - DEFAULT_SPAN
+        result = run_backtest(strategy, start, end, interval or choose_interval(start, end), top_n, lookback)
+        _cache().set(key, result, RESULT_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,215 @@
+import logging
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.market.leaderboard import refresh_leaderboard
+from apps.market.models import Company, Investment, Position
+from apps.market.pipeline import run_market_tick
+from apps.market.price_cache import PRICE_CACHE_ALIAS, invalidate_price_snapshot
+from apps.market.tasks import record_portfolio_snapshots_task
+from apps.users.models import UserProfile
+
+# Synthetic market sizes: (companies, users, investment lots)
+SCALE_PRESETS = {
+    'tiny': (5, 20, 60),
+    'laptop': (50, 1_000, 10_000),
+    'medium': (200, 10_000, 100_000),
+    'large': (500, 100_000, 1_000_000),
+}
+
+logger = logging.getLogger(__name__)
+
+USERNAME_PREFIX = 'bench_user_'
+# Share of companies seeded below the reset threshold long enough to be reset
+LOW_PRICE_SHARE = 0.05
+BATCH_SIZE = 2000
+
+
+class QueryCounter:
+    """Counts SQL statements run on the default connection, without keeping their text."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def run_commit_hooks():
+    """
+    Runs the on_commit hooks registered inside the block as soon as it exits,
+    as a commit would, including hooks those hooks register. The enclosing
+    transaction is left open.
+    """
+    start = len(connection.run_on_commit)
+    yield
+    while len(connection.run_on_commit) > start:
+        hooks = connection.run_on_commit[start:]
+        del connection.run_on_commit[start:]
+        for _, hook, robust in hooks:
+            if not robust:
+                hook()
+                continue
+            try:
+                hook()
+            except Exception:
+                logger.exception("Commit hook %r failed during the benchmark", hook)
+
+
+def isolated_publishing():
+    """
+    Points the price snapshot cache and the channel layer at throwaway
+    in-memory backends, so the hooks of a benchmark run are timed without
+    publishing its prices to live pages or websocket clients.
+    """
+    return override_settings(
+        CACHES={**settings.CACHES, PRICE_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-market-prices',
+        }},
+        CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    )
+
+
+def measure(name, func):
+    """
+    Runs `func` once and returns its wall time and SQL query count, including
+    the on_commit hooks it registers. The benchmark runs in one transaction
+    that is never committed, so those hooks are run as soon as `func` returns.
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        with run_commit_hooks():
+            func()
+        elapsed = time.perf_counter() - started
+    return {'name': name, 'seconds': round(elapsed, 6), 'queries': counter.count}
+
+
+def seed_market(companies, users, lots, rng):
+    """
+    Creates `companies` companies, `users` players with profiles and `lots`
+    investment lots spread randomly between them, plus the positions and
+    leaderboard entries those lots imply. Everything is written with bulk_create.
+    Returns the id of a player holding at least one lot.
+    """
+    now = timezone.now()
+    low = rng.random(companies) < LOW_PRICE_SHARE
+    prices = np.where(low, 1.20, rng.uniform(5, 200, companies)).round(2)
+    Company.objects.bulk_create(
+        [Company(name=f"Bench Company {i}", description="Synthetic benchmark company",
+                 sustainability_rating=Decimal(str(round(float(rng.uniform(1, 10)), 1))),
+                 current_stock_price=Decimal(str(price)),
+                 price_low_since=now - timedelta(hours=1) if is_low else None)
+         for i, (price, is_low) in enumerate(zip(prices.tolist(), low.tolist()))],
+        batch_size=BATCH_SIZE,
+    )
+    company_ids = np.array(Company.objects.filter(name__startswith="Bench Company ")
+                           .order_by('id').values_list('id', flat=True), dtype=np.int64)
+
+    User.objects.bulk_create(
+        [User(username=f"{USERNAME_PREFIX}{i}", password='!') for i in range(users)],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = np.array(User.objects.filter(username__startswith=USERNAME_PREFIX)
+                        .order_by('id').values_list('id', flat=True), dtype=np.int64)
+    UserProfile.objects.bulk_create([UserProfile(user_id=int(pk)) for pk in user_ids], batch_size=BATCH_SIZE)
+
+    lot_users = user_ids[rng.integers(0, len(user_ids), lots)]
+    lot_companies = company_ids[rng.integers(0, len(company_ids), lots)]
+    lot_shares = rng.integers(1, 50, lots)
+    lot_prices = prices[np.searchsorted(company_ids, lot_companies)]
+    for start in range(0, lots, BATCH_SIZE):
+        end = start + BATCH_SIZE
+        Investment.objects.bulk_create([
+            Investment(user_id=int(u), company_id=int(c), shares=int(s), purchase_price=Decimal(str(p)))
+            for u, c, s, p in zip(lot_users[start:end], lot_companies[start:end],
+                                  lot_shares[start:end], lot_prices[start:end].tolist())
+        ])
+
+    # One position per (user, company) pair holding the sum of its lots
+    pairs, inverse = np.unique(np.stack([lot_users, lot_companies], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    shares = np.bincount(inverse, weights=lot_shares, minlength=len(pairs))
+    cost = np.bincount(inverse, weights=lot_shares * lot_prices, minlength=len(pairs))
+    Position.objects.bulk_create(
+        [Position(user_id=int(u), company_id=int(c), shares=int(s), cost_basis=Decimal(str(round(float(v), 2))))
+         for (u, c), s, v in zip(pairs, shares, cost)],
+        batch_size=BATCH_SIZE,
+    )
+    refresh_leaderboard()
+    return int(lot_users[0]) if lots else int(user_ids[0])
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _get(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+
+
+def run_benchmark(companies, users, lots, seed=0, keep=False):
+    """
+    Seeds a synthetic market and times the market beat tasks and the busiest
+    views against it. Returns a JSON-serialisable dict of results.
+
+    Everything runs in one transaction that is rolled back at the end unless
+    `keep` is set, so the configured database is left as it was. Each step's
+    commit hooks (price snapshots, broadcasts, deferred writes) run right
+    after it and are timed with it, publishing to throwaway backends only.
+    """
+    rng = np.random.default_rng(seed)
+    report = {
+        'revision': _git_revision(),
+        'database': connection.vendor,
+        'companies': companies,
+        'users': users,
+        'lots': lots,
+        'seed': seed,
+        'started_at': timezone.now().isoformat(),
+    }
+    quiet = StringIO()
+    with isolated_publishing(), transaction.atomic():
+        seeded = {}
+        report['seed_market'] = measure('seed_market', lambda: seeded.update(user=seed_market(companies, users, lots, rng)))
+        client = Client()
+        client.force_login(User.objects.get(pk=seeded['user']))
+
+        steps = [
+            ('update_stock_prices', lambda: call_command('update_stock_prices', stdout=quiet)),
+            ('generate_market_events', lambda: call_command('generate_market_events', stdout=quiet)),
+            ('reset_low_value_stocks', lambda: call_command('reset_low_value_stocks', stdout=quiet)),
+            ('record_portfolio_snapshots', record_portfolio_snapshots_task),
+            ('market_tick', run_market_tick),
+            ('leaderboard_view', lambda: _get(client, reverse('market:leaderboard'))),
+            ('portfolio_view', lambda: _get(client, reverse('market:portfolio'))),
+        ]
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            report['results'] = [measure(name, step) for name, step in steps]
+        if not keep:
+            transaction.set_rollback(True)
+    if keep:
+        # The kept prices were only published to the throwaway cache
+        invalidate_price_snapshot()
+    return report
@@ -0,0 +1,47 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+# Every StockPriceConsumer joins this group (see consumers.py)
+STOCK_UPDATES_GROUP = "stock_updates"
+
+
+def price_tick_message(tick):
+    """
+    Delta-encodes a PriceTick: only the companies whose price moved, as
+    [company_id, new_price, change] triples.
+    """
+    changed = tick.changed()
+    return {
+        'type': 'prices',
+        'timestamp': tick.timestamp.isoformat(),
+        'changes': [
+            [int(company_id), round(float(price), 2), round(float(change), 2)]
+            for company_id, price, change in zip(
+                tick.company_ids[changed],
+                tick.new_prices[changed],
+                (tick.new_prices - tick.old_prices)[changed],
+            )
+        ],
+    }
+
+
+def publish_price_tick(tick):
+    """Sends one batched message for the whole tick to every connected client."""
+    message = price_tick_message(tick)
+    if not message['changes']:
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(STOCK_UPDATES_GROUP, {
+            'type': 'stock_update',
+            'message': message,
+        })
+    except Exception as e:
+        # A missing channel layer backend must never fail the price tick itself
+        logger.error("Error broadcasting price tick: %s", e)
@@ -1,11 +1,35 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from apps.market.broadcast import STOCK_UPDATES_GROUP
+
+# Most companies one client can subscribe to; ids past it are dropped
+MAX_SUBSCRIPTIONS = 100
+
+
+def _company_ids(values):
+    """The valid integer ids in a subscribe request, up to MAX_SUBSCRIPTIONS of them."""
+    if not isinstance(values, list):
+        return set()
+    ids = set()
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+        if len(ids) >= MAX_SUBSCRIPTIONS:
+            break
+    return ids
+
 
 class StockPriceConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        # You could use a group name for broadcasting updates.
-        self.group_name = "stock_updates"
+        # Every client joins one group; price ticks are filtered per client on the way out.
+        self.group_name = STOCK_UPDATES_GROUP
+        # Company ids this client wants updates for; empty means every company
+        self.company_ids = set()
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
@@ -20,9 +44,20 @@ class StockPriceConsumer(AsyncWebsocketConsumer):
 
     # Receive message from WebSocket
     async def receive(self, text_data):
-        data = json.loads(text_data)
-        # Process data if needed
-        # For now, just echo the message back:
+        try:
+            data = json.loads(text_data)
+        except (TypeError, json.JSONDecodeError):
+            return
+        if not isinstance(data, dict):
+            return
+        if data.get('action') == 'subscribe':
+            # {"action": "subscribe", "company_ids": [1, 2]} replaces the subscription
+            self.company_ids = _company_ids(data.get('company_ids'))
+            await self.send(text_data=json.dumps({
+                'message': {'type': 'subscribed', 'company_ids': sorted(self.company_ids)}
+            }))
+            return
+        # Anything else is echoed back as before
         await self.send(text_data=json.dumps({
             'message': data.get('message', '')
         }))
@@ -30,7 +65,12 @@ class StockPriceConsumer(AsyncWebsocketConsumer):
     # Receive message from group
     async def stock_update(self, event):
         message = event['message']
+        if self.company_ids and message.get('type') == 'prices':
+            changes = [change for change in message['changes'] if change[0] in self.company_ids]
+            if not changes:
+                return
+            message = dict(message, changes=changes)
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
             'message': message
-        }))
\ No newline at end of file
+        }))
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+def lttb(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of at most `max_points` points of the series (x, y)
+    that best preserve its visual shape: the first and last points are always
+    kept and every bucket in between contributes the point forming the largest
+    triangle with the previously kept point and the next bucket's average.
+    Bucket bounds and averages are computed for all buckets at once; only the
+    choice of point, which depends on the previous choice, walks the buckets.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+
+    # Interior points 1..n-2 split into max_points - 2 buckets [edges[i], edges[i + 1])
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # Each bucket is weighed against the average of the one after it; the last against the final point
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        areas = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.market.models import EventImpactBucket
+from apps.market.rollups import CANDLE_INTERVALS, bucket_start
+
+# Bucket sizes of the impact series, in seconds; the same intervals as the price candles
+IMPACT_INTERVALS = {interval: seconds for interval, (_, seconds) in CANDLE_INTERVALS.items()}
+
+
+def record_event_impacts(events):
+    """
+    Appends newly created events to the cumulative impact series of every
+    interval. Events normally land in the newest bucket, which costs one
+    update (or one insert) per interval; an event dated before newer buckets
+    also shifts their running totals.
+    """
+    events = list(events)
+    if not events:
+        return
+    with transaction.atomic():
+        for interval, seconds in IMPACT_INTERVALS.items():
+            totals = defaultdict(lambda: [0, Decimal('0.00')])
+            for event in events:
+                bucket = totals[bucket_start(event.event_date, seconds)]
+                bucket[0] += 1
+                bucket[1] += event.impact_factor
+
+            series = EventImpactBucket.objects.filter(interval=interval)
+            for start, (count, impact) in sorted(totals.items()):
+                series.filter(bucket_start__gt=start).update(cumulative_impact=F('cumulative_impact') + impact)
+                updated = series.filter(bucket_start=start).update(
+                    event_count=F('event_count') + count,
+                    impact=F('impact') + impact,
+                    cumulative_impact=F('cumulative_impact') + impact,
+                )
+                if not updated:
+                    previous = (series.filter(bucket_start__lt=start).order_by('-bucket_start')
+                                .values_list('cumulative_impact', flat=True).first())
+                    EventImpactBucket.objects.create(
+                        interval=interval, bucket_start=start, event_count=count, impact=impact,
+                        cumulative_impact=(previous or Decimal('0.00')) + impact,
+                    )
+
+
+def impact_series(interval, start=None, end=None):
+    """Returns the buckets of one interval between `start` and `end`, oldest first."""
+    buckets = EventImpactBucket.objects.filter(interval=interval)
+    if start is not None:
+        buckets = buckets.filter(bucket_start__gte=bucket_start(start, IMPACT_INTERVALS[interval]))
+    if end is not None:
+        buckets = buckets.filter(bucket_start__lt=end)
+    return buckets.order_by('bucket_start')
@@ -0,0 +1,129 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from apps.market.models import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Buffered trades are written once this many are waiting...
+DEFAULT_FLUSH_SIZE = 100
+# ...or once the oldest has waited this many milliseconds
+DEFAULT_FLUSH_INTERVAL_MS = 500
+
+
+class TradeJournal:
+    """
+    Write-behind buffer for the append-only trade journal.
+
+    Filled trades are queued in memory and written with one bulk_create once
+    `flush_size` are waiting, or by a background thread `flush_interval_ms`
+    after the first one arrived, so a trade request never waits on its own
+    journal INSERT. Rows keep the time their trade filled. A flush that fails
+    puts its rows back to be retried by the next one. The buffer is per
+    process and is flushed on interpreter exit.
+
+    The trade's balance and position changes commit before its journal row,
+    so a process that dies without exiting cleanly loses the rows still
+    buffered: at most `flush_size` trades, filled in the last
+    `flush_interval_ms`. Set TRADE_JOURNAL_FLUSH_SIZE to 1 to write each
+    trade's rows as it fills instead.
+    """
+
+    def __init__(self, flush_size=None, flush_interval_ms=None):
+        self._flush_size = flush_size
+        self._flush_interval_ms = flush_interval_ms
+        self._buffer = []
+        self._lock = threading.Lock()
+        # Flushes run one at a time so rows are written in the order they were queued
+        self._flushing = threading.Lock()
+        self._flusher = None
+        # Rows taken from the buffer by a flush that has not finished yet
+        self._writing = 0
+        self._idle = threading.Condition(self._lock)
+
+    @property
+    def flush_size(self):
+        return self._flush_size or getattr(settings, 'TRADE_JOURNAL_FLUSH_SIZE', DEFAULT_FLUSH_SIZE)
+
+    @property
+    def flush_interval(self):
+        ms = self._flush_interval_ms or getattr(settings, 'TRADE_JOURNAL_FLUSH_INTERVAL_MS', DEFAULT_FLUSH_INTERVAL_MS)
+        return ms / 1000
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def record(self, entries):
+        """Queues unsaved Transaction instances to be written."""
+        with self._lock:
+            self._buffer.extend(entries)
+            waiting = len(self._buffer)
+        if waiting >= self.flush_size:
+            self.flush()
+        elif waiting:
+            self._start_flusher()
+
+    def flush(self):
+        """Writes everything buffered so far. Returns the number of rows written."""
+        with self._flushing:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                self._writing = len(rows)
+            if not rows:
+                return 0
+            written = len(rows)
+            try:
+                Transaction.objects.bulk_create(rows, batch_size=500)
+            except Exception:
+                logger.exception("Writing %d journal entries failed; they will be retried.", len(rows))
+                written = 0
+            with self._idle:
+                if not written:
+                    self._buffer[:0] = rows
+                self._writing = 0
+                self._idle.notify_all()
+            return written
+
+    def wait_idle(self, timeout=None):
+        """
+        Blocks until nothing is buffered, being written, or waiting on the
+        background flusher. Returns False if `timeout` seconds pass first.
+        """
+        with self._idle:
+            return self._idle.wait_for(
+                lambda: not self._buffer and not self._writing and self._flusher is None, timeout)
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='trade-journal', daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        try:
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+                with self._idle:
+                    # Exit once idle; the next trade starts a new flusher
+                    if not self._buffer:
+                        self._flusher = None
+                        self._idle.notify_all()
+                        return
+        finally:
+            with self._idle:
+                if self._flusher is threading.current_thread():
+                    self._flusher = None
+                    self._idle.notify_all()
+            connection.close()
+
+
+trade_journal = TradeJournal()
+atexit.register(trade_journal.flush)
@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.market.models import Investment, LeaderboardEntry
+
+ZERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+# Portfolio value and green impact summed over a user's positions
+PORTFOLIO_VALUE = Coalesce(
+    Sum(F('positions__shares') * F('positions__company__current_stock_price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)),
+    ZERO,
+)
+GREEN_IMPACT = Coalesce(
+    Sum(F('positions__shares') * F('positions__company__sustainability_rating'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)),
+    ZERO,
+)
+
+SHARES = Coalesce(Sum('positions__shares'), 0)
+
+
+def lots_held(investments):
+    """Lots per user among `investments`, as a subquery since joining them would multiply the position sums."""
+    return Coalesce(
+        Subquery(investments.filter(user=OuterRef('pk')).order_by().values('user')
+                 .annotate(lots=Count('pk')).values('lots'), output_field=IntegerField()),
+        0,
+    )
+
+
+LOTS = lots_held(Investment.objects)
+
+
+def _entries(users):
+    rows = (users.annotate(value=PORTFOLIO_VALUE, green=GREEN_IMPACT, shares=SHARES, lots=LOTS)
+            .values_list('id', 'value', 'green', 'shares', 'lots'))
+    return [
+        LeaderboardEntry(user_id=user_id,
+                         portfolio_value=Decimal(value).quantize(Decimal('0.01')),
+                         green_impact=Decimal(green).quantize(Decimal('0.01')),
+                         total_shares=shares,
+                         total_investments=lots)
+        for user_id, value, green, shares, lots in rows
+    ]
+
+
+def _upsert(entries):
+    LeaderboardEntry.objects.bulk_create(
+        entries,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['portfolio_value', 'green_impact', 'total_shares', 'total_investments', 'updated_at'],
+    )
+
+
+def refresh_leaderboard_entry(user):
+    """Recomputes one user's standings after a buy or sell."""
+    _upsert(_entries(User.objects.filter(pk=user.pk)))
+
+
+def refresh_leaderboard():
+    """
+    Recomputes every player's standings with one aggregate query and writes
+    them back in bulk upserts. Run after each price tick.
+    """
+    entries = _entries(User.objects.filter(userprofile__isnull=False))
+    _upsert(entries)
+    return len(entries)
+
+
+def leaderboard_rank(entry):
+    """1-based position of an entry in the green impact ordering used by the leaderboard view."""
+    ahead = LeaderboardEntry.objects.filter(
+        Q(green_impact__gt=entry.green_impact) | Q(green_impact=entry.green_impact, user_id__lt=entry.user_id)
+    ).count()
+    return ahead + 1
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.market.backtest import DEFAULT_LOOKBACK, DEFAULT_TOP_N, STRATEGIES, cached_backtest
+from apps.market.utils import parse_bound
+
+
+class Command(BaseCommand):
+    help = "Replay an investment strategy over past stock prices and print its returns, drawdown and green impact."
+
+    def add_arguments(self, parser):
+        parser.add_argument('strategy', choices=STRATEGIES)
+        parser.add_argument('--start', help='Start of the replay as an ISO date/datetime (default: 30 days before --end)')
+        parser.add_argument('--end', help='End of the replay as an ISO date/datetime (default: now)')
+        parser.add_argument('--interval', choices=['raw', '1m', '1h', '1d'],
+                            help='Price resolution (default: chosen from the span)')
+        parser.add_argument('--top-n', type=int, default=DEFAULT_TOP_N, help='Companies held by greenest/momentum')
+        parser.add_argument('--lookback', type=int, default=DEFAULT_LOOKBACK, help='Momentum lookback in steps')
+        parser.add_argument('--json', action='store_true', help='Print the full result, including the value series, as JSON')
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                bounds[name] = parse_bound(options[name])
+                if bounds[name] is None:
+                    raise CommandError(f"Invalid --{name} value: {options[name]}")
+        if options['top_n'] < 1 or options['lookback'] < 1:
+            raise CommandError("--top-n and --lookback must be at least 1.")
+
+        result = cached_backtest(options['strategy'], interval=options['interval'],
+                                 top_n=options['top_n'], lookback=options['lookback'], **bounds)
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            f"{result['strategy']} over {result['steps']} {result['interval']} steps, {result['companies']} companies"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Return: {result['total_return']:.2%}  Max drawdown: {result['max_drawdown']:.2%}  "
+            f"Green impact: {result['green_impact']:.2f}"
+        ))
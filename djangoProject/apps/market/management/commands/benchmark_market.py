@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.market.benchmark import SCALE_PRESETS, run_benchmark
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic market and time the market beat tasks and views (wall time and SQL queries). "
+            "The seeded data is rolled back afterwards unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=SCALE_PRESETS, default='laptop',
+                            help='Market size preset (default: laptop)')
+        parser.add_argument('--companies', type=int, help='Override the number of companies')
+        parser.add_argument('--users', type=int, help='Override the number of users')
+        parser.add_argument('--lots', type=int, help='Override the number of investment lots')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data instead of rolling it back')
+
+    def handle(self, *args, **options):
+        companies, users, lots = SCALE_PRESETS[options['preset']]
+        companies = options['companies'] or companies
+        users = options['users'] or users
+        lots = options['lots'] if options['lots'] is not None else lots
+        if companies < 1 or users < 1 or lots < 0:
+            raise CommandError("A benchmark needs at least one company and one user.")
+
+        report = run_benchmark(companies, users, lots, seed=options['seed'], keep=options['keep'])
+        report['preset'] = options['preset']
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+            for result in report['results']:
+                self.stdout.write(f"{result['name']}: {result['seconds']:.3f}s, {result['queries']} queries")
+            self.stdout.write(self.style.SUCCESS(f"Wrote benchmark report to {options['output']}."))
+        else:
+            self.stdout.write(output)
@@ -1,11 +1,14 @@
 # In a file like clear_stocks.py within a management/commands folder
 from django.core.management.base import BaseCommand
-from apps.market.models import Investment, StockPriceHistory
+from apps.market.models import Investment, Position, StockPriceHistory, MinuteCandle, HourCandle, DayCandle
 
 class Command(BaseCommand):
-    help = "Clear all stock-related data (Investments and StockPriceHistory)."
+    help = "Clear all stock-related data (Investments, StockPriceHistory and its candle rollups)."
 
     def handle(self, *args, **options):
         Investment.objects.all().delete()
+        Position.objects.all().delete()
         StockPriceHistory.objects.all().delete()
+        for candle_model in (MinuteCandle, HourCandle, DayCandle):
+            candle_model.objects.all().delete()
         self.stdout.write(self.style.SUCCESS("Cleared all stock data."))
\ No newline at end of file
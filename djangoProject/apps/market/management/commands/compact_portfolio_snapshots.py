@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.market.snapshots import compact_portfolio_snapshots
+
+
+class Command(BaseCommand):
+    help = "Downsample portfolio snapshots into hourly/daily tiers and apply PORTFOLIO_SNAPSHOT_RETENTION."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-buckets', type=int, default=None,
+                            help='Roll up at most this many buckets per tier (the next run resumes where this one stopped)')
+
+    def handle(self, *args, **options):
+        written, deleted = compact_portfolio_snapshots(max_buckets=options['max_buckets'])
+        for resolution, count in written.items():
+            self.stdout.write(self.style.SUCCESS(f"Wrote {count} {resolution} rollups."))
+        for level, count in deleted.items():
+            self.stdout.write(self.style.SUCCESS(f"Pruned {count} {level} snapshots."))
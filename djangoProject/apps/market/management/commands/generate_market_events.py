@@ -1,6 +1,13 @@
 import random
+from datetime import timedelta
 from decimal import Decimal
-from django.core.management.base import BaseCommand
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.market.event_impact import record_event_impacts
 from apps.market.models import MarketEvent, Company
 
 class Command(BaseCommand):
@@ -14,6 +21,13 @@ class Command(BaseCommand):
             default=10,
             help='Number of market events to generate (default is 30)'
         )
+        parser.add_argument(
+            '--sector-weight',
+            type=float,
+            default=1.0,
+            help='How much more likely companies in an event\'s focus sector are to be affected '
+                 '(default 1.0: every company equally likely)'
+        )
 
     def handle(self, *args, **options):
         count = options['count']
@@ -80,32 +94,66 @@ class Command(BaseCommand):
         ]
 
         self.stdout.write("Generating market events...")
+        # Companies are loaded once; selection works on their ids and sectors
+        companies = list(Company.objects.values_list('id', 'sector'))
+        company_ids = np.array([pk for pk, _ in companies], dtype=np.int64)
+        sectors = np.array([sector or '' for _, sector in companies])
+        sector_names = np.unique(sectors)
+        sector_weight = options['sector_weight']
+        if sector_weight <= 0:
+            raise CommandError("--sector-weight must be positive.")
+        if not companies:
+            self.stdout.write("No companies available to assign.")
+
+        now = timezone.now()
+        created = []
+        affected_by_event = []
         for i in range(count):
             title, description = random.choice(events)
             # Choose a random impact factor between -0.35 and +0.35
             impact = Decimal(random.uniform(-0.25, 0.35)).quantize(Decimal('0.01'))
             # Random duration between 1 and 5 minutes (for testing; adjust as needed)
             duration = random.randint(1, 5)
-            event = MarketEvent.objects.create(
+            # bulk_create bypasses MarketEvent.save(), so the window end is set here
+            created.append(MarketEvent(
                 title=title,
                 description=description,
                 impact_factor=impact,
-                duration=duration
-            )
-            companies = list(Company.objects.all())
+                duration=duration,
+                event_date=now,
+                ends_at=now + timedelta(minutes=duration),
+            ))
             if companies:
                 # Randomly assign a subset of companies (between 1 and half of the available companies)
                 num = random.randint(1, max(1, len(companies) // 2))
-                affected = random.sample(companies, k=num)
-                # Use add() with unpacking to assign the many-to-many relation
-                event.companies_affected.add(*affected)
+                weights = None
+                if sector_weight != 1.0:
+                    focus = sector_names[random.randrange(len(sector_names))]
+                    weights = np.where(sectors == focus, sector_weight, 1.0)
+                    weights /= weights.sum()
+                affected_by_event.append(np.random.choice(company_ids, size=num, replace=False, p=weights))
+            else:
+                affected_by_event.append(company_ids)
+
+        Through = MarketEvent.companies_affected.through
+        with transaction.atomic():
+            MarketEvent.objects.bulk_create(created, batch_size=500)
+            Through.objects.bulk_create(
+                [Through(marketevent_id=event.pk, company_id=int(company_id))
+                 for event, affected in zip(created, affected_by_event) for company_id in affected],
+                batch_size=1000,
+            )
+            # Append the new events to the cumulative impact series behind event_impact_api
+            record_event_impacts(created)
+
+        if options['verbosity'] > 1:
+            for event, affected in zip(created, affected_by_event):
                 self.stdout.write(self.style.SUCCESS(
-                    f"Assigned {len(affected)} companies to event '{event.title}'"
+                    f"Generated event '{event.title}' with impact {event.impact_factor} for {event.duration} "
+                    f"minutes, affecting {len(affected)} companies."
                 ))
-            else:
-                self.stdout.write("No companies available to assign.")
-            event.save()
-            self.stdout.write(self.style.SUCCESS(
-                f"Generated event '{event.title}' with impact {impact} for {duration} minutes."
-            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(created)} market events affecting "
+            f"{sum(len(affected) for affected in affected_by_event)} companies in total."
+        ))
         self.stdout.write(self.style.SUCCESS("Market events generation complete."))
\ No newline at end of file
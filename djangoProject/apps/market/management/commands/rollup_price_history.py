@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.market.rollups import rebuild_candles, prune_price_history
+from apps.market.utils import parse_bound
+
+
+class Command(BaseCommand):
+    help = "Rebuild OHLC candle rollups from raw stock price ticks and/or apply the price history retention policy."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Rebuild candles from this ISO date/datetime (default: earliest '
+                                             'remaining tick). Buckets past the raw retention keep their candles')
+        parser.add_argument('--end', help='Rebuild candles up to this ISO date/datetime (default: latest tick)')
+        parser.add_argument('--prune', action='store_true', help='Apply MARKET_PRICE_RETENTION after rebuilding')
+        parser.add_argument('--prune-only', action='store_true', help='Only apply MARKET_PRICE_RETENTION')
+
+    def handle(self, *args, **options):
+        if not options['prune_only']:
+            bounds = {}
+            for name in ('start', 'end'):
+                if options[name]:
+                    bounds[name] = parse_bound(options[name])
+                    if bounds[name] is None:
+                        raise CommandError(f"Invalid --{name} value: {options[name]}")
+            written = rebuild_candles(**bounds)
+            for interval, count in written.items():
+                self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} {interval} candles."))
+
+        if options['prune'] or options['prune_only']:
+            deleted = prune_price_history()
+            for level, count in deleted.items():
+                self.stdout.write(self.style.SUCCESS(f"Pruned {count} {level} rows."))
+            if not deleted:
+                self.stdout.write("Nothing to prune.")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.market.pipeline import get_tick_interval, run_local_scheduler
+
+
+class Command(BaseCommand):
+    help = "Run the market tick pipeline in this process on a fixed interval (for when no Celery broker is running)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds between ticks (default: MARKET_TICK_INTERVAL)')
+        parser.add_argument('--count', type=int, default=None,
+                            help='Stop after this many ticks (default: run until interrupted)')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or get_tick_interval()
+        if interval <= 0:
+            raise CommandError("--interval must be positive.")
+
+        def report(log):
+            if log is None:
+                self.stdout.write(self.style.ERROR("Market tick failed, see the log for details."))
+                return
+            stages = ", ".join(
+                f"{name} skipped" if stage.get('skipped') else f"{name} {stage['work']} in {stage['seconds']:.3f}s"
+                for name, stage in log.stages.items()
+            )
+            self.stdout.write(self.style.SUCCESS(f"Market tick {log.status}: {stages or 'no stages run'}"))
+
+        self.stdout.write(f"Running market ticks every {interval:g} seconds.")
+        try:
+            run_local_scheduler(interval=interval, count=options['count'], on_tick=report)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
@@ -1,7 +1,8 @@
 import random
 from decimal import Decimal
 from django.core.management.base import BaseCommand
-from apps.market.models import Company, StockPriceHistory, MarketEvent
+from apps.market.event_impact import record_event_impacts
+from apps.market.models import Company, StockPriceHistory, MarketEvent, EventImpactBucket
 
 
 class Command(BaseCommand):
@@ -35,6 +36,7 @@ class Command(BaseCommand):
             self.stdout.write("Clearing existing companies, events, and stock history...")
             Company.objects.all().delete()
             MarketEvent.objects.all().delete()
+            EventImpactBucket.objects.all().delete()
             StockPriceHistory.objects.all().delete()
 
         companies_data = [
@@ -211,6 +213,7 @@ class Command(BaseCommand):
         events_data = events_data[:event_count]
 
         self.stdout.write("Creating sample market events...")
+        created = []
         for event_data in events_data:
             event = MarketEvent.objects.create(**event_data)
             # Randomly assign a subset of companies to this event
@@ -224,6 +227,8 @@ class Command(BaseCommand):
             else:
                 self.stdout.write("No companies available to assign.")
             event.save()
+            created.append(event)
             self.stdout.write(self.style.SUCCESS(f"Created event: {event.title}"))
+        record_event_impacts(created)
 
         self.stdout.write(self.style.SUCCESS("Database seeding complete."))
\ No newline at end of file
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:42
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_ends_at(apps, schema_editor):
+    MarketEvent = apps.get_model('market', 'MarketEvent')
+    events = list(MarketEvent.objects.only('id', 'event_date', 'duration'))
+    for event in events:
+        event.ends_at = event.event_date + timedelta(minutes=event.duration)
+    MarketEvent.objects.bulk_update(events, ['ends_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketevent',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='marketevent',
+            name='event_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='marketevent',
+            index=models.Index(fields=['ends_at', 'event_date'], name='market_event_window_idx'),
+        ),
+        migrations.RunPython(backfill_ends_at, migrations.RunPython.noop),
+    ]
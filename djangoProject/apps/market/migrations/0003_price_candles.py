@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0002_marketevent_ends_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('close', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='HourCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('close', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MinuteCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('close', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockpricehistory',
+            index=models.Index(fields=['company', 'date'], name='stock_history_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockpricehistory',
+            index=models.Index(fields=['date'], name='stock_history_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='daycandle',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_candles', to='market.company'),
+        ),
+        migrations.AddField(
+            model_name='hourcandle',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hour_candles', to='market.company'),
+        ),
+        migrations.AddField(
+            model_name='minutecandle',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='minute_candles', to='market.company'),
+        ),
+        migrations.AddIndex(
+            model_name='daycandle',
+            index=models.Index(fields=['bucket_start'], name='day_candle_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='daycandle',
+            unique_together={('company', 'bucket_start')},
+        ),
+        migrations.AddIndex(
+            model_name='hourcandle',
+            index=models.Index(fields=['bucket_start'], name='hour_candle_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hourcandle',
+            unique_together={('company', 'bucket_start')},
+        ),
+        migrations.AddIndex(
+            model_name='minutecandle',
+            index=models.Index(fields=['bucket_start'], name='minute_candle_bucket_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='minutecandle',
+            unique_together={('company', 'bucket_start')},
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_positions(apps, schema_editor):
+    Investment = apps.get_model('market', 'Investment')
+    Position = apps.get_model('market', 'Position')
+    totals = {}
+    for user_id, company_id, shares, price in Investment.objects.values_list(
+            'user_id', 'company_id', 'shares', 'purchase_price'):
+        position = totals.setdefault((user_id, company_id), [0, Decimal('0.00')])
+        position[0] += shares
+        position[1] += price * shares
+    Position.objects.bulk_create([
+        Position(user_id=user_id, company_id=company_id, shares=shares, cost_basis=cost)
+        for (user_id, company_id), (shares, cost) in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0004_leaderboard_entry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Position',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shares', models.PositiveIntegerField(default=0)),
+                ('cost_basis', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='market.company')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='positions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'company')},
+            },
+        ),
+        migrations.RunPython(backfill_positions, migrations.RunPython.noop),
+    ]
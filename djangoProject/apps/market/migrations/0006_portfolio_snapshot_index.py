@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_position'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='portfoliosnapshot',
+            index=models.Index(fields=['user', 'timestamp'], name='portfolio_snapshot_user_ts_idx'),
+        ),
+    ]
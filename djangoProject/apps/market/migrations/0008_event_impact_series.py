@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:58
+
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.db import migrations, models
+
+INTERVALS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+
+def backfill_event_impacts(apps, schema_editor):
+    MarketEvent = apps.get_model('market', 'MarketEvent')
+    EventImpactBucket = apps.get_model('market', 'EventImpactBucket')
+    events = list(MarketEvent.objects.order_by('event_date').values_list('event_date', 'impact_factor'))
+    buckets = []
+    for interval, seconds in INTERVALS.items():
+        cumulative = Decimal('0.00')
+        current = None
+        for event_date, impact in events:
+            start = datetime.fromtimestamp(int(event_date.timestamp()) // seconds * seconds, tz=timezone.utc)
+            if current is None or current.bucket_start != start:
+                current = EventImpactBucket(interval=interval, bucket_start=start)
+                buckets.append(current)
+            cumulative += impact
+            current.event_count += 1
+            current.impact += impact
+            current.cumulative_impact = cumulative
+    EventImpactBucket.objects.bulk_create(buckets, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0007_portfolio_snapshot_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventImpactBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(max_length=2)),
+                ('bucket_start', models.DateTimeField()),
+                ('event_count', models.PositiveIntegerField(default=0)),
+                ('impact', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('cumulative_impact', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'unique_together': {('interval', 'bucket_start')},
+            },
+        ),
+        migrations.RunPython(backfill_event_impacts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0008_event_impact_series'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_read', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['price_low_since'], name='company_price_low_since_idx'),
+        ),
+        migrations.AddField(
+            model_name='marketnotification',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='market.company'),
+        ),
+        migrations.AddField(
+            model_name='marketnotification',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='market_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='marketnotification',
+            index=models.Index(fields=['user', 'is_read'], name='market_notification_unread_idx'),
+        ),
+    ]
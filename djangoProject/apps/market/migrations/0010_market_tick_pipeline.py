@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0009_low_price_resets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('owner', models.CharField(blank=True, max_length=32)),
+                ('expires_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MarketTickLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('ok', 'OK'), ('failed', 'Failed'), ('overlap', 'Skipped, previous tick still running')], default='ok', max_length=7)),
+                ('stages', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['started_at'], name='market_tick_log_started_idx')],
+            },
+        ),
+    ]
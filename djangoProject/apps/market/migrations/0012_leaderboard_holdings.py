@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_holdings(apps, schema_editor):
+    from apps.market.leaderboard import SHARES, lots_held
+
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Investment = apps.get_model('market', 'Investment')
+    LeaderboardEntry = apps.get_model('market', 'LeaderboardEntry')
+    holdings = {
+        user_id: (shares, lots)
+        for user_id, shares, lots in User.objects.filter(leaderboard_entry__isnull=False)
+        .annotate(shares=SHARES, lots=lots_held(Investment.objects)).values_list('id', 'shares', 'lots')
+    }
+    entries = list(LeaderboardEntry.objects.all())
+    for entry in entries:
+        entry.total_shares, entry.total_investments = holdings.get(entry.user_id, (0, 0))
+    LeaderboardEntry.objects.bulk_update(entries, ['total_shares', 'total_investments'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0011_append_only_trade_journal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='total_investments',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='total_shares',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_holdings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:10
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_missing_ends_at(apps, schema_editor):
+    # Events bulk-created without going through save() since 0002 ran
+    MarketEvent = apps.get_model('market', 'MarketEvent')
+    events = list(MarketEvent.objects.filter(ends_at__isnull=True).only('id', 'event_date', 'duration'))
+    for event in events:
+        event.ends_at = event.event_date + timedelta(minutes=event.duration)
+    MarketEvent.objects.bulk_update(events, ['ends_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0012_leaderboard_holdings'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_missing_ends_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='marketevent',
+            name='ends_at',
+            field=models.DateTimeField(editable=False),
+        ),
+    ]
@@ -16,6 +16,12 @@ class Company(models.Model):
     sector = models.CharField(max_length=255, blank=True, null=True)
     price_low_since = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Companies due for a low-price reset are looked up by when they crossed the threshold
+            models.Index(fields=['price_low_since'], name='company_price_low_since_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -38,32 +44,84 @@ class Investment(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.company.name} ({self.shares} shares)"
 
+class Position(models.Model):
+    """
+    A user's aggregated holding in one company. The Investment lots remain the
+    FIFO detail; positions.py keeps this row in sync with them.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='positions')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='positions')
+    shares = models.PositiveIntegerField(default=0)
+    # Total purchase cost of the lots still held
+    cost_basis = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'company')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.company.name} ({self.shares} shares)"
+
+class MarketEventQuerySet(models.QuerySet):
+    def active(self, at=None):
+        """Events that have started and not yet ended at `at` (defaults to now)."""
+        at = at or timezone.now()
+        return self.filter(ends_at__gt=at, event_date__lte=at)
+
+    def impact_by_company(self, at=None):
+        """
+        Returns {company_id: summed impact_factor} for the events active at `at`,
+        computed with one grouped query on the companies_affected through table.
+        """
+        at = at or timezone.now()
+        through = self.model.companies_affected.through
+        rows = (
+            through.objects
+            .filter(marketevent__in=self.active(at))
+            .values('company_id')
+            .annotate(total_impact=models.Sum('marketevent__impact_factor'))
+            .values_list('company_id', 'total_impact')
+        )
+        return dict(rows)
+
+
 class MarketEvent(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
-    event_date = models.DateTimeField(auto_now_add=True)
+    event_date = models.DateTimeField(default=timezone.now, editable=False)
     impact_factor = models.DecimalField(max_digits=4, decimal_places=2, default=Decimal('0.00'))
     duration = models.PositiveIntegerField(default=60)  # in minutes
+    # Stored end of the event window so "is this event active" can be asked in SQL
+    ends_at = models.DateTimeField(editable=False)
     companies_affected = models.ManyToManyField(Company, related_name="market_events")
 
+    objects = MarketEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ends_at', 'event_date'], name='market_event_window_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.ends_at = self.event_date + timedelta(minutes=self.duration)
+        super().save(*args, **kwargs)
+
     def get_time_left(self):
-        end_time = self.event_date + timedelta(minutes=self.duration)
         now = timezone.now()
-        if now < end_time:
-            remaining = end_time - now
+        if now < self.ends_at:
+            remaining = self.ends_at - now
             minutes = int(remaining.total_seconds() // 60)
             return f"{minutes} minutes left"
         else:
             return "Expired"
 
     def is_active(self):
-        end_time = self.event_date + timedelta(minutes=self.duration)
-        return timezone.now() < end_time
+        return timezone.now() < self.ends_at
 
     @property
     def end_timestamp(self):
-        # Convert event_date to Unix timestamp and add duration (converted to seconds)
-        return int(self.event_date.timestamp() + self.duration * 60)
+        # Unix timestamp of the end of the event window
+        return int(self.ends_at.timestamp())
 
     def __str__(self):
         return self.title
@@ -74,10 +132,65 @@ class StockPriceHistory(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'date'], name='stock_history_company_date_idx'),
+            models.Index(fields=['date'], name='stock_history_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.company.name} at {self.date}: ${self.price}"
 
+class PriceCandle(models.Model):
+    """OHLC rollup of StockPriceHistory ticks for one company over one time bucket."""
+    bucket_start = models.DateTimeField()
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    high = models.DecimalField(max_digits=10, decimal_places=2)
+    low = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        abstract = True
+        unique_together = ('company', 'bucket_start')
+        ordering = ['bucket_start']
+
+    def __str__(self):
+        return f"{self.company_id} at {self.bucket_start}: O{self.open} H{self.high} L{self.low} C{self.close}"
+
+
+class MinuteCandle(PriceCandle):
+    company = models.ForeignKey('Company', on_delete=models.CASCADE, related_name="minute_candles")
+
+    class Meta(PriceCandle.Meta):
+        indexes = [models.Index(fields=['bucket_start'], name='minute_candle_bucket_idx')]
+
+
+class HourCandle(PriceCandle):
+    company = models.ForeignKey('Company', on_delete=models.CASCADE, related_name="hour_candles")
+
+    class Meta(PriceCandle.Meta):
+        indexes = [models.Index(fields=['bucket_start'], name='hour_candle_bucket_idx')]
+
+
+class DayCandle(PriceCandle):
+    company = models.ForeignKey('Company', on_delete=models.CASCADE, related_name="day_candles")
+
+    class Meta(PriceCandle.Meta):
+        indexes = [models.Index(fields=['bucket_start'], name='day_candle_bucket_idx')]
+
+
+class TransactionQuerySet(models.QuerySet):
+    """The trade journal is append-only: rows are written in bulk and never changed or removed."""
+
+    def update(self, **kwargs):
+        raise TypeError("Transactions are append-only and cannot be updated.")
+
+    def delete(self):
+        raise TypeError("Transactions are append-only and cannot be deleted.")
+
+
 class Transaction(models.Model):
+    """One filled trade in the append-only journal, written in batches by journal.py."""
     TRANSACTION_TYPES = (
         ('buy', 'Buy'),
         ('sell', 'Sell'),
@@ -88,19 +201,151 @@ class Transaction(models.Model):
     shares = models.PositiveIntegerField()
     price_per_share = models.DecimalField(max_digits=10, decimal_places=2)
     total = models.DecimalField(max_digits=12, decimal_places=2)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the trade fills; the row itself may be written a little later
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-timestamp', '-id'], name='transaction_user_ts_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError("Transactions are append-only and cannot be updated.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise TypeError("Transactions are append-only and cannot be deleted.")
 
     def __str__(self):
         return f"{self.user.username} {self.transaction_type} {self.shares} shares of {self.company.name} at {self.timestamp}"
 
+class EventImpactBucket(models.Model):
+    """
+    Pre-aggregated market event impact per time bucket, appended to as events
+    are generated (see event_impact.py). `cumulative_impact` is the running
+    total of every event's impact_factor up to the end of the bucket.
+    """
+    interval = models.CharField(max_length=2)
+    bucket_start = models.DateTimeField()
+    event_count = models.PositiveIntegerField(default=0)
+    impact = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    cumulative_impact = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = ('interval', 'bucket_start')
+        ordering = ['bucket_start']
+
+    def __str__(self):
+        return f"{self.interval} at {self.bucket_start}: {self.impact} (cumulative {self.cumulative_impact})"
+
+class MarketNotification(models.Model):
+    """A message to a player about something the market did to their holdings, e.g. a stock reset."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='market_notifications')
+    company = models.ForeignKey('Company', on_delete=models.CASCADE, related_name='notifications')
+    message = models.CharField(max_length=255)
+    created_at = models.DateTimeField(default=timezone.now)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read'], name='market_notification_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.message}"
+
 class PortfolioSnapshot(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='portfolio_snapshots')
     total_value = models.DecimalField(max_digits=12, decimal_places=2)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='portfolio_snapshot_user_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - ${self.total_value} at {self.timestamp}"
 
+class PortfolioSnapshotRollup(models.Model):
+    """Downsampled portfolio value: the last snapshot in each hour or day bucket (see snapshots.py)."""
+    HOUR = 'hour'
+    DAY = 'day'
+    RESOLUTION_CHOICES = [(HOUR, 'Hourly'), (DAY, 'Daily')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='portfolio_rollups')
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    timestamp = models.DateTimeField()
+    total_value = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        unique_together = ('user', 'resolution', 'timestamp')
+        indexes = [
+            models.Index(fields=['resolution', 'timestamp'], name='portfolio_rollup_res_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - ${self.total_value} ({self.resolution}) at {self.timestamp}"
+
+class LeaderboardEntry(models.Model):
+    """Materialized market standings per user, kept current by trades and price ticks (see leaderboard.py)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='leaderboard_entry')
+    portfolio_value = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    green_impact = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    # Investment lots and shares currently held
+    total_investments = models.PositiveIntegerField(default=0)
+    total_shares = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-green_impact', 'user'], name='leaderboard_green_idx'),
+            models.Index(fields=['-portfolio_value', 'user'], name='leaderboard_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: ${self.portfolio_value} / {self.green_impact} green"
+
+class MarketTickLog(models.Model):
+    """
+    One run of the market tick pipeline (see pipeline.py). `stages` maps each
+    stage name to {"seconds": wall time, "work": items processed}, or to
+    {"skipped": true} when the stage had nothing to do.
+    """
+    OK = 'ok'
+    FAILED = 'failed'
+    OVERLAP = 'overlap'
+    STATUS_CHOICES = [(OK, 'OK'), (FAILED, 'Failed'), (OVERLAP, 'Skipped, previous tick still running')]
+
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=OK)
+    stages = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['started_at'], name='market_tick_log_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"Market tick at {self.started_at}: {self.status}"
+
+class MarketLock(models.Model):
+    """
+    A named lease held in the database, so only one process at a time runs
+    the work it guards. A holder that dies leaves the lease to expire.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=32, blank=True)
+    expires_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} held by {self.owner or 'nobody'} until {self.expires_at}"
+
 class Achievement(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
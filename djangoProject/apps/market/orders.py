@@ -0,0 +1,195 @@
+import itertools
+import logging
+import threading
+from collections import deque
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.market.journal import trade_journal
+from apps.market.models import Company, Transaction
+from apps.market.positions import buy_shares, sell_shares
+from apps.users.models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+BUY = 'buy'
+SELL = 'sell'
+
+# Orders executed per database transaction
+ORDER_BATCH_SIZE = 20
+
+
+class Order:
+    """
+    A request to buy or sell shares, and once executed its result: `filled`,
+    the `price` and gross `total` it traded at, the `net` amount debited or
+    credited, or the `error` it was rejected with.
+    """
+
+    def __init__(self, user, company, side, shares, tax_rate=Decimal('0.00')):
+        self.user = user
+        self.company = company
+        self.side = side
+        self.shares = shares
+        self.tax_rate = tax_rate
+        self.filled = False
+        self.error = None
+        self.price = None
+        self.total = None
+        self.net = None
+        # Position in the engine's queue, so a batch runs in submission order
+        self.sequence = None
+        self.done = threading.Event()
+
+    def reject(self, error):
+        self.filled = False
+        self.error = error
+
+
+def _fill_buy(order, price):
+    cost = price * order.shares
+    # Debit only if the balance covers the cost, in the same statement
+    debited = UserProfile.objects.filter(user=order.user, currency_balance__gte=cost).update(
+        currency_balance=F('currency_balance') - cost, total_transactions=F('total_transactions') + 1,
+    )
+    if not debited:
+        order.reject("Insufficient funds to make this investment.")
+        return
+    buy_shares(order.user, order.company, order.shares, price)
+    order.net = cost
+
+
+def _fill_sell(order, price):
+    if sell_shares(order.user, order.company, order.shares) is None:
+        order.reject("You cannot sell more shares than you own.")
+        return
+    gross = price * order.shares
+    order.net = (gross - gross * order.tax_rate).quantize(Decimal('0.01'))
+    UserProfile.objects.filter(user=order.user).update(
+        currency_balance=F('currency_balance') + order.net, total_transactions=F('total_transactions') + 1,
+    )
+
+
+def execute_batch(orders):
+    """
+    Executes a batch of orders in one transaction, in submission order.
+
+    Prices are read once for the whole batch, balances are changed with
+    conditional UPDATEs so concurrent trades (including ones from other
+    processes) can never overdraw or lose an update, each order runs in its
+    own savepoint so a failure only rejects that order, and the Transaction
+    rows of every filled order are handed to the write-behind trade journal
+    once the batch has committed.
+    """
+    with transaction.atomic():
+        prices = dict(Company.objects.filter(pk__in={o.company.pk for o in orders})
+                      .values_list('pk', 'current_stock_price'))
+        journal = []
+        for order in orders:
+            price = prices.get(order.company.pk)
+            if price is None:
+                order.reject("This company no longer exists.")
+                continue
+            try:
+                with transaction.atomic():
+                    order.error = None
+                    order.price = price
+                    order.total = price * order.shares
+                    if order.side == BUY:
+                        _fill_buy(order, price)
+                    else:
+                        _fill_sell(order, price)
+                    order.filled = order.error is None
+            except Exception:
+                logger.exception("Order %s %s x%s failed", order.side, order.company.pk, order.shares)
+                order.reject("The order could not be executed.")
+                continue
+            if order.filled:
+                journal.append(Transaction(user=order.user, company=order.company, transaction_type=order.side,
+                                           shares=order.shares, price_per_share=price, total=order.total,
+                                           timestamp=timezone.now()))
+        if journal:
+            transaction.on_commit(lambda: trade_journal.record(journal))
+    return orders
+
+
+def execute_orders(orders):
+    """
+    Executes orders with execute_batch. Should the batch as a whole fail, its
+    transaction is rolled back and each order is retried in a transaction of
+    its own, so one bad order is rejected alone rather than with its batch.
+    Marks every order done.
+    """
+    try:
+        execute_batch(orders)
+    except Exception:
+        logger.exception("Order batch of %d failed; retrying its orders one at a time", len(orders))
+        for order in orders:
+            try:
+                execute_batch([order])
+            except Exception:
+                logger.exception("Order %s x%s failed", order.side, order.shares)
+                order.reject("The order could not be executed.")
+    finally:
+        for order in orders:
+            order.done.set()
+    return orders
+
+
+class OrderEngine:
+    """
+    Queues orders from concurrent requests and executes them in batches.
+
+    A thread that finds the engine idle executes its own order together with
+    at most `batch_size - 1` of the oldest orders queued by other threads, in
+    submission order and one transaction. The other threads wait on a
+    condition until their order is done or the engine is free, and then run
+    it themselves, so no request executes more than one batch. A caller
+    inside an atomic block could still roll back whatever it executes, so
+    its order runs alone in that transaction and never joins a batch.
+    Batching only happens within a process; correctness across processes
+    comes from the conditional updates in execute_batch.
+    """
+
+    def __init__(self, batch_size=ORDER_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = deque()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._executing = False
+
+    def submit(self, order):
+        """Queues an order and blocks until it has been executed. Returns the order."""
+        if connection.in_atomic_block:
+            # Other players' orders must never be undone by this caller's rollback
+            return execute_orders([order])[0]
+        with self._idle:
+            order.sequence = next(self._sequence)
+            self._queue.append(order)
+            while self._executing and not order.done.is_set():
+                self._idle.wait()
+            if order.done.is_set():
+                return order
+            self._executing = True
+            self._queue.remove(order)
+            batch = [order] + [self._queue.popleft() for _ in range(min(self.batch_size - 1, len(self._queue)))]
+        batch.sort(key=lambda queued: queued.sequence)
+        try:
+            execute_orders(batch)
+        finally:
+            with self._idle:
+                self._executing = False
+                self._idle.notify_all()
+        return order
+
+
+order_engine = OrderEngine()
+
+
+def place_order(user, company, side, shares, tax_rate=Decimal('0.00')):
+    """Submits a buy or sell order to the shared engine and returns it once executed."""
+    return order_engine.submit(Order(user, company, side, shares, tax_rate))
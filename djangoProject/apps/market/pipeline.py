@@ -0,0 +1,197 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import Max
+from django.utils import timezone
+
+from apps.market.analytics import DEFAULT_INTERVAL, cached_market_analytics
+from apps.market.leaderboard import refresh_leaderboard
+from apps.market.models import MarketEvent, MarketLock, MarketTickLog, Transaction
+from apps.market.price_engine import run_price_tick
+from apps.market.resets import reset_low_value_stocks
+from apps.market.snapshots import record_portfolio_snapshots
+
+logger = logging.getLogger(__name__)
+
+TICK_LOCK_NAME = 'market_tick'
+# A tick still holding the lock after this long is assumed dead and its lease is taken over
+LOCK_TTL = timedelta(minutes=5)
+# Seconds between ticks, used by the beat entry and the local scheduler
+DEFAULT_TICK_INTERVAL = 30.0
+# A new batch of market events is generated once the latest is this old
+DEFAULT_EVENT_INTERVAL = timedelta(seconds=60)
+TICK_LOG_RETENTION = timedelta(days=1)
+
+
+def get_tick_interval():
+    return float(getattr(settings, 'MARKET_TICK_INTERVAL', DEFAULT_TICK_INTERVAL))
+
+
+def get_event_interval():
+    return getattr(settings, 'MARKET_EVENT_INTERVAL', DEFAULT_EVENT_INTERVAL)
+
+
+@contextmanager
+def database_lock(name, ttl=LOCK_TTL):
+    """
+    Takes the named MarketLock lease with one conditional UPDATE, so it works
+    across processes on any database. Yields whether the lease was acquired;
+    it is released on exit only if this holder still owns it.
+    """
+    owner = uuid.uuid4().hex
+    now = timezone.now()
+    MarketLock.objects.get_or_create(name=name, defaults={'expires_at': now})
+    acquired = MarketLock.objects.filter(name=name, expires_at__lte=now).update(owner=owner, expires_at=now + ttl)
+    try:
+        yield bool(acquired)
+    finally:
+        if acquired:
+            MarketLock.objects.filter(name=name, owner=owner).update(owner='', expires_at=timezone.now())
+
+
+class TickState:
+    """What the stages of one tick hand on to the stages after them."""
+
+    def __init__(self, now, since):
+        self.now = now
+        # When the previous tick started, or None on the first tick
+        self.since = since
+        self.tick = None
+        self.resets = []
+
+
+def _prices(state):
+    state.tick = run_price_tick(now=state.now)
+    return int(state.tick.changed().sum())
+
+
+def _event_generation(state):
+    """
+    Starts a new batch of market events once the latest is get_event_interval()
+    old. There is no expiry step: an event's window end is stored in ends_at,
+    the price stage only applies events active at the tick, and expired events
+    stay listed (as expired) on the market page. The impact series counts
+    events when they start, so expiry leaves it unchanged.
+    """
+    latest = MarketEvent.objects.aggregate(latest=Max('event_date'))['latest']
+    if latest is not None and state.now - latest < get_event_interval():
+        return None
+    call_command('generate_market_events', stdout=StringIO())
+    return MarketEvent.objects.filter(event_date__gte=state.now).count()
+
+
+def _resets(state):
+    if not state.tick.below_threshold().any():
+        return None
+    state.resets = reset_low_value_stocks(state.tick.timestamp)
+    for company_id, name, shares in state.resets:
+        logger.info("Reset %s and removed %d shares.", name, shares)
+    return len(state.resets)
+
+
+def _values_changed(state):
+    """Portfolio values only move with prices, resets or trades."""
+    if state.tick.changed().any() or state.resets:
+        return True
+    return state.since is None or Transaction.objects.filter(timestamp__gte=state.since).exists()
+
+
+def _snapshots(state):
+    if not _values_changed(state):
+        return None
+    written, skipped, elapsed = record_portfolio_snapshots()
+    return written
+
+
+def _leaderboard(state):
+    # Trades refresh their own player's entry, so only market-wide moves need a full refresh
+    if not (state.tick.changed().any() or state.resets):
+        return None
+    return refresh_leaderboard()
+
+
+def _analytics(state):
+    # Computed here once per tick so requests are served from the cache
+    if not (state.tick.changed().any() or state.resets):
+        return None
+    return len(cached_market_analytics(DEFAULT_INTERVAL)['companies'])
+
+
+# Run in this order: each stage reads what the ones before it wrote
+STAGES = [
+    ('prices', _prices),
+    ('event_generation', _event_generation),
+    ('resets', _resets),
+    ('snapshots', _snapshots),
+    ('leaderboard', _leaderboard),
+    ('analytics', _analytics),
+]
+
+
+def run_market_tick(now=None):
+    """
+    Runs one market tick: prices, event generation, resets, portfolio
+    snapshots, the leaderboard and market analytics, in that order, under a
+    database lock so ticks never overlap. Stages with nothing to do are
+    skipped. Each run is recorded in MarketTickLog with per-stage timings.
+    Returns the log entry.
+    """
+    now = now or timezone.now()
+    with database_lock(TICK_LOCK_NAME) as acquired:
+        if not acquired:
+            logger.warning("Market tick skipped: the previous tick is still running.")
+            return MarketTickLog.objects.create(started_at=now, finished_at=now, status=MarketTickLog.OVERLAP)
+
+        previous = (MarketTickLog.objects.filter(status=MarketTickLog.OK, started_at__lt=now)
+                    .aggregate(latest=Max('started_at'))['latest'])
+        state = TickState(now, previous)
+        log = MarketTickLog(started_at=now)
+        try:
+            for name, stage in STAGES:
+                started = time.perf_counter()
+                work = stage(state)
+                if work is None:
+                    log.stages[name] = {'skipped': True}
+                else:
+                    log.stages[name] = {'seconds': round(time.perf_counter() - started, 6), 'work': work}
+        except Exception as e:
+            log.status = MarketTickLog.FAILED
+            log.error = f"{name}: {e!r}"
+            raise
+        finally:
+            log.finished_at = timezone.now()
+            log.save()
+            MarketTickLog.objects.filter(started_at__lt=now - TICK_LOG_RETENTION).delete()
+    return log
+
+
+def run_local_scheduler(interval=None, count=None, on_tick=None):
+    """
+    Drives run_market_tick in this process every `interval` seconds, for when
+    no Celery broker is running. Stops after `count` ticks if given. A tick
+    that overruns the interval delays the next one rather than queueing
+    several back to back.
+    """
+    interval = interval or get_tick_interval()
+    runs = 0
+    next_run = time.monotonic()
+    while count is None or runs < count:
+        delay = next_run - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            log = run_market_tick()
+        except Exception:
+            logger.exception("Market tick failed")
+            log = None
+        runs += 1
+        if on_tick is not None:
+            on_tick(log)
+        next_run = max(next_run + interval, time.monotonic())
+    return runs
@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from apps.market.models import Investment, Position
+
+
+def buy_shares(user, company, shares, price):
+    """
+    Records a new FIFO lot and adds it to the user's position in the same
+    transaction. Returns the new Investment.
+    """
+    cost = price * shares
+    with transaction.atomic():
+        investment = Investment.objects.create(user=user, company=company, shares=shares, purchase_price=price)
+        updated = Position.objects.filter(user=user, company=company).update(
+            shares=F('shares') + shares, cost_basis=F('cost_basis') + cost
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    Position.objects.create(user=user, company=company, shares=shares, cost_basis=cost)
+            except IntegrityError:
+                # Another request opened the position first
+                Position.objects.filter(user=user, company=company).update(
+                    shares=F('shares') + shares, cost_basis=F('cost_basis') + cost
+                )
+    return investment
+
+
+def sell_shares(user, company, shares):
+    """
+    Sells `shares` from the user's oldest lots first and reduces the position
+    by their cost, all in one transaction. Returns the cost basis sold, or
+    None if the user does not hold enough shares.
+    """
+    with transaction.atomic():
+        position = Position.objects.select_for_update().filter(user=user, company=company).first()
+        if position is None or position.shares < shares:
+            return None
+
+        sold_cost = Decimal('0.00')
+        remaining = shares
+        emptied = []
+        for lot in Investment.objects.select_for_update().filter(user=user, company=company).order_by('id'):
+            if remaining <= 0:
+                break
+            if lot.shares <= remaining:
+                remaining -= lot.shares
+                sold_cost += lot.purchase_price * lot.shares
+                emptied.append(lot.pk)
+            else:
+                lot.shares -= remaining
+                sold_cost += lot.purchase_price * remaining
+                lot.save(update_fields=['shares'])
+                remaining = 0
+        Investment.objects.filter(pk__in=emptied).delete()
+
+        if position.shares == shares:
+            position.delete()
+        else:
+            Position.objects.filter(pk=position.pk).update(
+                shares=F('shares') - shares, cost_basis=F('cost_basis') - sold_cost
+            )
+    return sold_cost
+
+
+def close_company_positions(company):
+    """Removes every lot and position in a company, e.g. when its stock is reset."""
+    with transaction.atomic():
+        Investment.objects.filter(company=company).delete()
+        Position.objects.filter(company=company).delete()
@@ -0,0 +1,87 @@
+import logging
+
+from django.core.cache import caches
+
+from apps.market.models import Company
+
+logger = logging.getLogger(__name__)
+
+PRICE_CACHE_ALIAS = 'market_prices'
+CURRENT_TICK_KEY = 'market:prices:current'
+# Snapshots outlive a few ticks so readers holding an older tick number still find theirs
+SNAPSHOT_TIMEOUT = 300
+
+
+def _cache():
+    return caches[PRICE_CACHE_ALIAS]
+
+
+def tick_number(timestamp):
+    """Identifies a tick by its timestamp in microseconds, which only ever increases."""
+    return int(timestamp.timestamp() * 1_000_000)
+
+
+def _snapshot_key(number):
+    return f'market:prices:tick:{number}'
+
+
+def publish_price_snapshot(timestamp, prices):
+    """
+    Stores a tick's (company_id, price) pairs under its tick number, then
+    points readers at it. Readers never see a half-written snapshot, and a new
+    tick invalidates the previous one just by moving the pointer.
+    """
+    number = tick_number(timestamp)
+    cache = _cache()
+    try:
+        cache.set(_snapshot_key(number), dict(prices), SNAPSHOT_TIMEOUT)
+        cache.set(CURRENT_TICK_KEY, number, SNAPSHOT_TIMEOUT)
+    except Exception as e:
+        # Readers fall back to the database, so a cache outage must never fail the tick
+        logger.error("Error publishing price snapshot: %s", e)
+    return number
+
+
+def invalidate_price_snapshot():
+    """Sends readers back to the database until the next tick, e.g. after prices were reset outside a tick."""
+    _cache().delete(CURRENT_TICK_KEY)
+
+
+def get_price_snapshot():
+    """Returns (tick number, {company_id: price}) for the latest tick, or None on a miss."""
+    cache = _cache()
+    number = cache.get(CURRENT_TICK_KEY)
+    if number is None:
+        return None
+    prices = cache.get(_snapshot_key(number))
+    if prices is None:
+        return None
+    return number, prices
+
+
+def current_prices(company_ids):
+    """
+    Returns {company_id: current price} for the given companies from the
+    latest snapshot, reading only companies missing from it from the database.
+    """
+    company_ids = set(company_ids)
+    snapshot = get_price_snapshot()
+    cached = snapshot[1] if snapshot else {}
+    prices = {pk: cached[pk] for pk in company_ids if pk in cached}
+    missing = company_ids - prices.keys()
+    if missing:
+        prices.update(Company.objects.filter(pk__in=missing).values_list('pk', 'current_stock_price'))
+    return prices
+
+
+def apply_current_prices(companies):
+    """
+    Fills in current_stock_price on Company instances loaded with
+    .defer('current_stock_price'). Returns the companies.
+    """
+    companies = list(companies)
+    prices = current_prices(c.pk for c in companies)
+    for company in companies:
+        if company.pk in prices:
+            company.current_stock_price = prices[company.pk]
+    return companies
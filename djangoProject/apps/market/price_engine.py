@@ -0,0 +1,120 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from apps.market.broadcast import publish_price_tick
+from apps.market.models import Company, MarketEvent, StockPriceHistory
+from apps.market.price_cache import publish_price_snapshot
+from apps.market.rollups import record_tick
+
+# Base fluctuation: random change between -1.5% and +1.5% per tick
+BASE_VOLATILITY = 0.015
+# Mean reversion pulls prices back towards the target price
+TARGET_PRICE = 100.0
+MEAN_REVERSION_STRENGTH = 0.01  # 1% correction factor
+# Prices never drop below this floor
+MIN_PRICE = 1.00
+# Below this price a company is flagged with price_low_since (see Company.save)
+LOW_PRICE_THRESHOLD = Decimal('1.50')
+
+
+class PriceTick:
+    """The outcome of one price engine run, one entry per company."""
+
+    def __init__(self, timestamp, company_ids, old_prices, new_prices,
+                 base_changes, mean_reversions, event_impacts):
+        self.timestamp = timestamp
+        self.company_ids = company_ids
+        self.old_prices = old_prices
+        self.new_prices = new_prices
+        self.base_changes = base_changes
+        self.mean_reversions = mean_reversions
+        self.event_impacts = event_impacts
+
+    def __len__(self):
+        return len(self.company_ids)
+
+    def changed(self):
+        """Returns a boolean mask of the companies whose price moved this tick."""
+        return self.old_prices != self.new_prices
+
+    def below_threshold(self):
+        """Returns a boolean mask of the companies priced below LOW_PRICE_THRESHOLD after this tick."""
+        return self.new_prices < float(LOW_PRICE_THRESHOLD)
+
+    def crossed_below(self):
+        """Returns a boolean mask of the companies that fell below LOW_PRICE_THRESHOLD this tick."""
+        return self.below_threshold() & (self.old_prices >= float(LOW_PRICE_THRESHOLD))
+
+
+def active_event_impacts(company_ids, now):
+    """
+    Returns the summed impact_factor of the events active at `now` for each
+    company, aligned with `company_ids`.
+    """
+    impacts = np.zeros(len(company_ids))
+    by_company = MarketEvent.objects.impact_by_company(at=now)
+    if not by_company:
+        return impacts
+
+    affected = np.fromiter(by_company.keys(), dtype=np.int64, count=len(by_company))
+    totals = np.fromiter((float(v) for v in by_company.values()), dtype=float, count=len(by_company))
+    known = np.isin(affected, company_ids)
+    impacts[np.searchsorted(company_ids, affected[known])] = totals[known]
+    return impacts
+
+
+def _to_decimal(values):
+    return [Decimal(str(float(v))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) for v in values]
+
+
+def run_price_tick(now=None, rng=None):
+    """
+    Moves every company's stock price by one tick.
+
+    Prices and active event impacts are loaded in one pass, the base move,
+    mean reversion and event impact are computed for all companies at once
+    and the results are written back with one bulk_update and one
+    bulk_create, then folded into the OHLC candle tables, published to the
+    shared price cache and broadcast to websocket clients.
+    """
+    now = now or timezone.now()
+    rng = rng or np.random.default_rng()
+
+    companies = list(
+        Company.objects.only('id', 'name', 'current_stock_price', 'price_low_since').order_by('id')
+    )
+    company_ids = np.array([c.pk for c in companies], dtype=np.int64)
+    old_prices = np.array([float(c.current_stock_price) for c in companies])
+
+    base_changes = rng.uniform(-BASE_VOLATILITY, BASE_VOLATILITY, len(companies)).round(4)
+    mean_reversions = (TARGET_PRICE - old_prices) / TARGET_PRICE * MEAN_REVERSION_STRENGTH
+    event_impacts = active_event_impacts(company_ids, now)
+
+    net_change = base_changes + mean_reversions + event_impacts
+    new_prices = np.maximum((old_prices * (1.0 + net_change)).round(2), MIN_PRICE)
+
+    history = []
+    for company, price in zip(companies, _to_decimal(new_prices)):
+        company.current_stock_price = price
+        # Record when the price crossed the threshold; resets.py picks up companies that stay below it
+        if price < LOW_PRICE_THRESHOLD:
+            company.price_low_since = company.price_low_since or now
+        else:
+            company.price_low_since = None
+        history.append(StockPriceHistory(company=company, price=price))
+
+    with transaction.atomic():
+        Company.objects.bulk_update(companies, ['current_stock_price', 'price_low_since'], batch_size=500)
+        StockPriceHistory.objects.bulk_create(history, batch_size=500)
+        record_tick(now, ((c.pk, c.current_stock_price) for c in companies))
+
+    tick = PriceTick(now, company_ids, old_prices, new_prices,
+                     base_changes, mean_reversions, event_impacts)
+    snapshot = [(c.pk, c.current_stock_price) for c in companies]
+    # Once the new prices are visible, share them with every process and push them to websocket clients
+    transaction.on_commit(lambda: publish_price_snapshot(now, snapshot))
+    transaction.on_commit(lambda: publish_price_tick(tick))
+    return tick
@@ -0,0 +1,74 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from apps.market.broadcast import publish_price_tick
+from apps.market.models import Company, Investment, MarketNotification, Position, StockPriceHistory
+from apps.market.price_cache import invalidate_price_snapshot
+from apps.market.price_engine import LOW_PRICE_THRESHOLD, PriceTick
+from apps.market.rollups import record_tick
+
+# A stock that stays below LOW_PRICE_THRESHOLD for this long is reset
+THRESHOLD_DURATION = timedelta(minutes=2)
+# Price a reset stock starts again from
+RESET_PRICE = Decimal("100.00")
+
+
+def due_for_reset(now=None):
+    """Companies whose price has been below the threshold for at least THRESHOLD_DURATION."""
+    now = now or timezone.now()
+    return Company.objects.filter(price_low_since__lte=now - THRESHOLD_DURATION,
+                                  current_stock_price__lt=LOW_PRICE_THRESHOLD)
+
+
+def reset_low_value_stocks(now=None):
+    """
+    Resets every company that is due in one transaction: the holders are
+    notified with one bulk insert captured before their holdings go, then one
+    DELETE removes the lots, one the positions and one UPDATE resets the
+    prices. The new prices are written to the price history and candles and
+    broadcast like a price tick. The price engine records when each company
+    crossed the threshold (Company.price_low_since), so this only touches
+    companies being reset. Returns a list of (company id, company name,
+    shares removed).
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(due_for_reset(now).select_for_update().order_by('id')
+                    .values_list('id', 'name', 'current_stock_price'))
+        if not rows:
+            return []
+        due = {company_id: name for company_id, name, _ in rows}
+
+        holdings = list(Position.objects.filter(company_id__in=due).values_list('user_id', 'company_id', 'shares'))
+        MarketNotification.objects.bulk_create([
+            MarketNotification(
+                user_id=user_id, company_id=company_id, created_at=now,
+                message=(f"{due[company_id]} stayed below ${LOW_PRICE_THRESHOLD} and was reset to "
+                         f"${RESET_PRICE}. Your {shares} shares were removed."),
+            )
+            for user_id, company_id, shares in holdings
+        ], batch_size=500)
+
+        Investment.objects.filter(company_id__in=due).delete()
+        Position.objects.filter(company_id__in=due).delete()
+        Company.objects.filter(pk__in=due).update(current_stock_price=RESET_PRICE, price_low_since=None)
+        StockPriceHistory.objects.bulk_create(
+            [StockPriceHistory(company_id=company_id, price=RESET_PRICE) for company_id in due], batch_size=500)
+        record_tick(now, ((company_id, RESET_PRICE) for company_id in due))
+
+    company_ids = np.array(list(due), dtype=np.int64)
+    old_prices = np.array([float(price) for _, _, price in rows])
+    new_prices = np.full(len(rows), float(RESET_PRICE))
+    no_change = np.zeros(len(rows))
+    tick = PriceTick(now, company_ids, old_prices, new_prices, no_change, no_change, no_change)
+    # The cached tick snapshot still holds the old prices
+    transaction.on_commit(invalidate_price_snapshot)
+    transaction.on_commit(lambda: publish_price_tick(tick))
+    removed = {}
+    for _, company_id, shares in holdings:
+        removed[company_id] = removed.get(company_id, 0) + shares
+    return [(company_id, name, removed.get(company_id, 0)) for company_id, name in due.items()]
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from apps.market.models import StockPriceHistory, MinuteCandle, HourCandle, DayCandle
+
+# Candle tables keyed by interval name, finest first: (model, bucket size in seconds)
+CANDLE_INTERVALS = {
+    '1m': (MinuteCandle, 60),
+    '1h': (HourCandle, 3600),
+    '1d': (DayCandle, 86400),
+}
+
+DEFAULT_RETENTION = {
+    'raw': timedelta(days=1),
+    '1m': timedelta(days=7),
+    '1h': timedelta(days=365),
+    '1d': None,
+}
+
+
+def bucket_start(moment, seconds):
+    """Floors an aware datetime to the start of its UTC bucket."""
+    ts = int(moment.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+def record_tick(timestamp, prices):
+    """
+    Folds one price tick into every candle table.
+
+    `prices` is an iterable of (company_id, price) pairs. Each table costs one
+    select for the current bucket plus one bulk_update and one bulk_create.
+    """
+    prices = list(prices)
+    for model, seconds in CANDLE_INTERVALS.values():
+        start = bucket_start(timestamp, seconds)
+        existing = {c.company_id: c for c in model.objects.filter(bucket_start=start)}
+        to_create, to_update = [], []
+        for company_id, price in prices:
+            candle = existing.get(company_id)
+            if candle is None:
+                to_create.append(model(company_id=company_id, bucket_start=start,
+                                       open=price, high=price, low=price, close=price))
+            else:
+                candle.high = max(candle.high, price)
+                candle.low = min(candle.low, price)
+                candle.close = price
+                to_update.append(candle)
+        model.objects.bulk_update(to_update, ['high', 'low', 'close'], batch_size=500)
+        model.objects.bulk_create(to_create, batch_size=500)
+
+
+def _group_candles(company_ids, timestamps, prices, seconds):
+    """
+    Groups ticks sorted by (company, time) into OHLC candles.
+    Returns parallel arrays: company ids, bucket starts, open, high, low, close.
+    """
+    buckets = timestamps // seconds * seconds
+    boundaries = np.flatnonzero((np.diff(company_ids) != 0) | (np.diff(buckets) != 0)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(prices)])) - 1
+    return (company_ids[starts], buckets[starts], prices[starts],
+            np.maximum.reduceat(prices, starts), np.minimum.reduceat(prices, starts), prices[ends])
+
+
+def _first_whole_bucket(moment, seconds):
+    """Start of the first bucket that begins at or after `moment`."""
+    start = bucket_start(moment, seconds)
+    return start if start == moment else start + timedelta(seconds=seconds)
+
+
+def rebuild_candles(start=None, end=None):
+    """
+    Recomputes the candle tables from the raw ticks between `start` (default:
+    the earliest remaining tick) and `end`, widened to whole UTC days.
+
+    Raw ticks older than their retention may have been pruned after being
+    rolled up, so only buckets that lie wholly after both the earliest tick
+    and the raw retention horizon are deleted and rebuilt. Older buckets keep
+    their candles; ticks there only fill in candles that are missing. Returns
+    candles written per interval.
+    """
+    day_seconds = CANDLE_INTERVALS['1d'][1]
+    earliest = StockPriceHistory.objects.aggregate(earliest=Min('date'))['earliest']
+    if earliest is None:
+        return {interval: 0 for interval in CANDLE_INTERVALS}
+    start = max(bucket_start(start, day_seconds), earliest) if start else earliest
+    ticks = StockPriceHistory.objects.order_by('company_id', 'date').filter(date__gte=start)
+    candle_range = {}
+    if end:
+        end = bucket_start(end, day_seconds) + timedelta(seconds=day_seconds)
+        ticks = ticks.filter(date__lt=end)
+        candle_range['bucket_start__lt'] = end
+    complete_from = start
+    keep_raw = get_retention().get('raw')
+    if keep_raw is not None:
+        complete_from = max(complete_from, timezone.now() - keep_raw)
+
+    rows = list(ticks.values_list('company_id', 'date', 'price'))
+    company_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    timestamps = np.array([int(r[1].timestamp()) for r in rows], dtype=np.int64)
+    prices = np.array([float(r[2]) for r in rows])
+
+    written = {}
+    with transaction.atomic():
+        for interval, (model, seconds) in CANDLE_INTERVALS.items():
+            rebuild_from = _first_whole_bucket(complete_from, seconds)
+            model.objects.filter(bucket_start__gte=rebuild_from, **candle_range).delete()
+            if not rows:
+                written[interval] = 0
+                continue
+            existing = set(model.objects.filter(bucket_start__gte=bucket_start(start, seconds),
+                                                bucket_start__lt=rebuild_from)
+                           .values_list('company_id', 'bucket_start'))
+            candles = []
+            for company_id, bucket, o, h, l, c in zip(*_group_candles(company_ids, timestamps, prices, seconds)):
+                moment = datetime.fromtimestamp(int(bucket), tz=dt_timezone.utc)
+                if moment < rebuild_from and (int(company_id), moment) in existing:
+                    continue
+                candles.append(model(company_id=int(company_id), bucket_start=moment,
+                                     open=_price(o), high=_price(h), low=_price(l), close=_price(c)))
+            model.objects.bulk_create(candles, batch_size=500)
+            written[interval] = len(candles)
+    return written
+
+
+def _price(value):
+    return Decimal(str(round(float(value), 2))).quantize(Decimal('0.01'))
+
+
+def get_retention():
+    retention = dict(DEFAULT_RETENTION)
+    retention.update(getattr(settings, 'MARKET_PRICE_RETENTION', {}))
+    return retention
+
+
+def prune_price_history(now=None):
+    """
+    Applies the MARKET_PRICE_RETENTION policy to raw ticks and candle tables.
+
+    A row is only deleted once it is older than its level's retention and the
+    next coarser level has been rolling up since before it was written, so no
+    history is lost that has not been summarised. Returns rows deleted per level.
+    """
+    now = now or timezone.now()
+    retention = get_retention()
+    levels = [('raw', StockPriceHistory, 'date')] + [
+        (interval, model, 'bucket_start') for interval, (model, _) in CANDLE_INTERVALS.items()
+    ]
+
+    deleted = {}
+    for i, (level, model, field) in enumerate(levels):
+        keep_for = retention.get(level)
+        if keep_for is None:
+            continue
+        filters = {f'{field}__lt': now - keep_for}
+        if i + 1 < len(levels):
+            coarser = levels[i + 1][1]
+            rolled_up_since = coarser.objects.aggregate(first=Min('bucket_start'))['first']
+            if rolled_up_since is None:
+                continue
+            filters[f'{field}__gte'] = rolled_up_since
+        deleted[level], _ = model.objects.filter(**filters).delete()
+    return deleted
@@ -0,0 +1,207 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from apps.market.leaderboard import PORTFOLIO_VALUE
+from apps.market.models import PortfolioSnapshot, PortfolioSnapshotRollup
+from apps.market.rollups import bucket_start
+
+# Rollup tiers, finest first: (resolution, bucket size in seconds)
+ROLLUP_TIERS = [
+    (PortfolioSnapshotRollup.HOUR, 3600),
+    (PortfolioSnapshotRollup.DAY, 86400),
+]
+
+DEFAULT_RETENTION = {
+    'raw': timedelta(days=1),
+    PortfolioSnapshotRollup.HOUR: timedelta(days=30),
+    PortfolioSnapshotRollup.DAY: None,
+}
+
+# Rows deleted per transaction while pruning, so no write lock is held for long
+DELETE_BATCH_SIZE = 1000
+
+
+def record_portfolio_snapshots():
+    """
+    Snapshots every player's portfolio value. Values are computed with one
+    aggregate query over positions joined to companies, users whose value is
+    unchanged since their last snapshot are skipped, and the rest are written
+    with one bulk_create. Returns (rows written, users skipped, elapsed seconds).
+    """
+    started = time.perf_counter()
+    last_value = PortfolioSnapshot.objects.filter(user=OuterRef('pk')).order_by('-timestamp').values('total_value')[:1]
+    rows = (
+        User.objects.filter(userprofile__isnull=False)
+        .annotate(value=PORTFOLIO_VALUE, last_value=Subquery(last_value))
+        .values_list('id', 'value', 'last_value')
+    )
+
+    snapshots = []
+    skipped = 0
+    for user_id, value, last in rows:
+        value = Decimal(value).quantize(Decimal('0.01'))
+        if last is not None and Decimal(last) == value:
+            skipped += 1
+            continue
+        snapshots.append(PortfolioSnapshot(user_id=user_id, total_value=value))
+    PortfolioSnapshot.objects.bulk_create(snapshots, batch_size=500)
+    return len(snapshots), skipped, time.perf_counter() - started
+
+
+def get_retention():
+    retention = dict(DEFAULT_RETENTION)
+    retention.update(getattr(settings, 'PORTFOLIO_SNAPSHOT_RETENTION', {}))
+    return retention
+
+
+def _tier_source(resolution):
+    """The rows a tier is rolled up from: raw snapshots for the first tier, the previous tier otherwise."""
+    resolutions = [r for r, _ in ROLLUP_TIERS]
+    index = resolutions.index(resolution)
+    if index == 0:
+        return PortfolioSnapshot.objects.all()
+    return PortfolioSnapshotRollup.objects.filter(resolution=resolutions[index - 1])
+
+
+def _roll_up_tier(resolution, seconds, until, max_buckets):
+    """
+    Rolls the tier's source rows into buckets ending no later than `until`,
+    one bucket per transaction. Only complete buckets are rolled up, so a run
+    resumes with the first source row after the newest bucket already written.
+    Returns (rollups written, time up to which the source has been rolled up).
+    """
+    source = _tier_source(resolution)
+    latest = PortfolioSnapshotRollup.objects.filter(resolution=resolution).aggregate(latest=Max('timestamp'))['latest']
+    if latest is not None:
+        source = source.filter(timestamp__gte=latest + timedelta(seconds=seconds))
+    first = source.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if first is None:
+        return 0, until
+    start = bucket_start(first, seconds)
+
+    written = 0
+    buckets = 0
+    while start < until:
+        if max_buckets is not None and buckets >= max_buckets:
+            return written, start
+        end = start + timedelta(seconds=seconds)
+        # Last value per user in the bucket; later rows overwrite earlier ones
+        closing = {}
+        rows = source.filter(timestamp__gte=start, timestamp__lt=end).order_by('timestamp', 'id')
+        for user_id, value in rows.values_list('user_id', 'total_value').iterator(chunk_size=2000):
+            closing[user_id] = value
+
+        with transaction.atomic():
+            PortfolioSnapshotRollup.objects.bulk_create(
+                [PortfolioSnapshotRollup(user_id=user_id, resolution=resolution, timestamp=start, total_value=value)
+                 for user_id, value in closing.items()],
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['user', 'resolution', 'timestamp'],
+                update_fields=['total_value'],
+            )
+        written += len(closing)
+        buckets += 1
+
+        # Jump over empty stretches straight to the next bucket with data
+        following = source.filter(timestamp__gte=end).order_by('timestamp').values_list('timestamp', flat=True).first()
+        if following is None:
+            break
+        start = bucket_start(following, seconds)
+    return written, until
+
+
+def _delete_in_batches(queryset):
+    """Deletes the queryset's rows DELETE_BATCH_SIZE at a time, each batch in its own short transaction."""
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:DELETE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            count, _ = queryset.model.objects.filter(pk__in=ids).delete()
+        deleted += count
+
+
+def compact_portfolio_snapshots(now=None, max_buckets=None):
+    """
+    Downsamples portfolio snapshots into the hourly and daily tiers and
+    applies the PORTFOLIO_SNAPSHOT_RETENTION policy.
+
+    Work is split into one transaction per bucket and per delete batch so
+    SQLite's write lock is only ever held briefly, and `max_buckets` bounds
+    each tier's work per run. Progress is read back from the rollup tables,
+    so an interrupted or capped run simply carries on next time. Rows are only
+    deleted once the next tier has rolled them up.
+    Returns (rollups written per tier, rows deleted per level).
+    """
+    now = now or timezone.now()
+    retention = get_retention()
+
+    written = {}
+    deleted = {}
+    source_level = 'raw'
+    rolled_until = now
+    for resolution, seconds in ROLLUP_TIERS:
+        until = min(bucket_start(now, seconds), bucket_start(rolled_until, seconds))
+        written[resolution], rolled_until = _roll_up_tier(resolution, seconds, until, max_buckets)
+
+        keep_for = retention.get(source_level)
+        if keep_for is not None:
+            cutoff = min(now - keep_for, rolled_until)
+            deleted[source_level] = _delete_in_batches(_tier_source(resolution).filter(timestamp__lt=cutoff))
+        source_level = resolution
+
+    keep_for = retention.get(source_level)
+    if keep_for is not None:
+        deleted[source_level] = _delete_in_batches(
+            PortfolioSnapshotRollup.objects.filter(resolution=source_level, timestamp__lt=now - keep_for)
+        )
+    return written, deleted
+
+
+def portfolio_series(user, start=None, end=None):
+    """
+    Returns a user's portfolio value history between `start` and `end` as
+    (resolution, [(timestamp, total_value), ...]).
+
+    The coarsest tier needed to cover `start` is read first and the finer
+    tiers only fill in the stretch after its newest bucket, so a long range
+    comes back mostly as daily points while the most recent hours keep full
+    resolution.
+    """
+    now = timezone.now()
+    retention = get_retention()
+    levels = [('raw', None)] + ROLLUP_TIERS
+
+    # Finest level whose retention still reaches back to the start of the range
+    first = len(levels) - 1
+    for i, (level, _) in enumerate(levels):
+        keep_for = retention.get(level)
+        if keep_for is None or (start is not None and start >= now - keep_for):
+            first = i
+            break
+
+    points = []
+    cutoff = start
+    for level, seconds in reversed(levels[:first + 1]):
+        if level == 'raw':
+            rows = PortfolioSnapshot.objects.filter(user=user)
+        else:
+            rows = PortfolioSnapshotRollup.objects.filter(user=user, resolution=level)
+        if cutoff is not None:
+            rows = rows.filter(timestamp__gte=cutoff)
+        if end is not None:
+            rows = rows.filter(timestamp__lt=end)
+        level_points = list(rows.order_by('timestamp').values_list('timestamp', 'total_value'))
+        points.extend(level_points)
+        if level_points and seconds is not None:
+            cutoff = level_points[-1][0] + timedelta(seconds=seconds)
+    return levels[first][0], points
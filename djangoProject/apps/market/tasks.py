@@ -5,17 +5,16 @@ import logging
 logger = logging.getLogger(__name__)
 
 @shared_task
-def reset_low_value_stocks_task():
-    try:
-        # This calls your reset_low_value_stocks management command.
-        call_command('reset_low_value_stocks')
-        logger.info("Successfully ran reset_low_value_stocks command.")
-    except Exception as e:
-        logger.error("Error running reset_low_value_stocks command: %s", e)
+def market_tick_task():
+    from apps.market.pipeline import run_market_tick
+    log = run_market_tick()
+    logger.info("Market tick %s: %s", log.status, log.stages)
 
 @shared_task
-def update_stock_prices_task():
-    call_command('update_stock_prices')
+def prune_price_history_task():
+    from apps.market.rollups import prune_price_history
+    deleted = prune_price_history()
+    logger.info("Pruned stock price history: %s", deleted)
 
 @shared_task
 def generate_market_event_task():
@@ -23,15 +22,13 @@ def generate_market_event_task():
 
 @shared_task
 def record_portfolio_snapshots_task():
-    # Import models here to ensure Django apps are loaded
-    from apps.users.models import UserProfile
-    from apps.market.models import Investment, PortfolioSnapshot
-    from decimal import Decimal
+    # Import here to ensure Django apps are loaded
+    from apps.market.snapshots import record_portfolio_snapshots
+    written, skipped, elapsed = record_portfolio_snapshots()
+    logger.info("Recorded %d portfolio snapshots (%d unchanged) in %.3fs.", written, skipped, elapsed)
 
-    profiles = UserProfile.objects.all()
-    for profile in profiles:
-        investments = Investment.objects.filter(user=profile.user)
-        total_value = Decimal('0.00')
-        for inv in investments:
-            total_value += inv.company.current_stock_price * inv.shares
-        PortfolioSnapshot.objects.create(user=profile.user, total_value=total_value)
\ No newline at end of file
+@shared_task
+def compact_portfolio_snapshots_task():
+    from apps.market.snapshots import compact_portfolio_snapshots
+    written, deleted = compact_portfolio_snapshots(max_buckets=48)
+    logger.info("Compacted portfolio snapshots: rolled up %s, pruned %s", written, deleted)
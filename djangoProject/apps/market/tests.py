@@ -1,3 +1,1181 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.market.analytics import market_analytics, rolling_mean, rolling_std
+from apps.market.backtest import evaluate, load_price_matrix, run_backtest
+from apps.market.benchmark import isolated_publishing
+from apps.market.broadcast import STOCK_UPDATES_GROUP
+from apps.market.consumers import MAX_SUBSCRIPTIONS, StockPriceConsumer
+from apps.market.downsampling import lttb
+from apps.market.event_impact import record_event_impacts
+from apps.market.leaderboard import refresh_leaderboard, leaderboard_rank
+from apps.market.models import (
+    Company, MarketEvent, StockPriceHistory, MinuteCandle, HourCandle, DayCandle, Investment, LeaderboardEntry,
+    Position, PortfolioSnapshot, PortfolioSnapshotRollup, EventImpactBucket, Transaction, MarketNotification,
+    MarketTickLog,
+)
+from apps.market.journal import TradeJournal
+from apps.market.orders import BUY, SELL, Order, OrderEngine, execute_batch, execute_orders
+from apps.market.pipeline import TICK_LOCK_NAME, database_lock, run_local_scheduler, run_market_tick
+from apps.market.positions import buy_shares, sell_shares
+from apps.market.price_cache import PRICE_CACHE_ALIAS, get_price_snapshot, current_prices, publish_price_snapshot
+from apps.market.price_engine import run_price_tick
+from apps.market.resets import reset_low_value_stocks
+from apps.market.rollups import bucket_start, record_tick, rebuild_candles, prune_price_history
+from apps.market.snapshots import record_portfolio_snapshots, compact_portfolio_snapshots
+from apps.users.models import UserProfile
+
+
+# Journal entries are written as soon as they are queued, so tests never wait on the flusher thread
+_journal_write_through = override_settings(TRADE_JOURNAL_FLUSH_SIZE=1)
+
+
+def setUpModule():
+    _journal_write_through.enable()
+
+
+def tearDownModule():
+    _journal_write_through.disable()
+
+
+class PriceEngineTestCase(TestCase):
+    """Tests for the batched price engine behind update_stock_prices."""
+
+    def setUp(self):
+        self.green = Company.objects.create(name="Green Co", description="", current_stock_price=Decimal('100.00'))
+        self.brown = Company.objects.create(name="Brown Co", description="", current_stock_price=Decimal('50.00'))
+        self.penny = Company.objects.create(name="Penny Co", description="", current_stock_price=Decimal('1.20'))
+
+    def test_tick_updates_every_company_and_writes_history(self):
+        """Every company gets a new price and exactly one history row."""
+        tick = run_price_tick(rng=np.random.default_rng(1))
+        self.assertEqual(len(tick), 3)
+        self.assertEqual(StockPriceHistory.objects.count(), 3)
+        for company in Company.objects.all():
+            history = company.price_history.get()
+            self.assertEqual(history.price, company.current_stock_price)
+
+    def test_tick_query_count_is_constant(self):
+        """The tick issues the same number of queries however many companies exist."""
+        with CaptureQueriesContext(connection) as small:
+            run_price_tick()
+        for i in range(20):
+            Company.objects.create(name=f"Extra {i}", description="")
+        with CaptureQueriesContext(connection) as large:
+            run_price_tick()
+        # Candle writes are one bulk_update plus one bulk_create per table, so at most 15 queries
+        self.assertLessEqual(len(small.captured_queries), 15)
+        self.assertLessEqual(len(large.captured_queries), 15)
+
+    def test_active_events_apply_and_expired_events_do_not(self):
+        """Only events still within their duration move the price."""
+        active = MarketEvent.objects.create(title="Rally", description="", impact_factor=Decimal('0.20'), duration=5)
+        active.companies_affected.add(self.green)
+        expired = MarketEvent.objects.create(title="Crash", description="", impact_factor=Decimal('-0.30'), duration=1)
+        expired.companies_affected.add(self.green, self.brown)
+        started = timezone.now() - timedelta(minutes=10)
+        MarketEvent.objects.filter(pk=expired.pk).update(event_date=started, ends_at=started + timedelta(minutes=1))
+
+        tick = run_price_tick(rng=np.random.default_rng(2))
+        impacts = dict(zip(tick.company_ids.tolist(), tick.event_impacts.tolist()))
+        self.assertAlmostEqual(impacts[self.green.pk], 0.20)
+        self.assertAlmostEqual(impacts[self.brown.pk], 0.0)
+        self.green.refresh_from_db()
+        self.assertGreater(self.green.current_stock_price, Decimal('115.00'))
+
+    def test_low_price_flag_and_floor(self):
+        """Prices stay above the floor and low prices are flagged like Company.save does."""
+        run_price_tick(rng=np.random.default_rng(3))
+        self.penny.refresh_from_db()
+        self.green.refresh_from_db()
+        self.assertGreaterEqual(self.penny.current_stock_price, Decimal('1.00'))
+        self.assertIsNotNone(self.penny.price_low_since)
+        self.assertIsNone(self.green.price_low_since)
+
+
+class MarketEventWindowTestCase(TestCase):
+    """Tests for the stored ends_at window and the active-event query API."""
+
+    def setUp(self):
+        self.company_a = Company.objects.create(name="A", description="")
+        self.company_b = Company.objects.create(name="B", description="")
+        self.now = timezone.now()
+
+    def make_event(self, impact, duration, started, *companies):
+        event = MarketEvent(title="Event", description="", impact_factor=Decimal(impact), duration=duration,
+                            event_date=started)
+        event.save()
+        event.companies_affected.add(*companies)
+        return event
+
+    def test_ends_at_is_stored_on_save(self):
+        event = self.make_event('0.10', 5, self.now, self.company_a)
+        self.assertEqual(event.ends_at, self.now + timedelta(minutes=5))
+        self.assertTrue(event.is_active())
+
+    def test_active_excludes_expired_and_future_events(self):
+        live = self.make_event('0.10', 5, self.now - timedelta(minutes=1), self.company_a)
+        self.make_event('0.20', 1, self.now - timedelta(minutes=3), self.company_a)
+        self.make_event('0.30', 5, self.now + timedelta(minutes=1), self.company_a)
+        self.assertEqual(list(MarketEvent.objects.active(at=self.now)), [live])
+
+    def test_impact_by_company_sums_active_events_in_one_query(self):
+        self.make_event('0.10', 5, self.now - timedelta(minutes=1), self.company_a, self.company_b)
+        self.make_event('-0.25', 5, self.now - timedelta(minutes=2), self.company_a)
+        self.make_event('0.50', 1, self.now - timedelta(minutes=3), self.company_b)
+        with self.assertNumQueries(1):
+            impacts = MarketEvent.objects.impact_by_company(at=self.now)
+        self.assertEqual(impacts, {self.company_a.pk: Decimal('-0.15'), self.company_b.pk: Decimal('0.10')})
+
+
+class PriceRollupTestCase(TestCase):
+    """Tests for the OHLC candle rollups, retention and the price history API."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Rollup Co", description="")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        self.minute = timezone.now().replace(second=0, microsecond=0) - timedelta(minutes=5)
+
+    def add_tick(self, seconds, price):
+        """Writes a raw tick at minute + seconds and folds it into the candles."""
+        moment = self.minute + timedelta(seconds=seconds)
+        tick = StockPriceHistory.objects.create(company=self.company, price=Decimal(price))
+        StockPriceHistory.objects.filter(pk=tick.pk).update(date=moment)
+        record_tick(moment, [(self.company.pk, Decimal(price))])
+
+    def test_record_tick_builds_ohlc(self):
+        for seconds, price in [(0, '10.00'), (15, '12.50'), (30, '9.00'), (45, '11.00')]:
+            self.add_tick(seconds, price)
+        candle = MinuteCandle.objects.get(company=self.company)
+        self.assertEqual((candle.open, candle.high, candle.low, candle.close),
+                         (Decimal('10.00'), Decimal('12.50'), Decimal('9.00'), Decimal('11.00')))
+        self.assertEqual(HourCandle.objects.count(), 1)
+        self.assertEqual(DayCandle.objects.count(), 1)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        for seconds, price in [(0, '10.00'), (30, '14.00'), (60, '8.00'), (90, '9.50')]:
+            self.add_tick(seconds, price)
+        incremental = list(MinuteCandle.objects.values_list('bucket_start', 'open', 'high', 'low', 'close'))
+        written = rebuild_candles()
+        self.assertEqual(written['1m'], 2)
+        rebuilt = list(MinuteCandle.objects.values_list('bucket_start', 'open', 'high', 'low', 'close'))
+        self.assertEqual(incremental, rebuilt)
+
+    @override_settings(MARKET_PRICE_RETENTION={'raw': timedelta(minutes=10), '1m': None, '1h': None})
+    def test_rebuild_after_a_prune_keeps_older_candles(self):
+        self.minute -= timedelta(days=2)
+        self.add_tick(0, '10.00')
+        self.add_tick(30, '12.00')
+        self.minute += timedelta(days=2)
+        self.add_tick(0, '20.00')
+        prune_price_history()
+        self.assertEqual(StockPriceHistory.objects.count(), 1)
+        before = {model: list(model.objects.values_list('bucket_start', 'open', 'high', 'low', 'close'))
+                  for model in (MinuteCandle, HourCandle, DayCandle)}
+
+        call_command('rollup_price_history', stdout=StringIO())
+        for model, candles in before.items():
+            self.assertEqual(list(model.objects.values_list('bucket_start', 'open', 'high', 'low', 'close')),
+                             candles)
+        self.assertEqual(DayCandle.objects.first().high, Decimal('12.00'))
+
+    @override_settings(MARKET_PRICE_RETENTION={'raw': timedelta(minutes=1), '1m': None, '1h': None})
+    def test_prune_keeps_ticks_that_were_never_rolled_up(self):
+        StockPriceHistory.objects.create(company=self.company, price=Decimal('5.00'))
+        StockPriceHistory.objects.update(date=self.minute - timedelta(hours=2))
+        self.add_tick(0, '10.00')
+        self.add_tick(90, '11.00')
+
+        deleted = prune_price_history(now=self.minute + timedelta(minutes=3))
+        self.assertEqual(deleted['raw'], 2)
+        self.assertEqual(list(StockPriceHistory.objects.values_list('price', flat=True)), [Decimal('5.00')])
+
+    def test_price_history_api_serves_requested_interval(self):
+        for seconds, price in [(0, '10.00'), (30, '14.00'), (60, '8.00')]:
+            self.add_tick(seconds, price)
+        url = reverse('market:price_history_api', args=[self.company.pk])
+
+        raw = self.client.get(url).json()
+        self.assertEqual(raw['interval'], 'raw')
+        self.assertEqual([h['price'] for h in raw['history']], ['10.00', '14.00', '8.00'])
+
+        minute = self.client.get(url, {'interval': '1m'}).json()
+        self.assertEqual([(h['open'], h['high'], h['close']) for h in minute['history']],
+                         [('10.00', '14.00', '14.00'), ('8.00', '8.00', '8.00')])
+
+        start = (self.minute - timedelta(days=3)).isoformat()
+        self.assertEqual(self.client.get(url, {'start': start}).json()['interval'], '1h')
+        self.assertEqual(self.client.get(url, {'interval': '5m'}).status_code, 400)
+
+
+class PriceHistoryApiTestCase(TestCase):
+    """Tests for keyset pagination and conditional GET on price_history_api."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Chart Co", description="")
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        self.url = reverse('market:price_history_api', args=[self.company.pk])
+        start = timezone.now() - timedelta(minutes=30)
+        for i in range(5):
+            tick = StockPriceHistory.objects.create(company=self.company, price=Decimal(10 + i))
+            StockPriceHistory.objects.filter(pk=tick.pk).update(date=start + timedelta(minutes=i))
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_limit_returns_latest_points(self):
+        data = self.client.get(self.url, {'limit': 2}).json()
+        self.assertEqual([h['price'] for h in data['history']], ['13.00', '14.00'])
+        self.assertTrue(data['has_more'])
+
+    def test_before_pages_backward_from_cursor(self):
+        pages = []
+        params = {'limit': 2}
+        while True:
+            data = self.client.get(self.url, params).json()
+            pages.append([h['price'] for h in data['history']])
+            if not data['has_more']:
+                break
+            params['before'] = data['next_before']
+        self.assertEqual(pages, [['13.00', '14.00'], ['11.00', '12.00'], ['10.00']])
+        self.assertIsNone(data['next_before'])
+        self.assertEqual(self.client.get(self.url, {'since': '2000-01-01', 'before': '2000-01-02'}).status_code, 400)
+
+    def test_since_pages_forward_from_cursor(self):
+        first = self.client.get(self.url, {'since': '2000-01-01', 'limit': 3}).json()
+        self.assertEqual([h['price'] for h in first['history']], ['10.00', '11.00', '12.00'])
+        self.assertTrue(first['has_more'])
+        second = self.client.get(self.url, {'since': first['next_since'], 'limit': 3}).json()
+        self.assertEqual([h['price'] for h in second['history']], ['13.00', '14.00'])
+        self.assertFalse(second['has_more'])
+
+    def test_other_pages_and_windows_never_match(self):
+        first = self.client.get(self.url, {'limit': 2})
+        older = self.client.get(self.url, {'limit': 2, 'before': first.json()['next_before']})
+        variants = [
+            {'limit': 3},
+            {'limit': 2, 'before': first.json()['next_before']},
+            {'limit': 2, 'interval': '1m'},
+            {'limit': 2, 'start': (timezone.now() - timedelta(minutes=28)).isoformat()},
+            {'limit': 2, 'since': '2000-01-01'},
+        ]
+        for params in variants:
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(response.status_code, 200, params)
+        self.assertEqual(self.client.get(self.url, {'limit': 2}, HTTP_IF_NONE_MATCH=older['ETag']).status_code, 200)
+        since = self.client.get(self.url, {'limit': 3}, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, 200)
+        self.assertEqual(self.client.get(self.url, {'limit': 2}, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_unchanged_history_returns_304(self):
+        response = self.client.get(self.url)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        StockPriceHistory.objects.create(company=self.company, price=Decimal('20.00'))
+        fresh = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class PriceBroadcastTestCase(TestCase):
+    """Tests that each price tick is pushed to the stock_updates group as one delta message."""
+
+    def test_tick_publishes_only_changed_prices(self):
+        moving = Company.objects.create(name="Moving", description="", current_stock_price=Decimal('100.00'))
+        Company.objects.create(name="Floored", description="", current_stock_price=Decimal('1.00'))
+        event = MarketEvent.objects.create(title="Crash", description="", impact_factor=Decimal('-0.90'), duration=5)
+        event.companies_affected.add(*Company.objects.all())
+
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)(STOCK_UPDATES_GROUP, "test-client")
+        with self.captureOnCommitCallbacks(execute=True):
+            run_price_tick(rng=np.random.default_rng(4))
+
+        message = async_to_sync(layer.receive)("test-client")['message']
+        self.assertEqual(message['type'], 'prices')
+        moving.refresh_from_db()
+        # The floored company stays at $1.00, so only one change is sent
+        self.assertEqual(message['changes'], [
+            [moving.pk, float(moving.current_stock_price), round(float(moving.current_stock_price) - 100.0, 2)]
+        ])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class StockPriceConsumerTestCase(SimpleTestCase):
+    """Tests for per-client company subscriptions on the stock price websocket."""
+
+    async def test_subscription_filters_price_updates(self):
+        communicator = WebsocketCommunicator(StockPriceConsumer.as_asgi(), "/ws/stock-price/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({'action': 'subscribe', 'company_ids': [2]})
+        reply = await communicator.receive_json_from()
+        self.assertEqual(reply['message'], {'type': 'subscribed', 'company_ids': [2]})
+
+        layer = get_channel_layer()
+        await layer.group_send(STOCK_UPDATES_GROUP, {
+            'type': 'stock_update',
+            'message': {'type': 'prices', 'timestamp': 'now', 'changes': [[1, 10.0, 1.0]]},
+        })
+        self.assertTrue(await communicator.receive_nothing())
+
+        await layer.group_send(STOCK_UPDATES_GROUP, {
+            'type': 'stock_update',
+            'message': {'type': 'prices', 'timestamp': 'now', 'changes': [[1, 10.0, 1.0], [2, 20.0, -1.5]]},
+        })
+        update = await communicator.receive_json_from()
+        self.assertEqual(update['message']['changes'], [[2, 20.0, -1.5]])
+        await communicator.disconnect()
+
+    async def test_malformed_subscriptions_are_ignored_and_capped(self):
+        communicator = WebsocketCommunicator(StockPriceConsumer.as_asgi(), "/ws/stock-price/")
+        await communicator.connect()
+
+        await communicator.send_to(text_data='{not json')
+        await communicator.send_to(text_data='[1, 2]')
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_json_to({'action': 'subscribe', 'company_ids': ['3', 'x', None, [4], True, 1.0]})
+        reply = await communicator.receive_json_from()
+        self.assertEqual(reply['message']['company_ids'], [1, 3])
+
+        await communicator.send_json_to({'action': 'subscribe', 'company_ids': list(range(MAX_SUBSCRIPTIONS * 5))})
+        reply = await communicator.receive_json_from()
+        self.assertEqual(reply['message']['company_ids'], list(range(MAX_SUBSCRIPTIONS)))
+        await communicator.disconnect()
+
+
+class LeaderboardTestCase(TestCase):
+    """Tests for the materialized leaderboard and its incremental maintenance."""
+
+    def setUp(self):
+        self.green = Company.objects.create(name="Green", description="", sustainability_rating=Decimal('9.0'),
+                                            current_stock_price=Decimal('10.00'))
+        self.brown = Company.objects.create(name="Brown", description="", sustainability_rating=Decimal('2.0'),
+                                            current_stock_price=Decimal('50.00'))
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f"player{i}", password="testpass")
+            UserProfile.objects.create(user=user, currency_balance=Decimal('10000.00'))
+            self.users.append(user)
+        buy_shares(self.users[0], self.green, 10, Decimal('10.00'))
+        buy_shares(self.users[0], self.brown, 1, Decimal('50.00'))
+        buy_shares(self.users[1], self.brown, 20, Decimal('50.00'))
+        self.client.login(username="player2", password="testpass")
+
+    def test_refresh_aggregates_every_player(self):
+        self.assertEqual(refresh_leaderboard(), 3)
+        first = LeaderboardEntry.objects.get(user=self.users[0])
+        self.assertEqual(first.portfolio_value, Decimal('150.00'))
+        self.assertEqual(first.green_impact, Decimal('92.00'))
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.users[2]).portfolio_value, Decimal('0.00'))
+
+        Company.objects.filter(pk=self.brown.pk).update(current_stock_price=Decimal('60.00'))
+        refresh_leaderboard()
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.users[1]).portfolio_value, Decimal('1200.00'))
+
+    def test_buy_updates_the_buyers_entry(self):
+        refresh_leaderboard()
+        self.client.post(reverse('market:invest', args=[self.green.pk]), {'shares': 5})
+        entry = LeaderboardEntry.objects.get(user=self.users[2])
+        self.assertEqual(entry.portfolio_value, Decimal('50.00'))
+        self.assertEqual(entry.green_impact, Decimal('45.00'))
+
+    def test_view_is_ordered_paginated_and_shows_own_rank(self):
+        refresh_leaderboard()
+        url = reverse('market:leaderboard')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for i in range(30):
+            extra = User.objects.create_user(username=f"extra{i}")
+            LeaderboardEntry.objects.create(user=extra, green_impact=Decimal(i))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        page = response.context['leaderboard']
+        self.assertEqual(len(page.object_list), 25)
+        self.assertEqual(page.object_list[0].user, self.users[0])
+        self.assertEqual(response.context['my_rank'], leaderboard_rank(response.context['my_entry']))
+        self.assertEqual(response.context['my_rank'], 32)
+
+
+class PositionTestCase(TestCase):
+    """Tests that positions stay in sync with the FIFO investment lots."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Lots Co", description="", current_stock_price=Decimal('20.00'))
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        UserProfile.objects.create(user=self.user, currency_balance=Decimal('10000.00'))
+        self.client.login(username="testuser", password="testpass")
+
+    def test_buys_accumulate_into_one_position(self):
+        buy_shares(self.user, self.company, 10, Decimal('10.00'))
+        buy_shares(self.user, self.company, 5, Decimal('16.00'))
+        position = Position.objects.get(user=self.user, company=self.company)
+        self.assertEqual((position.shares, position.cost_basis), (15, Decimal('180.00')))
+        self.assertEqual(Investment.objects.filter(user=self.user).count(), 2)
+
+    def test_sell_consumes_oldest_lots_first(self):
+        buy_shares(self.user, self.company, 10, Decimal('10.00'))
+        buy_shares(self.user, self.company, 5, Decimal('16.00'))
+        self.assertEqual(sell_shares(self.user, self.company, 12), Decimal('132.00'))
+        position = Position.objects.get(user=self.user, company=self.company)
+        self.assertEqual((position.shares, position.cost_basis), (3, Decimal('48.00')))
+        self.assertEqual(list(Investment.objects.values_list('shares', 'purchase_price')), [(3, Decimal('16.00'))])
+
+        self.assertIsNone(sell_shares(self.user, self.company, 4))
+        sell_shares(self.user, self.company, 3)
+        self.assertFalse(Position.objects.exists())
+        self.assertFalse(Investment.objects.exists())
+
+    def test_sell_view_updates_position(self):
+        buy_shares(self.user, self.company, 10, Decimal('10.00'))
+        self.client.post(reverse('market:sell_investment_company', args=[self.company.pk]), {'shares': 4})
+        self.assertEqual(Position.objects.get(user=self.user).shares, 6)
+
+    def test_portfolio_query_count_does_not_grow_with_lots(self):
+        url = reverse('market:portfolio')
+        buy_shares(self.user, self.company, 1, Decimal('10.00'))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        for _ in range(50):
+            buy_shares(self.user, self.company, 1, Decimal('10.00'))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(response.context['portfolio_data'][0]['shares'], 51)
+
+
+class PortfolioSnapshotJobTestCase(TestCase):
+    """Tests for the set-based portfolio snapshot job."""
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Snap Co", description="", current_stock_price=Decimal('10.00'))
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f"snapper{i}")
+            UserProfile.objects.create(user=user)
+            self.users.append(user)
+        buy_shares(self.users[0], self.company, 5, Decimal('10.00'))
+        buy_shares(self.users[1], self.company, 2, Decimal('10.00'))
+
+    def test_snapshots_every_player_in_constant_queries(self):
+        with self.assertNumQueries(2):
+            written, skipped, elapsed = record_portfolio_snapshots()
+        self.assertEqual((written, skipped), (3, 0))
+        self.assertGreaterEqual(elapsed, 0)
+        values = dict(PortfolioSnapshot.objects.values_list('user_id', 'total_value'))
+        self.assertEqual(values, {self.users[0].pk: Decimal('50.00'), self.users[1].pk: Decimal('20.00'),
+                                  self.users[2].pk: Decimal('0.00')})
+
+    def test_unchanged_values_are_skipped(self):
+        record_portfolio_snapshots()
+        Company.objects.filter(pk=self.company.pk).update(current_stock_price=Decimal('12.00'))
+        buy_shares(self.users[2], self.company, 1, Decimal('12.00'))
+        record_portfolio_snapshots()
+        written, skipped, _ = record_portfolio_snapshots()
+        self.assertEqual((written, skipped), (0, 3))
+        self.assertEqual(PortfolioSnapshot.objects.count(), 6)
+
+
+class PortfolioSnapshotCompactionTestCase(TestCase):
+    """Tests for tiered downsampling and retention of portfolio snapshots."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="compactor", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username="compactor", password="testpass")
+        self.now = timezone.now()
+        self.old = self.now - timedelta(days=40)
+        self.recent = self.now - timedelta(days=3)
+        self.latest = self.now - timedelta(minutes=5)
+        for at, value in [(self.old, '10.00'), (self.old + timedelta(seconds=1), '11.00'),
+                          (self.recent, '20.00'), (self.latest, '30.00')]:
+            snapshot = PortfolioSnapshot.objects.create(user=self.user, total_value=Decimal(value))
+            PortfolioSnapshot.objects.filter(pk=snapshot.pk).update(timestamp=at)
+
+    def rollups(self, resolution):
+        return list(PortfolioSnapshotRollup.objects.filter(resolution=resolution)
+                    .order_by('timestamp').values_list('total_value', flat=True))
+
+    def test_compaction_downsamples_and_prunes_each_tier(self):
+        compact_portfolio_snapshots(now=self.now)
+        # Raw snapshots older than a day are gone, hourly rows older than a month too
+        self.assertEqual(list(PortfolioSnapshot.objects.values_list('total_value', flat=True)), [Decimal('30.00')])
+        self.assertEqual(self.rollups('hour')[0], Decimal('20.00'))
+        # Each bucket keeps its last value
+        self.assertEqual(self.rollups('day')[:2], [Decimal('11.00'), Decimal('20.00')])
+
+    def test_capped_runs_resume_where_they_stopped(self):
+        written, deleted = compact_portfolio_snapshots(now=self.now, max_buckets=1)
+        self.assertEqual(written['hour'], 1)
+        # Only the bucket that was rolled up is pruned
+        self.assertEqual(sorted(PortfolioSnapshot.objects.values_list('total_value', flat=True)),
+                         [Decimal('20.00'), Decimal('30.00')])
+        for _ in range(5):
+            compact_portfolio_snapshots(now=self.now, max_buckets=1)
+        self.assertEqual(PortfolioSnapshot.objects.count(), 1)
+        self.assertEqual(self.rollups('day')[:2], [Decimal('11.00'), Decimal('20.00')])
+
+    def test_api_reads_the_tier_matching_the_range(self):
+        compact_portfolio_snapshots(now=self.now)
+        url = reverse('market:portfolio_analytics_api')
+
+        data = self.client.get(url, {'start_date': (self.now - timedelta(days=60)).date().isoformat()}).json()
+        self.assertEqual(data['resolution'], 'day')
+        values = [s['total_value'] for s in data['snapshots']]
+        self.assertEqual(values[:2], ['11.00', '20.00'])
+        self.assertEqual(values[-1], '30.00')
+
+        data = self.client.get(url, {'start_date': self.now.date().isoformat()}).json()
+        self.assertEqual(data['resolution'], 'raw')
+        self.assertEqual([s['total_value'] for s in data['snapshots']], ['30.00'])
+
+
+class PortfolioDownsamplingTestCase(TestCase):
+    """Tests for LTTB downsampling in portfolio_analytics_api."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sampler", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username="sampler", password="testpass")
+
+    def test_lttb_keeps_endpoints_and_spikes(self):
+        y = np.zeros(1000)
+        y[437] = 50.0
+        keep = lttb(np.arange(1000), y, 20)
+        self.assertEqual(len(keep), 20)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertIn(437, keep)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        self.assertEqual(len(lttb(np.arange(10), np.arange(10), 20)), 10)
+
+    def test_api_limits_points_to_max_points(self):
+        now = timezone.now()
+        PortfolioSnapshot.objects.bulk_create(
+            PortfolioSnapshot(user=self.user, total_value=Decimal(i)) for i in range(100)
+        )
+        for i, pk in enumerate(PortfolioSnapshot.objects.order_by('pk').values_list('pk', flat=True)):
+            PortfolioSnapshot.objects.filter(pk=pk).update(timestamp=now - timedelta(minutes=100 - i))
+        url = reverse('market:portfolio_analytics_api')
+
+        snapshots = self.client.get(url, {'max_points': 10}).json()['snapshots']
+        self.assertEqual(len(snapshots), 10)
+        self.assertEqual((snapshots[0]['total_value'], snapshots[-1]['total_value']), ('0.00', '99.00'))
+        self.assertEqual(len(self.client.get(url).json()['snapshots']), 100)
+        self.assertEqual(self.client.get(url, {'max_points': 'lots'}).status_code, 400)
+
+
+class EventImpactSeriesTestCase(TestCase):
+    """Tests for the persisted cumulative impact series behind event_impact_api."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="analyst", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username="analyst", password="testpass")
+        Company.objects.create(name="Impact Co", description="")
+
+    def make_event(self, impact, at):
+        return MarketEvent.objects.create(title="Event", description="", impact_factor=Decimal(impact),
+                                          duration=5, event_date=at)
+
+    def test_generate_market_events_appends_to_series(self):
+        call_command('generate_market_events', count=4, stdout=StringIO())
+        total = sum(MarketEvent.objects.values_list('impact_factor', flat=True))
+        for interval in ('1m', '1h', '1d'):
+            latest = EventImpactBucket.objects.filter(interval=interval).last()
+            self.assertEqual(latest.cumulative_impact, total)
+        self.assertEqual(sum(EventImpactBucket.objects.filter(interval='1d').values_list('event_count', flat=True)), 4)
+
+    def test_backdated_events_shift_later_totals(self):
+        now = timezone.now()
+        record_event_impacts([self.make_event('0.10', now)])
+        record_event_impacts([self.make_event('0.05', now)])
+        record_event_impacts([self.make_event('-0.20', now - timedelta(days=2))])
+        series = list(EventImpactBucket.objects.filter(interval='1d').values_list('event_count', 'cumulative_impact'))
+        self.assertEqual(series, [(1, Decimal('-0.20')), (2, Decimal('-0.05'))])
+
+    def test_api_serves_requested_range_and_bucket(self):
+        now = timezone.now()
+        old, recent = self.make_event('0.10', now - timedelta(days=3)), self.make_event('0.20', now)
+        record_event_impacts([old, recent])
+        url = reverse('market:event_impact_api')
+
+        data = self.client.get(url).json()
+        self.assertEqual(data['bucket'], '1d')
+        self.assertEqual([d['cumulative_impact'] for d in data['data']], [0.1, 0.3])
+
+        data = self.client.get(url, {'start': (now - timedelta(hours=1)).isoformat(), 'bucket': '1h'}).json()
+        self.assertEqual(data['bucket'], '1h')
+        self.assertEqual([(d['event_count'], d['cumulative_impact']) for d in data['data']], [(1, 0.3)])
+        self.assertEqual(self.client.get(url, {'bucket': '5m'}).status_code, 400)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    PRICE_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'market-benchmark-test'},
+}, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class MarketBenchmarkTestCase(TestCase):
+    """Smoke test for the benchmark_market harness at its smallest preset."""
+
+    def test_tiny_preset_reports_every_step_and_rolls_back(self):
+        live = Company.objects.create(name="Live Co", description="", current_stock_price=Decimal('42.00'))
+        publish_price_snapshot(timezone.now(), [(live.pk, live.current_stock_price)])
+        before = get_price_snapshot()
+        out = StringIO()
+        call_command('benchmark_market', preset='tiny', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual((report['companies'], report['users'], report['lots']), (5, 20, 60))
+        self.assertEqual([r['name'] for r in report['results']], [
+            'update_stock_prices', 'generate_market_events', 'reset_low_value_stocks',
+            'record_portfolio_snapshots', 'market_tick', 'leaderboard_view', 'portfolio_view',
+        ])
+        for result in report['results']:
+            self.assertGreater(result['queries'], 0)
+            self.assertGreaterEqual(result['seconds'], 0)
+        # The run's ticks were published to a throwaway cache, never the shared one
+        self.assertEqual(get_price_snapshot(), before)
+        with isolated_publishing():
+            # Where the run's hooks did publish its five seeded companies alongside Live Co
+            self.assertEqual(len(get_price_snapshot()[1]), 6)
+        # The seeded market is discarded afterwards
+        self.assertFalse(User.objects.filter(username__startswith='bench_user_').exists())
+        self.assertEqual(list(Company.objects.all()), [live])
+
+
+class OrderEngineTestCase(TestCase):
+    """Tests for batched order execution."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="trader", password="testpass")
+        UserProfile.objects.create(user=self.user, currency_balance=Decimal('100.00'))
+        self.company = Company.objects.create(name="Order Co", description="", current_stock_price=Decimal('10.00'))
+
+    def balance(self):
+        return UserProfile.objects.get(user=self.user).currency_balance
+
+    def test_batch_fills_in_order_and_rejects_what_it_cannot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = execute_batch([
+                Order(self.user, self.company, BUY, 5),
+                Order(self.user, self.company, BUY, 10),
+                Order(self.user, self.company, SELL, 2, tax_rate=Decimal('0.18')),
+                Order(self.user, self.company, SELL, 4),
+            ])
+        self.assertEqual([o.filled for o in orders], [True, False, True, False])
+        self.assertEqual(orders[1].error, "Insufficient funds to make this investment.")
+        self.assertEqual(orders[2].net, Decimal('16.40'))
+        self.assertEqual(self.balance(), Decimal('66.40'))
+        self.assertEqual(Position.objects.get(user=self.user).shares, 3)
+        self.assertEqual(list(Transaction.objects.order_by('id').values_list('transaction_type', 'shares')),
+                         [('buy', 5), ('sell', 2)])
+
+    def test_a_failing_batch_only_rejects_the_order_that_broke_it(self):
+        broken = Order(self.user, None, BUY, 1)
+        with self.captureOnCommitCallbacks(execute=True), self.assertLogs('apps.market.orders', 'ERROR'):
+            orders = execute_orders([Order(self.user, self.company, BUY, 2), broken,
+                                     Order(self.user, self.company, BUY, 3)])
+        self.assertEqual([o.filled for o in orders], [True, False, True])
+        self.assertEqual(broken.error, "The order could not be executed.")
+        self.assertTrue(all(o.done.is_set() for o in orders))
+        self.assertEqual(self.balance(), Decimal('50.00'))
+
+    def test_invest_view_reports_insufficient_funds(self):
+        self.client.login(username="trader", password="testpass")
+        response = self.client.post(reverse('market:invest', args=[self.company.pk]), {'shares': 11})
+        self.assertContains(response, "Insufficient funds")
+        self.assertEqual(self.balance(), Decimal('100.00'))
+
+
+class ConcurrentOrderTestCase(TransactionTestCase):
+    """Parallel buys through the shared engine never overdraw or lose updates."""
+
+    def test_parallel_buys_keep_balance_consistent(self):
+        user = User.objects.create_user(username="rush")
+        UserProfile.objects.create(user=user, currency_balance=Decimal('50.00'))
+        company = Company.objects.create(name="Rush Co", description="", current_stock_price=Decimal('10.00'))
+        engine = OrderEngine(batch_size=4)
+        orders = [Order(user, company, BUY, 1) for _ in range(12)]
+
+        def submit(order):
+            try:
+                engine.submit(order)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=submit, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(o.filled for o in orders), 5)
+        self.assertEqual(UserProfile.objects.get(user=user).currency_balance, Decimal('0.00'))
+        self.assertEqual(Position.objects.get(user=user).shares, 5)
+        self.assertEqual(Transaction.objects.filter(user=user).count(), 5)
+
+    def test_an_outer_rollback_only_undoes_the_callers_own_order(self):
+        company = Company.objects.create(name="Undo Co", description="", current_stock_price=Decimal('10.00'))
+        players = []
+        for name in ("undone", "bystander"):
+            user = User.objects.create_user(username=name)
+            UserProfile.objects.create(user=user, currency_balance=Decimal('50.00'))
+            players.append(user)
+        engine = OrderEngine(batch_size=4)
+        bystander = Order(players[1], company, BUY, 2)
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                mine = engine.submit(Order(players[0], company, BUY, 1))
+                self.assertTrue(mine.filled)
+                raise ValueError
+        # The engine was never taken by the rolled-back caller, so others still trade through it
+        thread = threading.Thread(target=lambda: (engine.submit(bystander), connections.close_all()))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(UserProfile.objects.get(user=players[0]).currency_balance, Decimal('50.00'))
+        self.assertFalse(Position.objects.filter(user=players[0]).exists())
+        self.assertTrue(bystander.filled)
+        self.assertEqual(UserProfile.objects.get(user=players[1]).currency_balance, Decimal('30.00'))
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    PRICE_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'market-prices-test'},
+}, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class PriceCacheTestCase(TestCase):
+    """Tests for the per-tick price snapshot shared through the cache."""
+
+    def setUp(self):
+        caches[PRICE_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username="viewer", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username="viewer", password="testpass")
+        self.company = Company.objects.create(name="Cached Co", description="", current_stock_price=Decimal('100.00'))
+
+    def test_tick_publishes_snapshot_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tick = run_price_tick(rng=np.random.default_rng(3))
+        number, prices = get_price_snapshot()
+        self.company.refresh_from_db()
+        self.assertEqual(prices, {self.company.pk: self.company.current_stock_price})
+        self.assertEqual(number, int(tick.timestamp.timestamp() * 1_000_000))
+
+    def test_views_read_prices_from_snapshot_and_fall_back_on_miss(self):
+        self.assertEqual(current_prices([self.company.pk]), {self.company.pk: Decimal('100.00')})
+        with self.captureOnCommitCallbacks(execute=True):
+            run_price_tick(rng=np.random.default_rng(3))
+        self.company.refresh_from_db()
+        # The row changing behind the snapshot's back shows the views are served from the cache
+        Company.objects.filter(pk=self.company.pk).update(current_stock_price=Decimal('5.00'))
+
+        with self.assertNumQueries(0):
+            prices = current_prices([self.company.pk])
+        self.assertEqual(prices[self.company.pk], self.company.current_stock_price)
+        response = self.client.get(reverse('market:company_detail', args=[self.company.pk]))
+        self.assertEqual(response.context['company'].current_stock_price, self.company.current_stock_price)
+
+        caches[PRICE_CACHE_ALIAS].clear()
+        self.assertEqual(current_prices([self.company.pk]), {self.company.pk: Decimal('5.00')})
+
+    def test_reset_invalidates_snapshot(self):
+        Company.objects.filter(pk=self.company.pk).update(current_stock_price=Decimal('1.10'),
+                                                          price_low_since=timezone.now() - timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            run_price_tick(rng=np.random.default_rng(3))
+        self.assertIsNotNone(get_price_snapshot())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reset_low_value_stocks', stdout=StringIO())
+        self.assertIsNone(get_price_snapshot())
+        self.assertEqual(current_prices([self.company.pk]), {self.company.pk: Decimal('100.00')})
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    PRICE_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'market-backtest-test'},
+})
+class BacktestTestCase(TestCase):
+    """Tests for the vectorized strategy backtester."""
+
+    def setUp(self):
+        caches[PRICE_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username="quant", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username="quant", password="testpass")
+        self.start = bucket_start(timezone.now() - timedelta(hours=10), 3600)
+        self.green = Company.objects.create(name="Green", description="", sustainability_rating=Decimal('9.0'))
+        self.brown = Company.objects.create(name="Brown", description="", sustainability_rating=Decimal('2.0'))
+        # Green doubles over the window, Brown is flat and misses its first two hours
+        for i in range(9):
+            at = self.start + timedelta(hours=i)
+            HourCandle.objects.create(company=self.green, bucket_start=at, open=1, high=1, low=1,
+                                      close=Decimal(100 + 100 * i / 8).quantize(Decimal('0.01')))
+            if i >= 2:
+                HourCandle.objects.create(company=self.brown, bucket_start=at, open=1, high=1, low=1,
+                                          close=Decimal('50.00'))
+
+    def test_price_matrix_is_dense_and_filled(self):
+        company_ids, timestamps, prices = load_price_matrix(self.start, self.start + timedelta(days=1), '1h')
+        self.assertEqual(list(company_ids), [self.green.pk, self.brown.pk])
+        self.assertEqual(prices.shape, (2, 9))
+        self.assertTrue(np.all(prices[1] == 50.0))
+
+    def test_evaluate_buy_and_hold_versus_rebalancing(self):
+        prices = np.array([[1.0, 2.0, 4.0], [1.0, 1.0, 1.0]])
+        weights = np.full((2, 3), 0.5)
+        held, _ = evaluate(prices, weights, 3)
+        rebalanced, holdings = evaluate(prices, weights, 1)
+        np.testing.assert_allclose(held, [1.0, 1.5, 2.5])
+        np.testing.assert_allclose(rebalanced, [1.0, 1.5, 2.25])
+        np.testing.assert_allclose(holdings.sum(axis=0), 1.0)
+
+    def test_strategies_report_return_drawdown_and_green_impact(self):
+        end = self.start + timedelta(days=1)
+        greenest = run_backtest('greenest', self.start, end, '1h', top_n=1)
+        self.assertAlmostEqual(greenest['total_return'], 1.0)
+        self.assertEqual(greenest['max_drawdown'], 0.0)
+        self.assertAlmostEqual(greenest['green_impact'], 9.0)
+        weekly = run_backtest('weekly_rebalance', self.start, end, '1h')
+        self.assertAlmostEqual(weekly['total_return'], 0.5)
+        self.assertEqual(len(weekly['series']), 9)
+
+    def test_api_validates_and_memoizes(self):
+        url = reverse('market:backtest_api')
+        params = {'strategy': 'momentum', 'start': self.start.isoformat(), 'interval': '1h', 'lookback': 2}
+        first = self.client.get(url, params).json()
+        self.assertEqual(first['steps'], 9)
+        with CaptureQueriesContext(connection) as cached:
+            self.assertEqual(self.client.get(url, params).json(), first)
+        self.assertFalse(any('market_hourcandle' in q['sql'] for q in cached.captured_queries))
+        self.assertEqual(self.client.get(url, {'strategy': 'yolo'}).status_code, 400)
+
+
+class GenerateMarketEventsTestCase(TestCase):
+    """Tests for bulk market event generation."""
+
+    def setUp(self):
+        for i in range(8):
+            Company.objects.create(name=f"Co {i}", description="", sector='Energy' if i < 4 else 'Retail')
+
+    def generate(self, **options):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('generate_market_events', stdout=StringIO(), **options)
+        return len(queries.captured_queries)
+
+    def test_events_are_bulk_created_with_their_window(self):
+        # The first run opens the impact series buckets, later runs only update them
+        self.generate(count=5)
+        few = self.generate(count=5)
+        many = self.generate(count=200)
+        # Only SQLite's bulk insert batching adds statements as events grow
+        self.assertLess(many, few + 5)
+        self.assertEqual(MarketEvent.objects.count(), 210)
+        self.assertFalse(MarketEvent.objects.filter(ends_at__isnull=True).exists())
+        event = MarketEvent.objects.last()
+        self.assertEqual(event.ends_at, event.event_date + timedelta(minutes=event.duration))
+        counts = MarketEvent.objects.annotate(n=Count('companies_affected')).values_list('n', flat=True)
+        self.assertTrue(all(1 <= n <= 4 for n in counts))
+        self.assertEqual(EventImpactBucket.objects.filter(interval='1d').last().event_count, 210)
+
+    def test_sector_weight_focuses_events_on_one_sector(self):
+        self.generate(count=30, sector_weight=1e9)
+        for event in MarketEvent.objects.prefetch_related('companies_affected'):
+            self.assertEqual(len({c.sector for c in event.companies_affected.all()}), 1)
+
+
+class LowPriceResetTestCase(TestCase):
+    """Tests for the set-based reset of companies stuck below the price threshold."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.stuck = Company.objects.create(name="Stuck Co", description="", current_stock_price=Decimal('1.10'),
+                                            price_low_since=self.now - timedelta(minutes=3))
+        self.dipping = Company.objects.create(name="Dipping Co", description="", current_stock_price=Decimal('1.20'),
+                                              price_low_since=self.now - timedelta(minutes=1))
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f"holder{i}", password="testpass")
+            UserProfile.objects.create(user=user)
+            buy_shares(user, self.stuck, 10 + i, Decimal('1.10'))
+            buy_shares(user, self.dipping, 1, Decimal('1.20'))
+            self.users.append(user)
+
+    def test_due_companies_are_reset_in_one_pass(self):
+        with CaptureQueriesContext(connection) as queries:
+            resets = reset_low_value_stocks(self.now)
+        self.assertEqual(resets, [(self.stuck.pk, "Stuck Co", 33)])
+        # One query per step, plus the history insert and a lookup and insert per candle table
+        self.assertLessEqual(len(queries.captured_queries), 15)
+
+        self.stuck.refresh_from_db()
+        self.assertEqual((self.stuck.current_stock_price, self.stuck.price_low_since), (Decimal('100.00'), None))
+        self.assertFalse(Investment.objects.filter(company=self.stuck).exists())
+        self.assertFalse(Position.objects.filter(company=self.stuck).exists())
+        self.assertEqual(Position.objects.filter(company=self.dipping).count(), 3)
+        self.assertEqual(StockPriceHistory.objects.filter(company=self.stuck).get().price, Decimal('100.00'))
+        self.assertEqual(MinuteCandle.objects.get(company=self.stuck).close, Decimal('100.00'))
+        notice = MarketNotification.objects.get(user=self.users[2])
+        self.assertIn("Your 12 shares were removed", notice.message)
+        self.assertEqual(reset_low_value_stocks(self.now), [])
+
+    def test_command_refreshes_the_leaderboard(self):
+        call_command('reset_low_value_stocks', stdout=StringIO())
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.users[2]).total_shares, 1)
+
+    def test_tick_records_threshold_crossings(self):
+        falling = Company.objects.create(name="Falling Co", description="", current_stock_price=Decimal('1.51'))
+        tick = run_price_tick(now=self.now, rng=np.random.default_rng(0))
+        falling.refresh_from_db()
+        index = list(tick.company_ids).index(falling.pk)
+        if falling.current_stock_price < Decimal('1.50'):
+            self.assertTrue(tick.crossed_below()[index])
+            self.assertEqual(falling.price_low_since, self.now)
+        self.assertTrue(tick.below_threshold()[list(tick.company_ids).index(self.stuck.pk)])
+        # The original crossing time is kept while the price stays low
+        self.stuck.refresh_from_db()
+        self.assertEqual(self.stuck.price_low_since, self.now - timedelta(minutes=3))
+
+    def test_portfolio_shows_notifications_once(self):
+        reset_low_value_stocks(self.now)
+        self.client.login(username="holder0", password="testpass")
+        response = self.client.get(reverse('market:portfolio'))
+        self.assertContains(response, "Stuck Co stayed below")
+        response = self.client.get(reverse('market:portfolio'))
+        self.assertNotContains(response, "Stuck Co stayed below")
+
+
+class MarketTickPipelineTestCase(TestCase):
+    """Tests for the serialized market tick pipeline and its tick log."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.user = User.objects.create_user(username="ticker", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        for i in range(3):
+            company = Company.objects.create(name=f"Tick Co {i}", description="", current_stock_price=Decimal('50.00'))
+        buy_shares(self.user, company, 5, Decimal('50.00'))
+
+    def test_tick_runs_every_stage_in_order_and_logs_it(self):
+        log = run_market_tick(self.now)
+        self.assertEqual(log.status, MarketTickLog.OK)
+        self.assertEqual(list(log.stages), ['prices', 'event_generation', 'resets', 'snapshots', 'leaderboard', 'analytics'])
+        moved = Company.objects.exclude(current_stock_price=Decimal('50.00')).count()
+        self.assertEqual(log.stages['prices']['work'], moved)
+        self.assertGreater(log.stages['event_generation']['work'], 0)
+        self.assertEqual(log.stages['resets'], {'skipped': True})
+        self.assertEqual(log.stages['leaderboard']['work'], 1)
+        self.assertEqual(StockPriceHistory.objects.count(), 3)
+        self.assertTrue(PortfolioSnapshot.objects.filter(user=self.user).exists())
+        self.assertEqual(MarketTickLog.objects.count(), 1)
+
+    def test_stages_without_work_are_skipped(self):
+        run_market_tick(self.now)
+        # With no companies left nothing can move, and the events from the first tick are still fresh
+        Company.objects.all().delete()
+        log = run_market_tick(self.now + timedelta(seconds=30))
+        self.assertEqual(log.stages['prices']['work'], 0)
+        for stage in ('event_generation', 'resets', 'snapshots', 'leaderboard', 'analytics'):
+            self.assertEqual(log.stages[stage], {'skipped': True}, stage)
+
+    def test_overlapping_tick_is_skipped(self):
+        with database_lock(TICK_LOCK_NAME) as acquired:
+            self.assertTrue(acquired)
+            log = run_market_tick(self.now)
+        self.assertEqual(log.status, MarketTickLog.OVERLAP)
+        self.assertFalse(StockPriceHistory.objects.exists())
+        # The lock is free again once the holder is done
+        self.assertEqual(run_market_tick(self.now + timedelta(seconds=30)).status, MarketTickLog.OK)
+
+    def test_local_scheduler_runs_ticks(self):
+        logs = []
+        self.assertEqual(run_local_scheduler(interval=0.01, count=2, on_tick=logs.append), 2)
+        self.assertEqual([log.status for log in logs], [MarketTickLog.OK, MarketTickLog.OK])
+        self.assertEqual(MarketTickLog.objects.count(), 2)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    PRICE_CACHE_ALIAS: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'market-analytics-test'},
+})
+class MarketAnalyticsTestCase(TestCase):
+    """Tests for the rolling statistics and correlations behind the analytics APIs."""
+
+    def setUp(self):
+        caches[PRICE_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username="analyst", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username="analyst", password="testpass")
+        self.solar = Company.objects.create(name="Solar", description="", sector="Energy")
+        self.wind = Company.objects.create(name="Wind", description="", sector="Energy")
+        self.farm = Company.objects.create(name="Farm", description="", sector="Food")
+        # Wind moves exactly like Solar at twice the price; Farm zig-zags on its own
+        rng = np.random.default_rng(5)
+        solar = 100 * np.cumprod(1 + rng.normal(0, 0.02, 60))
+        farm = 50 * np.cumprod(1 + rng.normal(0, 0.02, 60))
+        start = bucket_start(timezone.now() - timedelta(hours=60), 3600)
+        candles = []
+        for company, closes in ((self.solar, solar), (self.wind, 2 * solar), (self.farm, farm)):
+            for i, close in enumerate(closes):
+                candles.append(HourCandle(company=company, bucket_start=start + timedelta(hours=i),
+                                          open=1, high=1, low=1, close=Decimal(str(round(close, 2)))))
+        HourCandle.objects.bulk_create(candles)
+        self.solar_closes = np.array([float(c.close) for c in candles[:60]])
+
+    def test_rolling_statistics_match_naive_windows(self):
+        values = np.random.default_rng(0).normal(size=(3, 30))
+        means = rolling_mean(values, 5)
+        stds = rolling_std(values, 5)
+        self.assertTrue(np.isnan(means[:, :4]).all())
+        for t in range(4, 30):
+            np.testing.assert_allclose(means[:, t], values[:, t - 4:t + 1].mean(axis=1))
+            np.testing.assert_allclose(stds[:, t], values[:, t - 4:t + 1].std(axis=1), atol=1e-9)
+
+    def test_market_analytics_correlates_companies_and_sectors(self):
+        result = market_analytics('1h')
+        by_id = {c['id']: c for c in result['companies']}
+        self.assertEqual(result['steps'], 60)
+        self.assertEqual(by_id[self.solar.pk]['correlated'][0]['id'], self.wind.pk)
+        self.assertAlmostEqual(by_id[self.solar.pk]['correlated'][0]['correlation'], 1.0, places=3)
+        self.assertAlmostEqual(by_id[self.solar.pk]['sma_short'], self.solar_closes[-12:].mean(), places=4)
+        peak = self.solar_closes.max()
+        self.assertAlmostEqual(by_id[self.solar.pk]['drawdown'], 1 - self.solar_closes[-1] / peak, places=6)
+        self.assertEqual(result['sectors'], ['Energy', 'Food'])
+        self.assertAlmostEqual(result['correlation'][0][0], 1.0)
+        self.assertAlmostEqual(result['correlation'][0][1], result['correlation'][1][0])
+
+    def test_market_api_is_computed_once_per_tick(self):
+        self.client.get(reverse('market:market_analytics_api'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('market:market_analytics_api'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if 'market_hourcandle' in q['sql']])
+        # A new tick changes the data version and the analytics are computed again
+        StockPriceHistory.objects.create(company=self.solar, price=Decimal('1.00'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('market:market_analytics_api'))
+        self.assertTrue([q for q in queries.captured_queries if 'market_hourcandle' in q['sql']])
+
+    def test_company_api_returns_downsampled_series_with_statistics(self):
+        response = self.client.get(reverse('market:company_analytics_api', args=[self.farm.pk]), {'max_points': 20})
+        data = response.json()
+        self.assertEqual(len(data['series']), 20)
+        self.assertEqual(data['stats']['name'], "Farm")
+        self.assertIsNone(data['series'][0]['sma_short'])
+        self.assertIsNotNone(data['series'][-1]['sma_long'])
+        self.assertEqual(self.client.get(reverse('market:company_analytics_api', args=[self.farm.pk]),
+                                         {'interval': '5m'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('market:company_analytics_api', args=[999999])).status_code, 404)
+
+
+class TradeJournalTestCase(TestCase):
+    """Tests for the write-behind trade journal, its history pages and exports."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="journal", password="testpass")
+        UserProfile.objects.create(user=self.user)
+        self.client.login(username="journal", password="testpass")
+        self.company = Company.objects.create(name="Journal Co", description="", current_stock_price=Decimal('10.00'))
+
+    def trade(self, shares=1, timestamp=None):
+        return Transaction(user=self.user, company=self.company, transaction_type='buy', shares=shares,
+                           price_per_share=Decimal('10.00'), total=Decimal('10.00') * shares,
+                           timestamp=timestamp or timezone.now())
+
+    def test_buffer_is_written_in_one_insert_once_full(self):
+        journal = TradeJournal(flush_size=3, flush_interval_ms=60000)
+        journal.record([self.trade(1), self.trade(2)])
+        self.assertEqual((journal.pending(), Transaction.objects.count()), (2, 0))
+        with self.assertNumQueries(1):
+            journal.record([self.trade(3)])
+        self.assertEqual(journal.pending(), 0)
+        self.assertEqual(list(Transaction.objects.order_by('id').values_list('shares', flat=True)), [1, 2, 3])
+
+    def test_journal_is_append_only(self):
+        Transaction.objects.bulk_create([self.trade()])
+        entry = Transaction.objects.get()
+        entry.shares = 5
+        with self.assertRaises(TypeError):
+            entry.save()
+        with self.assertRaises(TypeError):
+            entry.delete()
+        with self.assertRaises(TypeError):
+            Transaction.objects.update(shares=5)
+        with self.assertRaises(TypeError):
+            Transaction.objects.all().delete()
+
+    def test_history_pages_by_keyset(self):
+        # Rows sharing a timestamp are split across pages by id without repeats or gaps
+        now = timezone.now()
+        Transaction.objects.bulk_create([self.trade(i + 1, now - timedelta(minutes=i // 4)) for i in range(120)])
+        seen, url, queries = [], reverse('market:transaction_history'), []
+        while url and len(queries) < 5:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            queries.append(len(captured.captured_queries))
+            seen.extend(t.shares for t in response.context['transactions'])
+            cursor = response.context['next_cursor']
+            url = f"{reverse('market:transaction_history')}?before={cursor}" if cursor else None
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(sorted(seen), list(range(1, 121)))
+        self.assertEqual(seen[:4], [4, 3, 2, 1])
+        # Deeper pages cost no more than the ones before them (the first request also loads the session)
+        self.assertEqual(queries[1], queries[2])
+
+    def test_export_streams_csv_and_json(self):
+        Transaction.objects.bulk_create([self.trade(i + 1, timezone.now() + timedelta(seconds=i)) for i in range(3)])
+        response = self.client.get(reverse('market:transaction_export'))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'timestamp,company,type,shares,price_per_share,total')
+        self.assertEqual([line.split(',')[3] for line in lines[1:]], ['1', '2', '3'])
+
+        response = self.client.get(reverse('market:transaction_export'), {'format': 'json'})
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([(r['company'], r['shares'], r['total']) for r in rows],
+                         [("Journal Co", 1, '10.00'), ("Journal Co", 2, '20.00'), ("Journal Co", 3, '30.00')])
+        self.assertEqual(self.client.get(reverse('market:transaction_export'), {'format': 'xml'}).status_code, 400)
+
+
+class TradeJournalFlushTestCase(TransactionTestCase):
+    """A partly filled journal buffer is written by the background flusher."""
+
+    def test_buffer_is_flushed_after_the_interval(self):
+        user = User.objects.create_user(username="later")
+        company = Company.objects.create(name="Later Co", description="")
+        journal = TradeJournal(flush_size=100, flush_interval_ms=20)
+        journal.record([Transaction(user=user, company=company, transaction_type='sell', shares=2,
+                                    price_per_share=Decimal('1.00'), total=Decimal('2.00'))])
+        # Polling the table while the flusher writes to it can hit SQLite's shared-cache table lock
+        self.assertTrue(journal.wait_idle(timeout=5))
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(journal.pending(), 0)
@@ -18,6 +18,10 @@ urlpatterns = [
     path('api/portfolio-analytics/', views.portfolio_analytics_api, name='portfolio_analytics_api'),
     path('portfolio-analytics/', views.portfolio_analytics, name='portfolio_analytics'),
     path('transaction-history/', views.transaction_history, name='transaction_history'),
+    path('transaction-history/export/', views.transaction_export, name='transaction_export'),
     path('api/portfolio-breakdown/', views.portfolio_breakdown_api, name='portfolio_breakdown_api'),
     path('api/event-impact/', views.event_impact_api, name='event_impact_api'),
+    path('api/backtest/', views.backtest_api, name='backtest_api'),
+    path('api/analytics/', views.market_analytics_api, name='market_analytics_api'),
+    path('company/<int:company_id>/analytics/', views.company_analytics_api, name='company_analytics_api'),
 ]
\ No newline at end of file
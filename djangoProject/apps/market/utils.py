@@ -1,14 +1,20 @@
+from datetime import datetime, time
 from decimal import Decimal
-from apps.market.models import Investment, PortfolioSnapshot, Achievement, UserAchievement
+
+from django.db.models import DecimalField, F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.market.models import Position, PortfolioSnapshot, Achievement, UserAchievement
 
 
 def record_portfolio_snapshot(user):
-    investments = Investment.objects.filter(user=user)
-    total_value = Decimal('0.00')
-    for inv in investments:
-        total_value += inv.company.current_stock_price * inv.shares
+    # Value the user's positions in one aggregate query
+    total_value = Position.objects.filter(user=user).aggregate(
+        total=Sum(F('shares') * F('company__current_stock_price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    )['total'] or Decimal('0.00')
     # Create a snapshot record for the user's portfolio
-    PortfolioSnapshot.objects.create(user=user, total_value=total_value)
+    PortfolioSnapshot.objects.create(user=user, total_value=Decimal(total_value).quantize(Decimal('0.01')))
 
 def check_and_award_achievements(user, portfolio_data):
     """
@@ -33,4 +39,20 @@ def check_and_award_achievements(user, portfolio_data):
     # Award green impact achievements if threshold is met
     for achievement in green_impact_achievements:
         if green_impact >= achievement.threshold:
-            UserAchievement.objects.get_or_create(user=user, achievement=achievement)
\ No newline at end of file
+            UserAchievement.objects.get_or_create(user=user, achievement=achievement)
+
+
+def parse_bound(value):
+    """Parses an ISO date or datetime string into an aware datetime, or None if invalid."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.combine(day, time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
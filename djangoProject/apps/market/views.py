@@ -1,18 +1,34 @@
+import csv
+import hashlib
+import itertools
+import json
+
 from django.core.paginator import Paginator
-from django.http import JsonResponse, Http404
+from django.db.models import Q
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.contrib.auth.decorators import login_required
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 
-from django.utils.dateparse import parse_date
-
-from .models import Company, Investment, MarketEvent, Transaction
+from .models import Company, Investment, MarketEvent, Transaction, LeaderboardEntry, Position, MarketNotification
 from .forms import InvestmentForm, SellInvestmentForm
 from ..battlepass.utils import add_battle_pass_points
 from apps.users.utils import add_xp
 from ..users.models import UserProfile
 from django.utils import timezone
-from apps.market.utils import record_portfolio_snapshot
+from apps.market.utils import record_portfolio_snapshot, parse_bound
+from apps.market.rollups import CANDLE_INTERVALS, bucket_start
+from apps.market.leaderboard import leaderboard_rank, refresh_leaderboard_entry
+from apps.market.orders import BUY, SELL, place_order
+from apps.market.price_cache import apply_current_prices, current_prices
+from apps.market.snapshots import portfolio_series
+from apps.market.analytics import ANALYTICS_SPANS, DEFAULT_INTERVAL, cached_market_analytics, company_analytics
+from apps.market.backtest import DEFAULT_LOOKBACK, DEFAULT_TOP_N, STRATEGIES, cached_backtest
+from apps.market.downsampling import lttb
+from apps.market.event_impact import IMPACT_INTERVALS, impact_series
 
 
 
@@ -24,14 +40,16 @@ def market_home(request):
 
 @login_required
 def company_list(request):
-    companies = Company.objects.all().order_by('-sustainability_rating')
+    # Prices come from the shared per-tick snapshot rather than the company rows
+    companies = Company.objects.defer('current_stock_price').order_by('-sustainability_rating')
 
     # Paginate the companies (10 per page)
     paginator = Paginator(companies, 12)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = apply_current_prices(page_obj.object_list)
 
-    user_company_ids = Investment.objects.filter(user=request.user).values_list('company__pk', flat=True)
+    user_company_ids = Position.objects.filter(user=request.user).values_list('company_id', flat=True)
 
     context = {
         'companies': page_obj,
@@ -46,19 +64,16 @@ from apps.market.models import Company, MarketEvent, Investment
 
 @login_required
 def company_detail(request, pk):
-    company = get_object_or_404(Company, pk=pk)
+    company = get_object_or_404(Company.objects.defer('current_stock_price'), pk=pk)
+    apply_current_prices([company])
 
-    # Retrieve market events affecting this company that have started.
-    events = MarketEvent.objects.filter(
-        companies_affected=company,
-        event_date__lte=timezone.now()
+    # Retrieve the market events affecting this company that are active right now.
+    active_events = MarketEvent.objects.active().filter(
+        companies_affected=company
     ).order_by('-event_date')
 
-    # Further filter events by checking if each event is active.
-    active_events = [event for event in events if event.is_active()]
-
     # Check if the user holds any stock in this company.
-    user_has_investment = Investment.objects.filter(user=request.user, company=company).exists()
+    user_has_investment = Position.objects.filter(user=request.user, company=company).exists()
 
     context = {
         'company': company,
@@ -73,47 +88,36 @@ def invest_in_company(request, pk):
     if request.method == 'POST':
         form = InvestmentForm(request.POST)
         if form.is_valid():
-            investment = form.save(commit=False)
-            investment.user = request.user
-            investment.company = company
-            investment.purchase_price = company.current_stock_price
-            # Calculate total cost of the investment
-            total_cost = company.current_stock_price * investment.shares
-            # Check if the user has enough currency (assuming a UserProfile with currency_balance)
-            user_profile = UserProfile.objects.get(user=request.user)
-            if user_profile.currency_balance >= total_cost:
-                user_profile.currency_balance -= total_cost
-                user_profile.save()
-                investment.save()
+            shares = form.cleaned_data['shares']
+            # The order engine debits the balance only if it covers the cost
+            order = place_order(request.user, company, BUY, shares)
+            if order.filled:
                 record_portfolio_snapshot(request.user)
+                refresh_leaderboard_entry(request.user)
                 # Grant XP based on investment amount
-                investment_xp = max(10, min(total_cost // 10, 100))  # Scales XP from 10 to 100 max
+                investment_xp = max(10, min(order.total // 10, 100))  # Scales XP from 10 to 100 max
                 add_xp(request.user, investment_xp)
                 return redirect('market:company_detail', pk=company.pk)
             else:
-                form.add_error(None, "Insufficient funds to make this investment.")
+                form.add_error(None, order.error)
     else:
         form = InvestmentForm()
     return render(request, 'market/invest.html', {'company': company, 'form': form})
 
 @login_required
 def portfolio(request):
-    investments = Investment.objects.filter(user=request.user)
-    grouped = {}
-    for inv in investments:
-        company_id = inv.company.pk
-        if company_id in grouped:
-            grouped[company_id]['shares'] += inv.shares
-            grouped[company_id]['invested_amount'] += inv.purchase_price * inv.shares
-            grouped[company_id]['current_amount'] = inv.company.current_stock_price * grouped[company_id]['shares']
-        else:
-            grouped[company_id] = {
-                'company': inv.company,
-                'shares': inv.shares,
-                'invested_amount': inv.purchase_price * inv.shares,
-                'current_amount': inv.company.current_stock_price * inv.shares,
-            }
-    portfolio_data = list(grouped.values())
+    positions = list(Position.objects.filter(user=request.user).select_related('company')
+                     .defer('company__current_stock_price').order_by('company__name'))
+    apply_current_prices(position.company for position in positions)
+    portfolio_data = [
+        {
+            'company': position.company,
+            'shares': position.shares,
+            'invested_amount': position.cost_basis,
+            'current_amount': position.company.current_stock_price * position.shares,
+        }
+        for position in positions
+    ]
 
     total_invested = sum(item['invested_amount'] for item in portfolio_data)
     current_value = sum(item['current_amount'] for item in portfolio_data)
@@ -135,7 +139,13 @@ def portfolio(request):
     print("ROI:", roi)
     print("Avg Sustainability:", avg_sustainability)
 
+    # Show resets and other market notices once
+    notifications = list(MarketNotification.objects.filter(user=request.user, is_read=False).order_by('-created_at'))
+    if notifications:
+        MarketNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(is_read=True)
+
     context = {
+        'notifications': notifications,
         'portfolio_data': portfolio_data,
         'total_invested': total_invested,
         'current_value': current_value,
@@ -147,13 +157,12 @@ def portfolio(request):
 
 @login_required
 def sell_investment(request, company_pk):
-    # Retrieve all investments for the user in the given company
-    investments = Investment.objects.filter(user=request.user, company__pk=company_pk).order_by('id')
-    if not investments.exists():
+    # The aggregated position holds the total shares owned for this company
+    position = Position.objects.filter(user=request.user, company__pk=company_pk).select_related('company').first()
+    if position is None:
         raise Http404("No investment found for this company.")
-
-    # Sum the total shares owned for this company
-    total_shares = sum(inv.shares for inv in investments)
+    company = position.company
+    total_shares = position.shares
 
     if request.method == 'POST':
         form = SellInvestmentForm(request.POST)
@@ -162,36 +171,23 @@ def sell_investment(request, company_pk):
             if shares_to_sell > total_shares:
                 form.add_error('shares', 'You cannot sell more shares than you own.')
             else:
-                current_price = investments.first().company.current_stock_price
-                sale_value = current_price * shares_to_sell
-                # Update user's balance
-                user_profile = UserProfile.objects.get(user=request.user)
-                user_profile.currency_balance += sale_value
-                user_profile.save()
-                add_battle_pass_points(user_profile, sale_value*investments.first().company.sustainability_rating // 100)
-
-                # Process the sale from the aggregated investments (FIFO: sell from the oldest first)
-                remaining_to_sell = shares_to_sell
-                for inv in investments:
-                    if remaining_to_sell <= 0:
-                        break
-                    if inv.shares <= remaining_to_sell:
-                        remaining_to_sell -= inv.shares
-                        inv.delete()
-                    else:
-                        inv.shares -= remaining_to_sell
-                        inv.save()
-                        remaining_to_sell = 0
-
-                # Record portfolio snapshot
-                record_portfolio_snapshot(request.user)
-                return redirect('market:portfolio')
+                # Sells from the oldest lots first and credits the sale value
+                order = place_order(request.user, company, SELL, shares_to_sell)
+                if order.filled:
+                    user_profile = UserProfile.objects.get(user=request.user)
+                    add_battle_pass_points(user_profile, order.total*company.sustainability_rating // 100)
+
+                    # Record portfolio snapshot
+                    record_portfolio_snapshot(request.user)
+                    refresh_leaderboard_entry(request.user)
+                    return redirect('market:portfolio')
+                form.add_error('shares', order.error)
     else:
         form = SellInvestmentForm()
 
     # Pass the aggregated information to the template for display
     context = {
-        'company': investments.first().company,
+        'company': company,
         'total_shares': total_shares,
         'form': form
     }
@@ -200,7 +196,7 @@ def sell_investment(request, company_pk):
 @login_required
 def market_events(request):
     events = MarketEvent.objects.order_by('-event_date')[:10]  # Show the latest 10 events
-    user_companies = Investment.objects.filter(user=request.user).values_list('company__pk', flat=True).distinct()
+    user_companies = Position.objects.filter(user=request.user).values_list('company_id', flat=True)
     context = {
         'events': events,
         'user_companies': list(user_companies),
@@ -209,46 +205,35 @@ def market_events(request):
 
 @login_required
 def leaderboard(request):
-    profiles = UserProfile.objects.all()
-
-    # Define a helper function to calculate green impact score if not already defined
-    def calculate_green_impact(profile):
-        total = Decimal('0.00')
-        # Assuming the Investment model has a related name 'investments'
-        for inv in profile.user.investments.all():
-            total += inv.company.sustainability_rating * inv.shares
-        return total
-
-    # Annotate each profile with total portfolio value and green impact score.
-    leaderboard_data = []
-    for profile in profiles:
-        total_value = sum(inv.company.current_stock_price * inv.shares for inv in profile.user.investments.all())
-        green_impact = calculate_green_impact(profile)
-        leaderboard_data.append({
-            'user': profile.user,
-            'balance': profile.currency_balance,
-            'portfolio_value': total_value,
-            'green_impact': green_impact,
-        })
-
-    # Sort profiles by green impact score descending (you can change to portfolio_value if desired)
-    leaderboard_data = sorted(leaderboard_data, key=lambda x: x['green_impact'], reverse=True)
-
-    return render(request, 'market/leaderboard.html', {'leaderboard': leaderboard_data})
+    # Standings are materialized in LeaderboardEntry, so this is one ordered, paginated query
+    entries = LeaderboardEntry.objects.select_related('user__userprofile').order_by('-green_impact', 'user_id')
+    paginator = Paginator(entries, 25)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    my_entry = LeaderboardEntry.objects.filter(user=request.user).first()
+    context = {
+        'leaderboard': page_obj,
+        'my_entry': my_entry,
+        'my_rank': leaderboard_rank(my_entry) if my_entry else None,
+    }
+    return render(request, 'market/leaderboard.html', context)
 
 @login_required
 def portfolio_data_api(request):
-    investments = Investment.objects.filter(user=request.user)
-    data = []
-    for inv in investments:
-        data.append({
-            'company': inv.company.name,
-            'company_pk': inv.company.pk,  # Include the primary key here
-            'shares': inv.shares,
-            'invested_amount': str(inv.purchase_price * inv.shares),
-            'current_amount': str(inv.company.current_stock_price * inv.shares),
-            'investment_id': inv.id,
-        })
+    positions = list(Position.objects.filter(user=request.user).order_by('company__name').values_list(
+        'company__name', 'company_id', 'shares', 'cost_basis'
+    ))
+    prices = current_prices(company_pk for _, company_pk, _, _ in positions)
+    data = [
+        {
+            'company': name,
+            'company_pk': company_pk,
+            'shares': shares,
+            'invested_amount': str(cost_basis),
+            'current_amount': str(prices[company_pk] * shares),
+        }
+        for name, company_pk, shares, cost_basis in positions
+    ]
     return JsonResponse({'portfolio': data})
 
 def about_eco_score(request):
@@ -257,92 +242,386 @@ def about_eco_score(request):
     """
     return render(request, 'market/about_eco_score.html')
 
+# When no interval is requested, spans up to each length are served from that table
+PRICE_HISTORY_AUTO_INTERVALS = [
+    (timedelta(hours=1), 'raw'),
+    (timedelta(days=1), '1m'),
+    (timedelta(days=60), '1h'),
+]
+DEFAULT_PRICE_HISTORY_SPAN = timedelta(hours=1)
+DEFAULT_PRICE_HISTORY_LIMIT = 500
+MAX_PRICE_HISTORY_LIMIT = 2000
+
+
+@login_required
 def price_history_api(request, company_id):
-    company = get_object_or_404(Company, pk=company_id)
-    history = company.price_history.order_by('date').values('date', 'price')
-    # Convert the date to a string for JSON serialization
-    data = [{'date': h['date'].strftime('%Y-%m-%d %H:%M:%S'), 'price': str(h['price'])} for h in history]
-    return JsonResponse({'history': data})
+    """
+    Returns a company's price history between `start` and `end` (ISO dates or
+    datetimes, defaulting to the hour up to the latest tick). `interval` selects raw ticks or the
+    1m/1h/1d candle rollups; if omitted it is chosen from the span so the
+    response size stays bounded as history grows.
+
+    Pagination is keyset based: without `since` the latest `limit` points are
+    returned, with `since` the first `limit` points after it. Pass the returned
+    `next_since` back as `since` to fetch only new points. Without `since`,
+    `has_more` says older points exist; pass `next_before` back as `before` to
+    page backwards through them. Responses carry an ETag derived from the
+    latest tick, the resolved window and the paging parameters, and a
+    Last-Modified from the latest tick; only an unchanged poll of the same
+    page matching the ETag gets a 304.
+    """
+    company = get_object_or_404(Company.objects.only('id'), pk=company_id)
+    latest_tick = company.price_history.order_by('-date').values_list('date', flat=True).first()
+
+    # The default window ends at the latest tick rather than now, so it only moves when the data does
+    end = parse_bound(request.GET['end']) if request.GET.get('end') else (latest_tick or timezone.now())
+    if end is None:
+        return JsonResponse({'error': 'Invalid end.'}, status=400)
+    start = parse_bound(request.GET['start']) if request.GET.get('start') else end - DEFAULT_PRICE_HISTORY_SPAN
+    if start is None:
+        return JsonResponse({'error': 'Invalid start.'}, status=400)
+    since = parse_bound(request.GET['since']) if request.GET.get('since') else None
+    if request.GET.get('since') and since is None:
+        return JsonResponse({'error': 'Invalid since.'}, status=400)
+    before = parse_bound(request.GET['before']) if request.GET.get('before') else None
+    if request.GET.get('before') and before is None:
+        return JsonResponse({'error': 'Invalid before.'}, status=400)
+    if since and before:
+        return JsonResponse({'error': 'Pass either since or before, not both.'}, status=400)
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_PRICE_HISTORY_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit.'}, status=400)
+    limit = max(1, min(limit, MAX_PRICE_HISTORY_LIMIT))
+
+    interval = request.GET.get('interval')
+    if not interval:
+        interval = next((name for span, name in PRICE_HISTORY_AUTO_INTERVALS if end - start <= span), '1d')
+    if interval != 'raw' and interval not in CANDLE_INTERVALS:
+        return JsonResponse({'error': 'Unknown interval.'}, status=400)
+
+    if latest_tick is not None:
+        version = [company.pk, latest_tick, interval, start, end, since, before, limit]
+        etag = quote_etag(hashlib.sha256(repr(version).encode()).hexdigest()[:32])
+        last_modified = int(latest_tick.timestamp())
+        # If-Modified-Since cannot tell pages apart, so only the ETag is checked
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+    if interval == 'raw':
+        points = company.price_history.filter(date__gte=start, date__lte=end)
+        if since:
+            points = points.filter(date__gt=since)
+        if before:
+            points = points.filter(date__lt=before)
+        date_field, columns = 'date', ('date', 'price')
+    else:
+        model, seconds = CANDLE_INTERVALS[interval]
+        points = model.objects.filter(
+            company=company, bucket_start__gte=bucket_start(start, seconds), bucket_start__lte=end
+        )
+        if since:
+            # The candle containing `since` may still be open, so it is sent again
+            points = points.filter(bucket_start__gte=bucket_start(since, seconds))
+        if before:
+            points = points.filter(bucket_start__lt=before)
+        date_field, columns = 'bucket_start', ('bucket_start', 'close', 'open', 'high', 'low')
+
+    if since:
+        rows = list(points.order_by(date_field).values_list(*columns)[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = list(points.order_by('-' + date_field).values_list(*columns)[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+
+    if interval == 'raw':
+        data = [{'date': d.isoformat(' ', 'seconds'), 'price': str(p)} for d, p in rows]
+    else:
+        # 'price' is the close so charts can plot candles and raw ticks the same way
+        data = [
+            {'date': d.isoformat(' ', 'seconds'), 'price': str(c), 'open': str(o), 'high': str(h),
+             'low': str(lo), 'close': str(c)}
+            for d, c, o, h, lo in rows
+        ]
+
+    response = JsonResponse({
+        'interval': interval,
+        'history': data,
+        'next_since': rows[-1][0].isoformat() if rows else (since.isoformat() if since else None),
+        'next_before': rows[0][0].isoformat() if rows and has_more and not since else None,
+        'has_more': has_more,
+    })
+    if latest_tick is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+DEFAULT_ANALYTICS_POINTS = 500
+MAX_ANALYTICS_POINTS = 2000
+
 
 @login_required
 def portfolio_analytics_api(request):
-    snapshots = request.user.portfolio_snapshots.order_by('timestamp')
-
-    # Get optional start and end dates from query parameters
+    """
+    Returns the user's portfolio value history between the optional
+    `start_date` and `end_date` (inclusive). Long ranges are served from the
+    hourly/daily rollups (see snapshots.py) and the series is downsampled with
+    LTTB to at most `max_points` points, so the response size stays constant
+    whatever the range.
+    """
+    start = end = None
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
-
     if start_date:
-        start_date_parsed = parse_date(start_date)
-        if start_date_parsed:
-            snapshots = snapshots.filter(timestamp__date__gte=start_date_parsed)
+        start = parse_bound(start_date)
     if end_date:
-        end_date_parsed = parse_date(end_date)
-        if end_date_parsed:
-            snapshots = snapshots.filter(timestamp__date__lte=end_date_parsed)
-
+        end = parse_bound(end_date)
+        if end:
+            end += timedelta(days=1)
+    try:
+        max_points = int(request.GET.get('max_points', DEFAULT_ANALYTICS_POINTS))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid max_points.'}, status=400)
+    max_points = max(3, min(max_points, MAX_ANALYTICS_POINTS))
+
+    resolution, points = portfolio_series(request.user, start, end)
+    if len(points) > max_points:
+        keep = lttb([p[0].timestamp() for p in points], [float(p[1]) for p in points], max_points)
+        points = [points[i] for i in keep]
     data = [
         {
-            'timestamp': s.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'total_value': str(s.total_value)
+            'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_value': str(total_value)
         }
-        for s in snapshots
+        for timestamp, total_value in points
     ]
-    return JsonResponse({'snapshots': data})
+    return JsonResponse({'resolution': resolution, 'snapshots': data})
 
 @login_required
 def portfolio_analytics(request):
     return render(request, 'market/portfolio_analytics.html')
 
+TRANSACTION_PAGE_SIZE = 50
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _encode_cursor(entry):
+    # Whole microseconds, so the cursor round-trips exactly (a float timestamp would not)
+    return f"{(entry.timestamp - _EPOCH) // timedelta(microseconds=1)}_{entry.pk}"
+
+
+def _parse_cursor(value):
+    """Parses a "<timestamp in microseconds>_<id>" keyset cursor, or returns None."""
+    micros, _, pk = (value or '').partition('_')
+    if not (micros.isdigit() and pk.isdigit()):
+        return None
+    return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+
+
 @login_required
 def transaction_history(request):
-    transactions = Transaction.objects.filter(user=request.user).order_by('-timestamp')
-    return render(request, 'market/transaction_history.html', {'transactions': transactions})
+    """
+    Lists the user's trades newest first, TRANSACTION_PAGE_SIZE at a time.
+    Pages are keyset based: `before` is the (timestamp, id) cursor of the last
+    row shown, so every page costs one index range scan however deep it is.
+    Trades reach the journal through a write-behind buffer, so the latest may
+    take a moment to appear.
+    """
+    transactions = (Transaction.objects.filter(user=request.user).select_related('company')
+                    .order_by('-timestamp', '-id'))
+    cursor = _parse_cursor(request.GET.get('before'))
+    if cursor:
+        timestamp, pk = cursor
+        transactions = transactions.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    page = list(transactions[:TRANSACTION_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > TRANSACTION_PAGE_SIZE:
+        page = page[:TRANSACTION_PAGE_SIZE]
+        next_cursor = _encode_cursor(page[-1])
+    return render(request, 'market/transaction_history.html', {
+        'transactions': page,
+        'next_cursor': next_cursor,
+        'is_first_page': cursor is None,
+    })
+
+
+TRANSACTION_EXPORT_COLUMNS = ['timestamp', 'company', 'type', 'shares', 'price_per_share', 'total']
+
+
+class _Echo:
+    """A file-like object whose write returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+@login_required
+def transaction_export(request):
+    """
+    Streams all of the user's trades, oldest first, as CSV (the default) or
+    JSON (`?format=json`). Rows are read with a server-side iterator and
+    written as they arrive, so memory use stays flat however long the history.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'json'):
+        return JsonResponse({'error': 'Invalid format.'}, status=400)
+    rows = (Transaction.objects.filter(user=request.user).order_by('timestamp', 'id')
+            .values_list('timestamp', 'company__name', 'transaction_type', 'shares', 'price_per_share', 'total')
+            .iterator(chunk_size=2000))
+
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        lines = itertools.chain(
+            [writer.writerow(TRANSACTION_EXPORT_COLUMNS)],
+            (writer.writerow([timestamp.isoformat(), name, kind, shares, price, total])
+             for timestamp, name, kind, shares, price, total in rows),
+        )
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+    else:
+        def chunks():
+            yield '['
+            for i, (timestamp, name, kind, shares, price, total) in enumerate(rows):
+                yield (',' if i else '') + json.dumps({
+                    'timestamp': timestamp.isoformat(), 'company': name, 'type': kind,
+                    'shares': shares, 'price_per_share': str(price), 'total': str(total),
+                })
+            yield ']'
+        response = StreamingHttpResponse(chunks(), content_type='application/json')
+    response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+    return response
 
 @login_required
 def portfolio_breakdown_api(request):
-    investments = Investment.objects.filter(user=request.user)
-    grouped = {}
-    for inv in investments:
-        company_id = inv.company.pk
-        if company_id in grouped:
-            grouped[company_id]['invested_amount'] += inv.purchase_price * inv.shares
-        else:
-            grouped[company_id] = {
-                'company': inv.company.name,
-                'invested_amount': inv.purchase_price * inv.shares,
-            }
-    data = list(grouped.values())
+    positions = Position.objects.filter(user=request.user).order_by('company__name')
+    data = [
+        {'company': name, 'invested_amount': cost_basis}
+        for name, cost_basis in positions.values_list('company__name', 'cost_basis')
+    ]
     return JsonResponse({'breakdown': data})
 
+# When no bucket is requested, spans up to each length are served at that bucket size
+EVENT_IMPACT_AUTO_BUCKETS = [
+    (timedelta(days=1), '1m'),
+    (timedelta(days=60), '1h'),
+]
+
+
 @login_required
 def event_impact_api(request):
-    # Get all events up to now, ordered chronologically
-    events = MarketEvent.objects.filter(event_date__lte=timezone.now()).order_by('event_date')
-    data = []
-    cumulative_impact = 0
-    for event in events:
-        cumulative_impact += float(event.impact_factor)
-        data.append({
-            'timestamp': event.event_date.strftime('%Y-%m-%d %H:%M:%S'),
-            'cumulative_impact': cumulative_impact,
-            'title': event.title,
-            'impact_factor': float(event.impact_factor),
-        })
-    return JsonResponse({'data': data})
+    """
+    Returns the cumulative market event impact between the optional `start`
+    and `end` (ISO dates or datetimes), read from the pre-aggregated series in
+    `bucket` sized steps (1m, 1h or 1d). Without a bucket one is chosen from
+    the span; without a start the whole history is served daily.
+    """
+    end = parse_bound(request.GET['end']) if request.GET.get('end') else timezone.now()
+    if end is None:
+        return JsonResponse({'error': 'Invalid end.'}, status=400)
+    start = parse_bound(request.GET['start']) if request.GET.get('start') else None
+    if request.GET.get('start') and start is None:
+        return JsonResponse({'error': 'Invalid start.'}, status=400)
+
+    bucket = request.GET.get('bucket')
+    if not bucket:
+        span = end - start if start else None
+        bucket = next((name for limit, name in EVENT_IMPACT_AUTO_BUCKETS if span is not None and span <= limit), '1d')
+    if bucket not in IMPACT_INTERVALS:
+        return JsonResponse({'error': 'Invalid bucket.'}, status=400)
+
+    rows = impact_series(bucket, start, end).values_list('bucket_start', 'event_count', 'impact', 'cumulative_impact')
+    data = [
+        {
+            'timestamp': bucket_date.strftime('%Y-%m-%d %H:%M:%S'),
+            'cumulative_impact': float(cumulative_impact),
+            'impact': float(impact),
+            'event_count': event_count,
+        }
+        for bucket_date, event_count, impact, cumulative_impact in rows
+    ]
+    return JsonResponse({'bucket': bucket, 'data': data})
+
+@login_required
+def backtest_api(request):
+    """
+    Replays a strategy (greenest, momentum or weekly_rebalance) over past
+    prices between `start` and `end` (default: the last 30 days) and returns
+    its total return, max drawdown, green impact and value series. Results are
+    memoized per parameters and data version (see backtest.py).
+    """
+    strategy = request.GET.get('strategy', 'greenest')
+    if strategy not in STRATEGIES:
+        return JsonResponse({'error': 'Invalid strategy.'}, status=400)
+    bounds = {}
+    for name in ('start', 'end'):
+        if request.GET.get(name):
+            bounds[name] = parse_bound(request.GET[name])
+            if bounds[name] is None:
+                return JsonResponse({'error': f'Invalid {name}.'}, status=400)
+    interval = request.GET.get('interval') or None
+    if interval is not None and interval != 'raw' and interval not in CANDLE_INTERVALS:
+        return JsonResponse({'error': 'Invalid interval.'}, status=400)
+    try:
+        top_n = int(request.GET.get('top_n', DEFAULT_TOP_N))
+        lookback = int(request.GET.get('lookback', DEFAULT_LOOKBACK))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid top_n or lookback.'}, status=400)
+    if top_n < 1 or lookback < 1:
+        return JsonResponse({'error': 'Invalid top_n or lookback.'}, status=400)
+
+    result = cached_backtest(strategy, interval=interval, top_n=top_n, lookback=lookback, **bounds)
+    return JsonResponse(result)
+
+DEFAULT_COMPANY_ANALYTICS_POINTS = 500
+
+
+@login_required
+def market_analytics_api(request):
+    """
+    Returns every company's latest rolling volatility, moving averages and
+    drawdown, its most correlated peers and the sector correlation matrix,
+    over the span of `interval` candles (1m, 1h or 1d). Computed once per
+    price tick for the whole market (see analytics.py).
+    """
+    interval = request.GET.get('interval', DEFAULT_INTERVAL)
+    if interval not in ANALYTICS_SPANS:
+        return JsonResponse({'error': 'Invalid interval.'}, status=400)
+    return JsonResponse(cached_market_analytics(interval))
+
+@login_required
+def company_analytics_api(request, company_id):
+    """
+    Returns one company's price series with its rolling statistics,
+    downsampled to at most `max_points` points, and its latest statistics and
+    most correlated peers from the market-wide analytics.
+    """
+    get_object_or_404(Company.objects.only('id'), pk=company_id)
+    interval = request.GET.get('interval', DEFAULT_INTERVAL)
+    if interval not in ANALYTICS_SPANS:
+        return JsonResponse({'error': 'Invalid interval.'}, status=400)
+    try:
+        max_points = int(request.GET.get('max_points', DEFAULT_COMPANY_ANALYTICS_POINTS))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid max_points.'}, status=400)
+    max_points = max(3, min(max_points, MAX_ANALYTICS_POINTS))
+    return JsonResponse(company_analytics(company_id, interval, max_points))
 
 TAX_RATE = Decimal("0.18")
 
 @login_required
 def sell_investment_for_company(request, company_pk):
     company = get_object_or_404(Company, pk=company_pk)
-    # Retrieve all investments for this company by the current user, FIFO (oldest first)
-    investments = Investment.objects.filter(user=request.user, company=company).order_by('id')
-    if not investments.exists():
+    # The aggregated position holds the total shares owned for this company
+    position = Position.objects.filter(user=request.user, company=company).first()
+    if position is None:
         raise Http404("No investment found for this company.")
-
-    # Aggregate total shares owned
-    total_shares = sum(inv.shares for inv in investments)
+    total_shares = position.shares
 
     if request.method == 'POST':
         form = SellInvestmentForm(request.POST)
@@ -351,38 +630,19 @@ def sell_investment_for_company(request, company_pk):
             if shares_to_sell > total_shares:
                 form.add_error('shares', 'You cannot sell more shares than you own.')
             else:
-                # Calculate gross sale value
-                sale_value = shares_to_sell * company.current_stock_price
-                # Calculate tax and net sale value
-                tax_amount = sale_value * TAX_RATE
-                net_sale_value = sale_value - tax_amount
-
-                # Update the user's balance with net proceeds
-                user_profile = UserProfile.objects.get(user=request.user)
-                user_profile.currency_balance += net_sale_value
-                user_profile.save()
-
-                # Calculate XP based on profit and sustainability
-                sustainability_bonus = company.sustainability_rating // 5  # Extra XP for green stocks
-                profit_xp = max(5, min(sale_value // 20 + sustainability_bonus, 100))
-                add_xp(request.user, profit_xp)
-
-                # Process the sale (FIFO: sell from the oldest investment first)
-                remaining_to_sell = shares_to_sell
-                for inv in investments:
-                    if remaining_to_sell <= 0:
-                        break
-                    if inv.shares <= remaining_to_sell:
-                        remaining_to_sell -= inv.shares
-                        inv.delete()
-                    else:
-                        inv.shares -= remaining_to_sell
-                        inv.save()
-                        remaining_to_sell = 0
-
-                # Record a portfolio snapshot (if you have such functionality)
-                record_portfolio_snapshot(request.user)
-                return redirect('market:portfolio')
+                # Sells FIFO and credits the sale value net of tax in one batched order
+                order = place_order(request.user, company, SELL, shares_to_sell, tax_rate=TAX_RATE)
+                if order.filled:
+                    # Calculate XP based on profit and sustainability
+                    sustainability_bonus = company.sustainability_rating // 5  # Extra XP for green stocks
+                    profit_xp = max(5, min(order.total // 20 + sustainability_bonus, 100))
+                    add_xp(request.user, profit_xp)
+
+                    # Record a portfolio snapshot (if you have such functionality)
+                    record_portfolio_snapshot(request.user)
+                    refresh_leaderboard_entry(request.user)
+                    return redirect('market:portfolio')
+                form.add_error('shares', order.error)
     else:
         form = SellInvestmentForm(initial={'shares': total_shares})
 
@@ -29,6 +29,12 @@ def has_played_all_games(profile):
 
 # Additional achievement condition functions can be added here.
 
+# Achievements awarded on reaching a level, by the level_up receiver in signals.py
+LEVEL_ACHIEVEMENTS = {
+    'Level 5 Reached': 5,
+    'Level 10 Reached': 10,
+}
+
 ACHIEVEMENT_CONDITIONS = {
     'First Deposit': has_made_first_deposit,
     'Level 5 Reached': has_reached_level_5,
@@ -0,0 +1,91 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from apps.users.models import UserProfile
+
+ADD = 'add'
+MAX = 'max'
+SET = 'set'
+
+_local = threading.local()
+
+
+@contextmanager
+def deferred_counters():
+    """
+    Collects the profile counter changes made inside the block, merged per
+    player, and writes each player's with one UPDATE when it exits, after
+    commit if a transaction is open. Nested blocks are folded into the
+    outermost one.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = {}
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        # Registered after every change's own commit hook, so it sees all of them
+        transaction.on_commit(lambda: apply_counters(pending))
+
+
+def _merge(pending, user_id, changes):
+    fields = pending.setdefault(user_id, {})
+    for field, (kind, value) in changes.items():
+        current = fields.get(field)
+        if current is None or kind == SET:
+            fields[field] = (kind, value)
+        elif kind == ADD:
+            fields[field] = (ADD, current[1] + value)
+        else:
+            fields[field] = (MAX, max(current[1], value))
+
+
+def _queue(user_id, changes):
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        transaction.on_commit(lambda: apply_counters({user_id: changes}))
+    else:
+        # Merged on commit, so rolled-back work is never counted
+        transaction.on_commit(lambda: _merge(pending, user_id, changes))
+
+
+def increment(user_id, **deltas):
+    """Adds each delta to the named counters of a player's profile."""
+    _queue(user_id, {field: (ADD, delta) for field, delta in deltas.items()})
+
+
+def raise_to(user_id, **values):
+    """Raises each named field of a player's profile to the value if it is higher."""
+    _queue(user_id, {field: (MAX, value) for field, value in values.items()})
+
+
+def recompute(user_id, **expressions):
+    """Sets fields of a player's profile from query expressions, evaluated when the changes are written."""
+    _queue(user_id, {field: (SET, expression) for field, expression in expressions.items()})
+
+
+def _expression(field, kind, value):
+    if kind == ADD:
+        return F(field) + value
+    if kind == MAX:
+        return Greatest(F(field), Value(value))
+    return value
+
+
+def apply_counters(pending):
+    """
+    Writes {user id: {field: (kind, value)}} with one UPDATE of F()
+    expressions per player, touching only the fields that changed, so
+    concurrent requests never overwrite each other's counters.
+    """
+    for user_id, fields in pending.items():
+        if fields:
+            UserProfile.objects.filter(user_id=user_id).update(
+                **{field: _expression(field, kind, value) for field, (kind, value) in fields.items()}
+            )
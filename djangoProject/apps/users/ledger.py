@@ -0,0 +1,97 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.users.models import CurrencyTransaction, FarmCurrencyTransaction, UserProfile
+
+# Balance field and ledger model of each currency
+CURRENCIES = {
+    'main': ('currency_balance', CurrencyTransaction),
+    'farm': ('farm_currency', FarmCurrencyTransaction),
+}
+CREDIT = 'credit'
+DEBIT = 'debit'
+
+_local = threading.local()
+
+
+def _amount(amount):
+    return Decimal(str(amount)).quantize(Decimal('0.01'))
+
+
+@contextmanager
+def buffered_ledger():
+    """
+    Collects the ledger entries of every credit and debit made inside the
+    block and writes them with one bulk_create per currency when it exits,
+    after commit if a transaction is open. Nested blocks are folded into the
+    outermost one.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = []
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        # Registered after every entry's own commit hook, so it sees all of them
+        transaction.on_commit(lambda: write_entries(pending))
+
+
+def write_entries(entries):
+    """Bulk-creates ledger entries, one INSERT per ledger model."""
+    by_model = {}
+    for entry in entries:
+        by_model.setdefault(type(entry), []).append(entry)
+    for model, rows in by_model.items():
+        model.objects.bulk_create(rows, batch_size=500)
+
+
+def _record(entry):
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        transaction.on_commit(lambda: write_entries([entry]))
+    else:
+        # Queued on commit, so a rolled-back balance change leaves no entry behind
+        transaction.on_commit(lambda: pending.append(entry))
+
+
+def _apply(profile, amount, description, currency, kind):
+    field, model = CURRENCIES[currency]
+    amount = _amount(amount)
+    if amount <= 0:
+        return False
+    rows = UserProfile.objects.filter(pk=profile.pk)
+    if kind == DEBIT:
+        rows = rows.filter(**{f'{field}__gte': amount})
+        delta = -amount
+    else:
+        delta = amount
+    if not rows.update(**{field: F(field) + delta}):
+        return False
+    # Keep the caller's instance in step with the row
+    setattr(profile, field, getattr(profile, field) + delta)
+    _record(model(profile=profile, transaction_type=kind, amount=amount, description=description))
+    return True
+
+
+def credit(profile, amount, description, currency='main'):
+    """
+    Adds `amount` to a profile's balance in `currency` ('main' or 'farm')
+    with one F() UPDATE and records a ledger entry. Returns False, changing
+    nothing, for amounts that round to zero or less.
+    """
+    return _apply(profile, amount, description, currency, CREDIT)
+
+
+def debit(profile, amount, description, currency='main'):
+    """
+    Takes `amount` from a profile's balance in `currency` with one
+    conditional UPDATE that only matches while the balance covers it, so
+    concurrent debits can never overdraw. Returns whether it was taken.
+    """
+    return _apply(profile, amount, description, currency, DEBIT)
@@ -0,0 +1,33 @@
+from bisect import bisect_right
+
+# Largest value the total_experience column can hold
+MAX_TOTAL_EXPERIENCE = 2 ** 63 - 1
+
+
+def required_xp(level):
+    """XP needed to go from `level` to the next: 100 at level 1, growing by 1.5x per level."""
+    return int(100 * (1.5 ** (level - 1)))
+
+
+def _build_thresholds():
+    thresholds = []
+    total = 0
+    while total <= MAX_TOTAL_EXPERIENCE:
+        total += required_xp(len(thresholds) + 1)
+        thresholds.append(total)
+    return thresholds
+
+
+# XP_THRESHOLDS[i] is the total experience needed to reach level i + 2
+XP_THRESHOLDS = _build_thresholds()
+
+
+def level_for_experience(total_experience):
+    """
+    Returns (level, XP earned into that level) for a total experience, found
+    with a binary search over the cumulative thresholds instead of walking
+    the levels one by one.
+    """
+    reached = bisect_right(XP_THRESHOLDS, total_experience)
+    into_level = total_experience - XP_THRESHOLDS[reached - 1] if reached else total_experience
+    return reached + 1, into_level
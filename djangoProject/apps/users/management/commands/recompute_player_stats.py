@@ -0,0 +1,18 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from apps.users.stats import recompute_player_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild every player's stats counters from the apps' own records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only rebuild these players")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('pk', flat=True))
+        rebuilt = recompute_player_stats(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed stats for {rebuilt} players."))
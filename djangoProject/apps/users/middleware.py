@@ -0,0 +1,36 @@
+from apps.users.counters import deferred_counters
+from apps.users.ledger import buffered_ledger
+from apps.users.utils import deferred_xp
+
+
+class DeferredXpMiddleware:
+    """Collects the XP granted while handling a request and applies it once per player at the end."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deferred_xp():
+            return self.get_response(request)
+
+
+class BufferedLedgerMiddleware:
+    """Writes the currency ledger entries of a request with one INSERT per currency at the end."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffered_ledger():
+            return self.get_response(request)
+
+
+class DeferredCountersMiddleware:
+    """Merges the stats counter changes of a request and writes them with one UPDATE per player at the end."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deferred_counters():
+            return self.get_response(request)
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+def backfill_stats(apps, schema_editor):
+    from apps.users.stats import STAT_FIELDS, rebuild_stats
+
+    UserProfile = apps.get_model('users', 'UserProfile')
+    profiles = rebuild_stats(list(UserProfile.objects.all()), apps.get_model)
+    UserProfile.objects.bulk_update(profiles, STAT_FIELDS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_userprofile_climate_duel_eco_score_and_more'),
+        ('casino', '0001_initial'),
+        ('city_builder', '0001_initial'),
+        ('climate_duels', '0001_initial'),
+        ('crafting', '0002_craftinglog'),
+        ('crates', '0001_initial'),
+        ('garden', '0001_initial'),
+        ('market', '0012_leaderboard_holdings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='harvested_plants',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='rarest_item_received',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='total_buildings',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='total_transactions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
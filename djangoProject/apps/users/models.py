@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from decimal import Decimal
 
+from apps.users.levels import level_for_experience, required_xp
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -10,10 +12,14 @@ class UserProfile(models.Model):
     friends = models.ManyToManyField("self", symmetrical=False, blank=True)
     bingo_board = models.JSONField(default=list)
 
-    # Stats 
+    # Stats (kept current by each app's write paths; see apps/users/stats.py)
     total_crates_opened = models.PositiveIntegerField(default=0)
+    rarest_item_received = models.PositiveIntegerField(default=0)
     total_garden_plants = models.PositiveIntegerField(default=0)
+    harvested_plants = models.PositiveIntegerField(default=0)
     most_used_garden_crop = models.CharField(max_length=50, blank=True)
+    total_buildings = models.PositiveIntegerField(default=0)
+    total_transactions = models.PositiveIntegerField(default=0)
 
     # 🎰 Casino stats
     total_casino_games_played = models.PositiveIntegerField(default=0)
@@ -69,107 +75,46 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
-    # Methods for regular currency (unchanged)
+    # Balances only change through apps.users.ledger: one F() UPDATE per change,
+    # with the ledger entry written at commit
     def add_currency(self, amount, description="Credit added", is_farm_currency=False):
         """Add currency, with optional farm currency support."""
-        from django.db import transaction
-        amount = Decimal(amount)
-        
-        with transaction.atomic():
-            if is_farm_currency:
-                self.farm_currency += amount
-                self.save()
-                FarmCurrencyTransaction.objects.create(
-                    profile=self,
-                    transaction_type='credit',
-                    amount=amount,
-                    description=description
-                )
-            else:
-                self.currency_balance += amount
-                self.save()
-                CurrencyTransaction.objects.create(
-                    profile=self,
-                    transaction_type='credit',
-                    amount=amount,
-                    description=description
-                )
+        from apps.users.ledger import credit
+        return credit(self, amount, description, currency='farm' if is_farm_currency else 'main')
 
     def deduct_currency(self, amount, description="Debit applied"):
         """Deduct currency but prevent negative values."""
-        from django.db import transaction
-        amount = Decimal(amount)
-
-        if amount <= 0:  # Prevent invalid deductions
-            return False  
-
-        with transaction.atomic():
-            if self.currency_balance >= amount:
-                self.currency_balance -= amount
-                self.save()
-                CurrencyTransaction.objects.create(
-                    profile=self,
-                    transaction_type='debit',
-                    amount=amount,
-                    description=description
-                )
-                return True
-            return False
+        from apps.users.ledger import debit
+        return debit(self, amount, description)
 
     # Methods for new farm currency
     def add_farm_currency(self, amount, description="FarmCoin added"):
         """Add the new farm currency to the user's balance."""
-        from django.db import transaction
-        amount = Decimal(amount)
-        with transaction.atomic():
-            self.farm_currency += amount
-            self.save()
-            FarmCurrencyTransaction.objects.create(
-                profile=self,
-                transaction_type='credit',
-                amount=amount,
-                description=description
-            )
+        from apps.users.ledger import credit
+        return credit(self, amount, description, currency='farm')
 
     def deduct_farm_currency(self, amount, description="FarmCoin spent"):
         """Deduct the farm currency for purchases."""
-        from django.db import transaction
-        amount = Decimal(amount)
-        with transaction.atomic():
-            if self.farm_currency >= amount:
-                self.farm_currency -= amount
-                self.save()
-                FarmCurrencyTransaction.objects.create(
-                    profile=self,
-                    transaction_type='debit',
-                    amount=amount,
-                    description=description
-                )
-                return True
-            return False
+        from apps.users.ledger import debit
+        return debit(self, amount, description, currency='farm')
 
     def get_required_xp(self, level):
         # For level 1, the requirement is 100 XP; for higher levels, an exponential formula.
-        return int(100 * (1.5 ** (level - 1)))
-    
-    def add_experience(self, amount):
+        return required_xp(level)
+
+    def apply_experience(self, amount):
+        """Adds XP and resolves the level in memory, without saving."""
         if amount < 0:
             return  # Optionally handle negative values
         self.total_experience += amount
-        
-        level = 1
-        xp_remaining = self.total_experience
-        while xp_remaining >= self.get_required_xp(level):
-            required = self.get_required_xp(level)
-            if xp_remaining < required:
-                break
-            xp_remaining -= required
-            level += 1
-        
-        self.level = level
-        self.experience_points = xp_remaining
-        self.save()
-    
+        self.level, self.experience_points = level_for_experience(self.total_experience)
+
+    def add_experience(self, amount):
+        if amount < 0:
+            return
+        self.apply_experience(amount)
+        self.save(update_fields=['total_experience', 'experience_points', 'level'])
+
 
     def check_achievements(self):
         from django.utils.timezone import now
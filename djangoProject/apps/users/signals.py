@@ -0,0 +1,21 @@
+from django.dispatch import Signal, receiver
+
+from apps.users.achievements import LEVEL_ACHIEVEMENTS
+from apps.users.models import Achievement, UserAchievement, UserProfile
+
+# Sent once when XP takes a player to a higher level, with user_id, old_level and new_level
+level_up = Signal()
+
+
+@receiver(level_up)
+def award_level_achievements(sender, user_id, new_level, **kwargs):
+    """Awards the level achievements the new level has reached, once each."""
+    names = [name for name, level in LEVEL_ACHIEVEMENTS.items() if new_level >= level]
+    if not names:
+        return
+    profile_id = UserProfile.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+    UserAchievement.objects.bulk_create(
+        [UserAchievement(user_id=profile_id, achievement=achievement)
+         for achievement in Achievement.objects.filter(name__in=names)],
+        ignore_conflicts=True,
+    )
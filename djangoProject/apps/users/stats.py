@@ -0,0 +1,174 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Count, FloatField, Max, Q, Sum, Value
+from django.db.models.functions import Greatest
+
+from apps.market.journal import trade_journal
+from apps.market.leaderboard import refresh_leaderboard
+from apps.users.models import UserProfile
+
+# Counters on UserProfile that the apps' write paths keep current and recompute_player_stats rebuilds
+STAT_FIELDS = [
+    'total_crates_opened', 'rarest_item_received',
+    'total_garden_plants', 'harvested_plants',
+    'total_items_crafted', 'rare_items_crafted', 'most_crafted_item',
+    'climate_duels_played', 'climate_duel_eco_score',
+    'total_casino_games_played', 'total_casino_wagered', 'total_casino_wins',
+    'total_buildings', 'total_transactions',
+]
+
+
+def stats_profiles():
+    """Profiles joined with everything the stats pages show, so one row holds a player's stats."""
+    return UserProfile.objects.select_related('user', 'user__city', 'user__leaderboard_entry')
+
+
+def _related(obj, name):
+    try:
+        return getattr(obj, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def player_stats(profile):
+    """
+    The stats shown on a player's stats page, from a profile loaded with
+    stats_profiles(). Only the achievement and friend lists are queried.
+    """
+    city = _related(profile.user, 'city')
+    market = _related(profile.user, 'leaderboard_entry')
+    return {
+        "username": profile.user.username,
+        "currency_balance": profile.currency_balance,
+        "farm_currency": profile.farm_currency,
+        "level": profile.level,
+        "experience_points": profile.experience_points,
+        "total_experience": profile.total_experience,
+        "xp_to_next_level": profile.total_experience - profile.experience_points,
+        "green_impact": market.green_impact if market else Decimal('0.00'),
+        "achievements": list(profile.achievements.select_related("achievement")),
+        "friends": list(profile.friends.select_related("user")),
+        # City Builder
+        "city_name": city.name if city else "No City",
+        "sustainability_score": city.sustainability_score if city else 0,
+        "total_buildings": profile.total_buildings,
+        # Market (holdings are refreshed with the leaderboard on every trade and price tick)
+        "total_investments": market.total_investments if market else 0,
+        "total_shares": market.total_shares if market else 0,
+        "total_transactions": profile.total_transactions,
+        # Crates, Garden and Crafting
+        "crates_opened": profile.total_crates_opened,
+        "total_garden_plants": profile.total_garden_plants,
+        "harvested_plants": profile.harvested_plants,
+        "total_items_crafted": profile.total_items_crafted,
+        "rare_items_crafted": profile.rare_items_crafted,
+        "most_crafted_item": profile.most_crafted_item,
+        # Climate Duels
+        "climate_duels_played": profile.climate_duels_played,
+        "climate_duel_eco_score": profile.climate_duel_eco_score,
+        # Casino
+        "total_casino_games_played": profile.total_casino_games_played,
+        "total_casino_wagered": profile.total_casino_wagered,
+        "total_casino_wins": profile.total_casino_wins,
+    }
+
+
+def _per_user(queryset, user_field='user', **aggregates):
+    rows = queryset.order_by().values(user_field).annotate(**aggregates)
+    return {row.pop(user_field): row for row in rows}
+
+
+def _most_crafted(CraftingLog, user_ids):
+    counts = (CraftingLog.objects.filter(user__in=user_ids).order_by()
+              .values_list('user', 'recipe__name').annotate(total=Count('pk')))
+    by_user = {}
+    for user_id, name, total in counts:
+        by_user.setdefault(user_id, Counter())[name] = total
+    return {user_id: names.most_common(1)[0][0] for user_id, names in by_user.items()}
+
+
+def _casino(get_model, user_ids):
+    """Finished games, bets and wins per user across the three casino games."""
+    games = [
+        (get_model('casino', 'DiceGame').objects.filter(user__in=user_ids, roll_result__isnull=False),
+         Q(win=True)),
+        (get_model('casino', 'RouletteGame').objects.filter(user__in=user_ids, result__isnull=False),
+         Q(win=True)),
+        (get_model('casino', 'BlackjackGame').objects.filter(user__in=user_ids).exclude(result='in_progress'),
+         Q(result='win')),
+    ]
+    totals = {}
+    for queryset, won in games:
+        rows = _per_user(queryset, played=Count('pk'), wagered=Sum('bet_amount'), wins=Count('pk', filter=won))
+        for user_id, row in rows.items():
+            played, wagered, wins = totals.get(user_id, (0, Decimal('0.00'), 0))
+            totals[user_id] = (played + row['played'], wagered + row['wagered'], wins + row['wins'])
+    return totals
+
+
+def rebuild_stats(profiles, get_model=global_apps.get_model):
+    """
+    Sets every STAT_FIELDS counter on `profiles` from the apps' own tables,
+    one aggregate query per table, without saving them. `get_model` resolves
+    the tables, so migrations can pass their historical apps.get_model.
+    """
+    ids = [profile.user_id for profile in profiles]
+    crates = _per_user(get_model('crates', 'CrateOpeningHistory').objects.filter(user__in=ids),
+                       opened=Count('pk'), rarest=Max('reward_rarity'))
+    garden = _per_user(get_model('garden', 'GardenPlant').objects.filter(user__in=ids),
+                       planted=Count('pk'), harvested=Count('pk', filter=Q(is_harvested=True)))
+    CraftingLog = get_model('crafting', 'CraftingLog')
+    crafting = _per_user(CraftingLog.objects.filter(user__in=ids),
+                         crafted=Count('pk'), rare=Count('pk', filter=Q(rare=True)))
+    duels = _per_user(get_model('climate_duels', 'DuelTurn').objects.filter(player__in=ids), 'player',
+                      played=Count('pk'),
+                      eco=Sum(Greatest('co2_after_turn', Value(0.0), output_field=FloatField())))
+    buildings = _per_user(get_model('city_builder', 'CityBuilding').objects.filter(city__user__in=ids),
+                          'city__user', built=Count('pk'))
+    trades = _per_user(get_model('market', 'Transaction').objects.filter(user__in=ids), traded=Count('pk'))
+    most_crafted = _most_crafted(CraftingLog, ids)
+    casino = _casino(get_model, ids)
+
+    for profile in profiles:
+        user_id = profile.user_id
+        row = crates.get(user_id, {})
+        profile.total_crates_opened = row.get('opened', 0)
+        profile.rarest_item_received = max(row.get('rarest') or 0, 0)
+        row = garden.get(user_id, {})
+        profile.total_garden_plants = row.get('planted', 0)
+        profile.harvested_plants = row.get('harvested', 0)
+        row = crafting.get(user_id, {})
+        profile.total_items_crafted = row.get('crafted', 0)
+        profile.rare_items_crafted = row.get('rare', 0)
+        profile.most_crafted_item = most_crafted.get(user_id, '')
+        row = duels.get(user_id, {})
+        profile.climate_duels_played = row.get('played', 0)
+        profile.climate_duel_eco_score = Decimal(str(round(row.get('eco') or 0, 2)))
+        (profile.total_casino_games_played, profile.total_casino_wagered,
+         profile.total_casino_wins) = casino.get(user_id, (0, Decimal('0.00'), 0))
+        profile.total_buildings = buildings.get(user_id, {}).get('built', 0)
+        profile.total_transactions = trades.get(user_id, {}).get('traded', 0)
+    return profiles
+
+
+def recompute_player_stats(user_ids=None):
+    """
+    Rebuilds every stats counter on the profiles of `user_ids` (all players
+    by default) with rebuild_stats and refreshes the market holdings. For
+    repairing counters that drifted; the write paths keep them current
+    otherwise. Returns the number of profiles rewritten.
+    """
+    # Journal entries still buffered are not in the Transaction table yet
+    trade_journal.flush()
+    with transaction.atomic():
+        profiles = UserProfile.objects.select_for_update()
+        if user_ids is not None:
+            profiles = profiles.filter(user_id__in=user_ids)
+        profiles = rebuild_stats(list(profiles))
+        UserProfile.objects.bulk_update(profiles, STAT_FIELDS, batch_size=500)
+    refresh_leaderboard()
+    return len(profiles)
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from apps.casino.models import DiceGame
+from apps.crafting.models import CraftingLog, Recipe
+from apps.crates.models import CrateOpeningHistory, Item
+from apps.users.counters import deferred_counters, increment
+from apps.users.middleware import DeferredCountersMiddleware
+from apps.users.models import UserProfile
+
+
+class DeferredCountersTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='opener', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        item = Item.objects.create(name='Compost', item_type='material')
+        self.recipes = [Recipe.objects.create(name=name, result_item=item) for name in ('Bin', 'Planter')]
+
+    def test_changes_are_merged_into_one_update_at_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with deferred_counters():
+                for i in range(40):
+                    CrateOpeningHistory.objects.create(user=self.user, crate_type='basic', reward_item='Compost',
+                                                       reward_rarity=1 + i % 4)
+                for recipe in (self.recipes[0], self.recipes[1], self.recipes[1]):
+                    CraftingLog.objects.create(user=self.user, recipe=recipe, rare=recipe.name == 'Bin')
+        for callback in callbacks[:-1]:
+            callback()
+        with self.assertNumQueries(1):
+            callbacks[-1]()
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.total_crates_opened, self.profile.rarest_item_received), (40, 4))
+        self.assertEqual((self.profile.total_items_crafted, self.profile.rare_items_crafted), (3, 1))
+        self.assertEqual(self.profile.most_crafted_item, 'Planter')
+
+    def test_rolled_back_changes_are_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with deferred_counters():
+                DiceGame(user=self.user, bet_amount=Decimal('3.00'), prediction=1).roll_dice()
+                try:
+                    with transaction.atomic():
+                        DiceGame(user=self.user, bet_amount=Decimal('50.00'), prediction=1).roll_dice()
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.total_casino_games_played, self.profile.total_casino_wagered),
+                         (1, Decimal('3.00')))
+
+    def test_stale_profiles_do_not_overwrite_counters(self):
+        stale = UserProfile.objects.get(pk=self.profile.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            increment(self.user.pk, total_crates_opened=2)
+        stale.add_experience(30)
+        stale.bingo_board = [[]]
+        stale.save(update_fields=['bingo_board'])
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.total_crates_opened, self.profile.total_experience), (2, 30))
+
+    def test_middleware_writes_a_requests_counters_once(self):
+        def view(request):
+            for _ in range(5):
+                CrateOpeningHistory.objects.create(user=self.user, crate_type='basic', reward_item='Compost',
+                                                   reward_rarity=2)
+            return HttpResponse()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            DeferredCountersMiddleware(view)(RequestFactory().get('/'))
+        for callback in callbacks[:-1]:
+            callback()
+        with self.assertNumQueries(1):
+            callbacks[-1]()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.total_crates_opened, 5)
@@ -0,0 +1,141 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from apps.battlepass.models import BattlePass, UserBattlePass
+from apps.users.levels import XP_THRESHOLDS, level_for_experience, required_xp
+from apps.users.middleware import DeferredXpMiddleware
+from apps.users.models import Achievement, UserAchievement, UserProfile
+from apps.users.signals import level_up
+from apps.users.utils import add_xp, bulk_add_xp, deferred_xp
+
+
+def walk_levels(total):
+    """The level-by-level walk the threshold table replaces."""
+    level, remaining = 1, total
+    while remaining >= required_xp(level):
+        remaining -= required_xp(level)
+        level += 1
+    return level, remaining
+
+
+class LevelTableTest(TestCase):
+    def test_lookup_matches_walking_the_levels(self):
+        totals = list(range(0, 3000, 7)) + [t + d for t in XP_THRESHOLDS[:60] for d in (-1, 0, 1)]
+        for total in totals:
+            self.assertEqual(level_for_experience(total), walk_levels(total), total)
+
+    def test_add_experience_sets_level_and_progress(self):
+        user = get_user_model().objects.create_user(username='climber', password='testpass123')
+        profile = UserProfile.objects.create(user=user)
+        profile.add_experience(260)
+        profile.refresh_from_db()
+        # 100 XP for level 1 and 150 for level 2 leave 10 into level 3
+        self.assertEqual((profile.level, profile.experience_points, profile.total_experience), (3, 10, 260))
+        profile.add_experience(-5)
+        self.assertEqual(profile.total_experience, 260)
+
+
+class BulkAddXpTest(TestCase):
+    def test_grants_are_written_with_one_bulk_update(self):
+        users = [get_user_model().objects.create_user(username=f'season{i}') for i in range(5)]
+        for user in users:
+            UserProfile.objects.create(user=user, total_experience=50, experience_points=50)
+        grants = {user.pk: 100 * i for i, user in enumerate(users)}
+        with self.assertNumQueries(4):
+            # Savepoint, locked read, one UPDATE, release
+            self.assertEqual(bulk_add_xp(grants), 4)
+        for i, user in enumerate(users):
+            profile = UserProfile.objects.get(user=user)
+            self.assertEqual((profile.level, profile.experience_points), level_for_experience(50 + 100 * i))
+
+    def test_battle_passes_and_level_ups_follow_like_add_xp(self):
+        user = get_user_model().objects.create_user(username='rewarded')
+        UserProfile.objects.create(user=user)
+        season = BattlePass.objects.create(name='Season', season_number=1, start_date=timezone.now(),
+                                           end_date=timezone.now() + timedelta(days=30))
+        battle_pass = UserBattlePass.objects.create(user=user, battle_pass=season, progress_points=90)
+        level_ups = []
+
+        def record(sender, user_id, old_level, new_level, **kwargs):
+            level_ups.append((user_id, old_level, new_level))
+
+        level_up.connect(record)
+        self.addCleanup(level_up.disconnect, record)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_add_xp({user.pk: 130})
+        battle_pass.refresh_from_db()
+        self.assertEqual((battle_pass.current_tier, battle_pass.progress_points), (2, 20))
+        self.assertEqual(level_ups, [(user.pk, 1, 2)])
+
+
+class DeferredXpTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='gamer', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        season = BattlePass.objects.create(name='Season', season_number=1, start_date=timezone.now(),
+                                           end_date=timezone.now() + timedelta(days=30))
+        self.battle_pass = UserBattlePass.objects.create(user=self.user, battle_pass=season, progress_points=90)
+        self.level_ups = []
+        level_up.connect(self.record_level_up)
+        self.addCleanup(level_up.disconnect, self.record_level_up)
+
+    def record_level_up(self, sender, user_id, old_level, new_level, **kwargs):
+        self.level_ups.append((user_id, old_level, new_level))
+
+    def test_grants_are_coalesced_and_applied_at_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with deferred_xp():
+                with self.assertNumQueries(0):
+                    for amount in (60, 40, Decimal('30.5')):
+                        add_xp(self.user, amount)
+        self.assertEqual(len(callbacks), 1)
+        # Savepoint, F() increment, locked read, level, release, battle pass
+        with self.assertNumQueries(6):
+            callbacks[0]()
+        self.profile.refresh_from_db()
+        self.battle_pass.refresh_from_db()
+        self.assertEqual((self.profile.total_experience, self.profile.level, self.profile.experience_points), (130, 2, 30))
+        self.assertEqual((self.battle_pass.current_tier, self.battle_pass.progress_points), (2, 20))
+        self.assertEqual(self.level_ups, [(self.user.pk, 1, 2)])
+
+    def test_grants_are_dropped_with_a_rolled_back_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    with deferred_xp():
+                        add_xp(self.user, 500)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.total_experience, 0)
+        self.assertEqual(self.level_ups, [])
+
+    def test_middleware_applies_a_requests_grants_once(self):
+        def view(request):
+            add_xp(self.user, 70)
+            add_xp(self.user, 70)
+            return HttpResponse()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            DeferredXpMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(len(callbacks), 1)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.total_experience, self.profile.level), (140, 2))
+        self.assertEqual(self.level_ups, [(self.user.pk, 1, 2)])
+
+    def test_reaching_a_level_awards_its_achievement_once(self):
+        Achievement.objects.create(name='Level 5 Reached', description='Reach level 5')
+        with self.captureOnCommitCallbacks(execute=True):
+            add_xp(self.user, XP_THRESHOLDS[3])
+        with self.captureOnCommitCallbacks(execute=True):
+            add_xp(self.user, XP_THRESHOLDS[4] - XP_THRESHOLDS[3])
+        self.assertEqual([old_new[1:] for old_new in self.level_ups], [(1, 5), (5, 6)])
+        self.assertEqual(list(UserAchievement.objects.filter(user=self.profile)
+                              .values_list('achievement__name', flat=True)), ['Level 5 Reached'])
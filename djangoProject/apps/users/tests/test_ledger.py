@@ -0,0 +1,111 @@
+import threading
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+
+from apps.users.ledger import buffered_ledger, credit, debit
+from apps.users.middleware import BufferedLedgerMiddleware
+from apps.users.models import CurrencyTransaction, FarmCurrencyTransaction, UserProfile
+
+
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='spender', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user, currency_balance=Decimal('10.00'),
+                                                  farm_currency=Decimal('5.00'))
+
+    def test_debit_only_applies_while_the_balance_covers_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.profile.deduct_currency(Decimal('7.50'), "Bet"))
+            # The stale instance would allow it; the conditional UPDATE does not
+            UserProfile.objects.filter(pk=self.profile.pk).update(currency_balance=Decimal('1.00'))
+            self.assertFalse(self.profile.deduct_currency(Decimal('2.00'), "Bet"))
+            self.assertFalse(self.profile.deduct_currency(0, "Nothing"))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.currency_balance, Decimal('1.00'))
+        self.assertEqual(list(self.profile.transactions.values_list('transaction_type', 'amount')),
+                         [('debit', Decimal('7.50'))])
+
+    def test_entries_are_written_with_one_insert_per_currency(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with buffered_ledger():
+                for _ in range(3):
+                    self.profile.add_farm_currency(2.38, "Crate reward")
+                    self.profile.add_currency(1, "Sale")
+                self.profile.deduct_currency(4, "Bet")
+        self.assertEqual(self.profile.currency_balance, Decimal('9.00'))
+        self.assertEqual(self.profile.farm_currency, Decimal('12.14'))
+        self.assertEqual(CurrencyTransaction.objects.count(), 0)
+        for callback in callbacks[:-1]:
+            callback()
+        with self.assertNumQueries(2):
+            callbacks[-1]()
+        self.assertEqual(CurrencyTransaction.objects.filter(profile=self.profile).count(), 4)
+        self.assertEqual(list(FarmCurrencyTransaction.objects.values_list('amount', flat=True).distinct()),
+                         [Decimal('2.38')])
+
+    def test_rolled_back_changes_leave_no_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with buffered_ledger():
+                credit(self.profile, 5, "Kept")
+                try:
+                    with transaction.atomic():
+                        debit(self.profile, 5, "Undone", currency='farm')
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.assertEqual(list(CurrencyTransaction.objects.values_list('description', flat=True)), ["Kept"])
+        self.assertFalse(FarmCurrencyTransaction.objects.exists())
+
+    def test_middleware_buffers_a_requests_entries(self):
+        def view(request):
+            self.profile.deduct_currency(5, "Bet on Dice Game")
+            self.profile.add_currency(10, "Winnings from Dice Game")
+            return HttpResponse()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BufferedLedgerMiddleware(view)(RequestFactory().get('/'))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.currency_balance, Decimal('15.00'))
+        self.assertEqual(self.profile.transactions.count(), 2)
+
+
+class ConcurrentLedgerTest(TransactionTestCase):
+    """Parallel debits and credits on one balance never overdraw or lose updates."""
+
+    def test_parallel_changes_keep_balance_and_ledger_consistent(self):
+        user = get_user_model().objects.create_user(username='racer')
+        UserProfile.objects.create(user=user, currency_balance=Decimal('50.00'), farm_currency=Decimal('20.00'))
+        debited = []
+        # SQLite's shared in-memory test database takes one writer at a time, so
+        # threads interleave call by call, each on its own stale copy of the profile
+        writer = threading.Lock()
+
+        def work():
+            try:
+                profile = UserProfile.objects.get(user=user)
+                for _ in range(5):
+                    with writer:
+                        if profile.deduct_currency(Decimal('3.00'), "Bet"):
+                            debited.append(Decimal('3.00'))
+                    with writer:
+                        profile.add_farm_currency(Decimal('0.50'), "Reward")
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        profile = UserProfile.objects.get(user=user)
+        # 40 attempted debits of 3.00 against 50.00: exactly 16 fit
+        self.assertEqual(len(debited), 16)
+        self.assertEqual(profile.currency_balance, Decimal('2.00'))
+        self.assertEqual(profile.farm_currency, Decimal('40.00'))
+        self.assertEqual(profile.transactions.filter(transaction_type='debit').count(), 16)
+        self.assertEqual(profile.farm_transactions.count(), 40)
@@ -0,0 +1,110 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+
+from apps.casino.models import BlackjackGame, DiceGame
+from apps.city_builder.models import BuildingTemplate, City, CityBuilding
+from apps.climate_duels.models import ClimateDuel, DuelTurn
+from apps.crafting.models import CraftingLog, Recipe
+from apps.crates.models import CrateOpeningHistory, Item
+from apps.garden.models import GardenPlant
+from apps.users.models import UserProfile
+from apps.users.stats import STAT_FIELDS
+
+
+class PlayerStatsTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='player', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client.login(username='player', password='testpass123')
+        self.seed = Item.objects.create(name='Test Seed', item_type='Seed')
+        self.recipe = Recipe.objects.create(name='Planter', result_item=self.seed)
+        self.city = City.objects.create(user=self.user, name='Greenville')
+        self.template = BuildingTemplate.objects.create(name='Solar Farm')
+
+    def play(self, rounds):
+        """Records `rounds` of activity in every app through their write paths."""
+        offset = CityBuilding.objects.filter(city=self.city).count()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(rounds):
+                CrateOpeningHistory.objects.create(user=self.user, crate_type='basic', reward_item='Seed',
+                                                   reward_rarity=1 + i % 3)
+                plant = GardenPlant.objects.create(user=self.user, seed=self.seed)
+                if i % 2:
+                    plant.is_harvested = True
+                    plant.save()
+                CraftingLog.objects.create(user=self.user, recipe=self.recipe, rare=i % 2 == 0)
+                duel = ClimateDuel.objects.create(player_one=self.user)
+                DuelTurn.objects.create(duel=duel, player=self.user, co2_after_turn=40.0, gdp_after_turn=100.0)
+                DiceGame(user=self.user, bet_amount=Decimal('5.00'), prediction=3).roll_dice()
+                CityBuilding.objects.create(city=self.city, template=self.template, x=offset + i, y=0)
+
+    def stats_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:my_stats'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.context['stats']
+
+    def test_counters_follow_the_write_paths(self):
+        self.play(4)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.total_crates_opened, self.profile.rarest_item_received), (4, 3))
+        self.assertEqual((self.profile.total_garden_plants, self.profile.harvested_plants), (4, 2))
+        self.assertEqual((self.profile.total_items_crafted, self.profile.rare_items_crafted), (4, 2))
+        self.assertEqual((self.profile.climate_duels_played, self.profile.climate_duel_eco_score), (4, Decimal('160.00')))
+        self.assertEqual((self.profile.total_casino_games_played, self.profile.total_casino_wagered),
+                         (4, Decimal('20.00')))
+        self.assertEqual(self.profile.total_buildings, 4)
+        CityBuilding.objects.filter(city=self.city).first().delete()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.total_buildings, 3)
+
+    def test_stats_page_queries_do_not_grow_with_history(self):
+        self.play(1)
+        # The first request also touches the session
+        self.stats_queries()
+        few, _ = self.stats_queries()
+        self.play(6)
+        many, stats = self.stats_queries()
+        self.assertEqual(few, many)
+        self.assertEqual((stats['crates_opened'], stats['total_buildings'], stats['city_name']), (7, 7, 'Greenville'))
+
+    def test_recompute_repairs_drifted_counters(self):
+        self.play(3)
+        BlackjackGame.objects.create(user=self.user, bet_amount=Decimal('2.00'), result='win')
+        BlackjackGame.objects.create(user=self.user, bet_amount=Decimal('9.00'))
+        self.profile.refresh_from_db()
+        expected = {field: getattr(self.profile, field) for field in STAT_FIELDS}
+        # The finished blackjack game was never counted by its write path
+        expected['total_casino_games_played'] += 1
+        expected['total_casino_wagered'] += Decimal('2.00')
+        expected['total_casino_wins'] += 1
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            total_crates_opened=99, harvested_plants=0, total_buildings=42, most_crafted_item='',
+            climate_duel_eco_score=Decimal('1.00'), total_casino_wins=0,
+        )
+
+        out = StringIO()
+        call_command('recompute_player_stats', stdout=out)
+        self.assertIn("Recomputed stats for 1 players.", out.getvalue())
+        self.profile.refresh_from_db()
+        self.assertEqual({field: getattr(self.profile, field) for field in STAT_FIELDS},
+                         {**expected, 'most_crafted_item': 'Planter'})
+
+    def test_friend_stats_need_a_friendship(self):
+        friend = get_user_model().objects.create_user(username='pal')
+        friend_profile = UserProfile.objects.create(user=friend, total_crates_opened=5)
+        url = reverse('users:friend_stats', args=['pal'])
+        self.assertRedirects(self.client.get(url), reverse('users:friends_list'), fetch_redirect_response=False)
+
+        self.profile.add_friend(friend_profile)
+        response = self.client.get(url)
+        self.assertEqual(response.context['stats']['crates_opened'], 5)
+        self.assertEqual(response.context['stats']['city_name'], 'No City')
+        self.assertEqual(self.client.get(reverse('users:friend_stats', args=['nobody'])).status_code, 404)
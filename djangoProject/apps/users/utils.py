@@ -1,19 +1,123 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+from apps.users.levels import level_for_experience
 from apps.users.models import UserProfile
+from apps.users.signals import level_up
 from apps.battlepass.models import UserBattlePass
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Mod
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
+# Battle pass points per tier
+POINTS_PER_TIER = 100
+
+_local = threading.local()
+
+
+@contextmanager
+def deferred_xp():
+    """
+    Collects every add_xp grant made inside the block, summed per user, and
+    applies them once when it exits, after commit if a transaction is open.
+    Nested blocks are folded into the outermost one.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = {}
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        if pending:
+            # Robust: a failure is logged rather than raised into a request whose work has committed
+            transaction.on_commit(lambda: apply_xp(pending), robust=True)
+
+
 def add_xp(user, amount):
     """Adds XP to a user and updates Battle Pass if active."""
-    user_profile = user.userprofile
-    user_profile.add_experience(amount)  # Updates user XP
-
-    # If the user has a Battle Pass, add XP there too
-    user_battle_pass = UserBattlePass.objects.filter(user=user, battle_pass__end_date__gte=timezone.now()).first()
-    if user_battle_pass:
-        user_battle_pass.progress_points += amount
-        if user_battle_pass.progress_points >= 100:
-            user_battle_pass.progress_points -= 100
-            user_battle_pass.current_tier += 1  # Level up battle pass
-        user_battle_pass.save()
-    
-    user_profile.save()
\ No newline at end of file
+    amount = int(amount)
+    if amount <= 0:
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        transaction.on_commit(lambda: apply_xp({user.pk: amount}), robust=True)
+    else:
+        pending[user.pk] = pending.get(user.pk, 0) + amount
+
+
+def _apply_profile_xp(user_id, amount):
+    """
+    Adds XP to one profile with one F() UPDATE, then resolves the level from
+    the row it left. The UPDATE holds the row until the end of the block, so
+    each level-up is applied, and announced, by exactly one grant. Returns
+    (old level, new level), or None if the player has no profile.
+    """
+    with transaction.atomic():
+        UserProfile.objects.filter(user_id=user_id).update(total_experience=F('total_experience') + amount)
+        row = (UserProfile.objects.select_for_update().filter(user_id=user_id)
+               .values_list('total_experience', 'level').first())
+        if row is None:
+            return None
+        total, old_level = row
+        level, into_level = level_for_experience(total)
+        UserProfile.objects.filter(user_id=user_id).update(level=level, experience_points=into_level)
+    return old_level, level
+
+
+def _after_grant(user_id, amount, old_level, new_level, now):
+    """
+    The side effects of a grant applied to a profile: its active battle pass
+    advances with one F() UPDATE, including every full tier the points
+    cover, and level_up is sent if the player went up a level.
+    """
+    UserBattlePass.objects.filter(user_id=user_id, battle_pass__end_date__gte=now).update(
+        progress_points=Mod(F('progress_points') + amount, POINTS_PER_TIER),
+        current_tier=F('current_tier') + (F('progress_points') + amount) / POINTS_PER_TIER,
+    )
+    if new_level > old_level:
+        for receiver, error in level_up.send_robust(sender=UserProfile, user_id=user_id,
+                                                    old_level=old_level, new_level=new_level):
+            if isinstance(error, Exception):
+                logger.error("level_up receiver %r failed for user %s", receiver, user_id, exc_info=error)
+
+
+def apply_xp(grants):
+    """Applies {user id: XP} to each profile, then advances its battle pass and announces level-ups."""
+    now = timezone.now()
+    for user_id, amount in grants.items():
+        levels = _apply_profile_xp(user_id, amount)
+        if levels is not None:
+            _after_grant(user_id, amount, *levels, now)
+
+
+def bulk_add_xp(grants):
+    """
+    Adds XP to many users at once, e.g. for season rewards or backfills.
+    `grants` maps user ids to amounts. Profiles are locked and read in one
+    query and written back with one bulk_update; battle passes and level-ups
+    then follow after commit, as for add_xp. Returns the number of profiles
+    updated.
+    """
+    grants = {user_id: amount for user_id, amount in grants.items() if amount > 0}
+    with transaction.atomic():
+        profiles = list(UserProfile.objects.select_for_update().filter(user_id__in=grants))
+        levels = {}
+        for profile in profiles:
+            old_level = profile.level
+            profile.apply_experience(grants[profile.user_id])
+            levels[profile.user_id] = (old_level, profile.level)
+        UserProfile.objects.bulk_update(profiles, ['total_experience', 'experience_points', 'level'], batch_size=500)
+
+        def after_commit():
+            now = timezone.now()
+            for user_id, (old_level, new_level) in levels.items():
+                _after_grant(user_id, grants[user_id], old_level, new_level, now)
+
+        transaction.on_commit(after_commit, robust=True)
+    return len(profiles)
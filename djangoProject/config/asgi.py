@@ -8,15 +8,21 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
-import django
-from channels.routing import get_default_application, ProtocolTypeRouter
+
 from django.core.asgi import get_asgi_application
 
-import apps.market.routing
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# Initialise Django before importing consumers, which import models
+django_asgi_app = get_asgi_application()
 
+from channels.auth import AuthMiddlewareStack
+from channels.routing import ProtocolTypeRouter, URLRouter
+
+import apps.market.routing
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangoProject.settings")
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": apps.market.routing.websocket_urlpatterns,
+    "http": django_asgi_app,
+    "websocket": AuthMiddlewareStack(
+        URLRouter(apps.market.routing.websocket_urlpatterns)
+    ),
 })
@@ -0,0 +1,26 @@
+// Live stock prices pushed over the market websocket (apps/market/consumers.py).
+// subscribeToPrices(companyIds, onChange, onClose) calls onChange(companyId, price, change)
+// for every price move of the given companies; an empty list subscribes to every company.
+function subscribeToPrices(companyIds, onChange, onClose) {
+  if (!("WebSocket" in window)) {
+    if (onClose) onClose();
+    return null;
+  }
+  const scheme = window.location.protocol === "https:" ? "wss://" : "ws://";
+  const socket = new WebSocket(scheme + window.location.host + "/ws/stock-price/");
+
+  socket.onopen = function() {
+    socket.send(JSON.stringify({action: "subscribe", company_ids: companyIds}));
+  };
+  socket.onmessage = function(event) {
+    const message = JSON.parse(event.data).message;
+    if (!message || message.type !== "prices") return;
+    message.changes.forEach(function(change) {
+      onChange(change[0], change[1], change[2]);
+    });
+  };
+  socket.onclose = function() {
+    if (onClose) onClose();
+  };
+  return socket;
+}